@@ -5,6 +5,7 @@ from blueprints.scraper_bp import scraper_bp
 from blueprints.active_learning_bp import active_learning_bp
 from blueprints.utils_bp import utils_bp
 from blueprints.user_bp import user_bp
+from db import ensure_indexes
 from config import mail, SECRET_KEY, MAIL_SETTINGS, logger
 
 app = Flask(__name__)
@@ -39,4 +40,5 @@ def test_smtp_connection():
 
 if __name__ == "__main__":
     test_smtp_connection()
+    ensure_indexes()
     app.run(host="0.0.0.0", port=5050, debug=True, use_reloader=False)
@@ -1,5 +1,6 @@
 from flask import Blueprint, render_template, request, send_from_directory
 from db import collection
+from scraping1.locations import city_query
 import os
 from config import (
     DEBUG_EMAIL,
@@ -31,7 +32,9 @@ def index():
     # Query semplificata per test
     query = {}
     if city_filter:
-        query["location"] = {"$regex": city_filter, "$options": "i"}
+        # Città cercata nei token normalizzati della località (accenti, alias, parole intere):
+        # "Rome" trova anche "Roma, Italia"
+        query.update(city_query(city_filter) or {})
     if min_followers > 0:
         query["followers"] = {"$gte": min_followers}
     if keyword_filter:
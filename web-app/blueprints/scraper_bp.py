@@ -1,5 +1,7 @@
 from flask import redirect, url_for, flash, request, jsonify, Blueprint
-import threading, time, joblib, os, sys, random
+import threading, joblib, os, sys, random
+from itertools import islice
+from contextlib import closing
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import pandas as pd
 from loguru import logger
@@ -7,108 +9,209 @@ from loguru import logger
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), 'scraping1')))
 
 from db import collection
-from utils import build_user_document, extract_features
+from utils import extract_features
 from utils_github import extract_email_from_github_profile
-from blueprints.utils_bp import get_user_info_cached, get_followers_or_following, get_github_usernames_global
-from scraping1.github_api import get_candidate_users_advanced, get_user_info
-from scraping1.scoring import score_user
+from blueprints.utils_bp import get_user_info_cached, iter_followers_or_following, iter_github_usernames_global
+from scraping1.github_api import iter_candidate_users
+from scraping1.pipeline import Pipeline
+from scraping1.frontier import FrontierCrawler
+from scraping1.jobs import JobRun, create_job, find_resumable, is_running, job_status, list_jobs, request_cancel
+from scraping1.run_memo import scrape_run
+from scraping1.pagination import merge_streams
+from scraping1.scoring import scrape_stages, BoundedScorer
 from scraping1.storage import save_user
+from scraping1.seen import seen_users
 from ml_model import NUM_FEATURES, CAT_FEATURES, TEXT_FEATURE
 from config import (
-    MY_CITY, NEARBY_CITIES, KEYWORDS_BIO, KEYWORDS_README,
-    ITALIAN_LOCATIONS, N_USERS, REQUEST_DELAY, KEY_USERS, new_users_buffer, buffer_lock, scraping_in_progress
+    MY_CITY, NEARBY_CITIES, KEYWORDS_BIO,
+    ITALIAN_LOCATIONS, N_USERS, KEY_USERS, new_users_buffer, buffer_lock
 )
 
 scraper_bp = Blueprint("scraper", __name__)
 
 @scraper_bp.route("/run_scraper_async")
 def run_scraper_async():
-    global scraping_in_progress
-    if scraping_in_progress:
+    if is_running("scraper"):
         flash("Lo scraping è già in corso ⏳", "info")
         return redirect(url_for("main.index"))
 
-    # Avvia thread background
-    threading.Thread(target=_scraper_thread, daemon=True).start()
-    flash("Scraping avviato! Gli utenti appariranno gradualmente 🔄", "success")
-    return redirect(url_for("main.index"))
-
-def _scraper_thread():
-    global scraping_in_progress, new_users_buffer
-    try:
-        scraping_in_progress = True
-        logger.info(f"[SCRAPER] Avvio scraping per {N_USERS} utenti")
-
-        # --- Normalizza le keyword con virgolette per query pulite ---
+    # Un job interrotto (crash/riavvio) riprende da dove si era fermato
+    job = find_resumable("scraper")
+    if job:
+        flash("Ripresa dello scraping interrotto 🔄", "success")
+    else:
         bio_keywords = [k.strip() for k in KEYWORDS_BIO if k.strip()]
-        readme_keywords = [k.strip() for k in KEYWORDS_README if k.strip()]
-
         # --- Set unico di città: se NEARBY_CITIES vuoto cerca tutta Italia ---
         cities_to_search = [MY_CITY] + [c for c in NEARBY_CITIES if c.strip()]
-        if not cities_to_search:
-            cities_to_search = []  # vuoto significa senza filtro città
-
-        collected_users = set()
-        users_needed = N_USERS
-
-        # Ricerca per città (o senza città) e keywords
-        for loc in cities_to_search or [None]:  # None = ricerca senza location specifica
-            if users_needed <= 0:
-                break
-
-            for bio_kw in bio_keywords:
-                if users_needed <= 0:
-                    break
-                for readme_kw in readme_keywords:
-                    if users_needed <= 0:
-                        break
-
-                    query_users = get_candidate_users_advanced(
-                        target_count=users_needed,
-                        location=loc,
-                        keywords_bio=[bio_kw],
-                        keywords_readme=[readme_kw],
-                        locations=ITALIAN_LOCATIONS  # fallback locations
-                    )
-
-                    for username in query_users:
-                        if username in collected_users:
-                            continue
-                        collected_users.add(username)
-
-                        user_doc = build_user_document(username)
-                        if not user_doc:
-                            continue
-
-                        user_doc["heuristic_score"] = score_user(get_user_info(username))
-                        save_user(user_doc)
-
-                        with buffer_lock:
-                            new_users_buffer.append({
-                                "username": user_doc["username"],
-                                "bio": user_doc.get("bio", ""),
-                                "location": user_doc.get("location", ""),
-                                "followers": user_doc.get("followers", 0),
-                                "following": user_doc.get("following", 0),
-                                "email_to_notify": user_doc.get("email_extracted") or user_doc.get("email_public"),
-                                "score": user_doc.get("heuristic_score", 0)
-                            })
+        job = create_job("scraper", params={
+            "cities": cities_to_search,
+            "bio_keywords": bio_keywords,
+            "locations": [l.strip() for l in ITALIAN_LOCATIONS if l.strip()],
+        }, target=N_USERS)
+        flash("Scraping avviato! Gli utenti appariranno gradualmente 🔄", "success")
+
+    # Presa in carico qui: se un'altra richiesta l'ha già avviato non parte un secondo thread
+    run = JobRun.start(job["_id"])
+    if not run:
+        flash("Lo scraping è già in corso ⏳", "info")
+        return redirect(url_for("main.index"))
+    threading.Thread(target=_scraper_thread, args=(run,), daemon=True).start()
+    return redirect(url_for("main.index"))
 
-                        logger.info(f"[SCRAPER] Salvato {username} (score: {user_doc.get('heuristic_score')})")
-                        users_needed -= 1
-                        time.sleep(REQUEST_DELAY)
+@scraper_bp.route("/scrape_jobs")
+def scrape_jobs_list():
+    return jsonify(list_jobs(kind=request.args.get("kind"), limit=int(request.args.get("limit", 20))))
+
+@scraper_bp.route("/scrape_jobs/<job_id>")
+def scrape_job_status(job_id):
+    status = job_status(job_id)
+    if not status:
+        return jsonify({"success": False, "error": "Job non trovato"}), 404
+    return jsonify(status)
+
+@scraper_bp.route("/scrape_jobs/<job_id>/cancel", methods=["POST"])
+def scrape_job_cancel(job_id):
+    return jsonify({"success": request_cancel(job_id)})
+
+@scraper_bp.route("/scrape_jobs/<job_id>/resume", methods=["POST"])
+def scrape_job_resume(job_id):
+    status = job_status(job_id)
+    if not status:
+        return jsonify({"success": False, "error": "Job non trovato"}), 404
+    run = JobRun.start(job_id)
+    if not run:
+        # In esecuzione (heartbeat recente), concluso o annullato: niente da riprendere
+        return jsonify({"success": False, "error": f"Job non riprendibile (stato {status.get('status')})",
+                        "status": status.get("status")}), 409
+    threading.Thread(target=_scraper_thread, args=(run,), daemon=True).start()
+    return jsonify({"success": True, "job_id": str(run.id)})
+
+def _item_username(item):
+    """Username di un elemento della pipeline (login, profilo, tupla arricchita o documento)."""
+    if isinstance(item, str):
+        return item
+    if isinstance(item, tuple):
+        item = item[0]
+    return item.get("login") or item.get("username")
+
+@scrape_run("scraper")
+def _scraper_thread(run):
+    """Esegue un job di scraping già preso in carico con JobRun.start."""
+    try:
+        target = run.target
+        params = run.params
+        logger.info(f"[SCRAPER] Avvio scraping per {target} utenti (job {run.id})")
+
+        def discover():
+            """Prima gli utenti rimasti in sospeso, poi la ricerca città per città dal checkpoint."""
+            yield from run.pending()
+            first = run.get_checkpoint("discovery").get("city_index", 0)
+            cities = params["cities"] or [None]  # None = ricerca senza location specifica
+            for index in range(first, len(cities)):
+                run.checkpoint("discovery", city_index=index)
+                for username in iter_candidate_users(
+                    location=cities[index],
+                    keywords_bio=params["bio_keywords"],
+                    locations=params["locations"]  # fallback locations
+                ):
+                    # discovered() è False per gli utenti già noti al job
+                    if run.discovered(username):
+                        yield username
+            run.checkpoint("discovery", city_index=len(cities))
+
+        users_saved = run.saved
+        save_lock = threading.Lock()
+
+        def persist(user_doc):
+            nonlocal users_saved
+            with save_lock:
+                if users_saved >= target:
+                    return
+                users_saved += 1
+                if users_saved >= target:
+                    # Obiettivo raggiunto: stop a discovery e lavoro ancora in coda
+                    pipeline.stop()
+            _save_scraped_user(user_doc)
+            run.mark(user_doc["username"], "saved", stage="persistence")
+
+        def on_drop(stage, item, error):
+            run.mark(_item_username(item), "failed" if error else "skipped", stage=stage, error=error)
+
+        if users_saved >= target:
+            run.finish("completed")
+            return
+
+        # discovery -> profile -> enrichment -> scoring -> persistence, con code limitate
+        scorer = BoundedScorer("scraper")
+        pipeline = Pipeline("scraper", discover(), scrape_stages(persist, scorer=scorer), on_drop=on_drop)
+        run.attach(pipeline)
+        pipeline.run()
+        # Chiamate risparmiate dal branch-and-bound, sommate nei contatori del job
+        scorer.log_stats()
+        run.count(**scorer.counters)
+        run.finish("completed")
 
     except Exception as e:
         logger.error(f"[ERROR] Durante scraping: {e}", exc_info=True)
+        run.finish("failed", error=str(e))
     finally:
-        scraping_in_progress = False
         logger.info("[SCRAPER] Completato scraping")
 
+def _save_scraped_user(user_doc):
+    """Salva l'utente e lo accoda al buffer mostrato gradualmente nella dashboard."""
+    save_user(user_doc)
+
+    with buffer_lock:
+        new_users_buffer.append({
+            "username": user_doc["username"],
+            "bio": user_doc.get("bio", ""),
+            "location": user_doc.get("location", ""),
+            "followers": user_doc.get("followers", 0),
+            "following": user_doc.get("following", 0),
+            "email_to_notify": user_doc.get("email_extracted") or user_doc.get("email_public"),
+            "score": user_doc.get("heuristic_score", 0)
+        })
+
+    logger.info(f"[SCRAPER] Salvato {user_doc['username']} (score: {user_doc.get('heuristic_score')})")
+
+def _stream_candidates(existing):
+    """
+    Username candidati nuovi (non in existing), senza duplicati e in streaming:
+    followers/following dei KEY_USERS in parallelo, poi utenti globali se ne arrivano pochi.
+    """
+    seen = set()
+    streams = [iter_followers_or_following(ku, typ)
+               for ku in KEY_USERS if ku.strip() for typ in ["followers", "following"]]
+    for username in merge_streams(streams, max_workers=5):
+        if username in seen:
+            continue
+        seen.add(username)
+        if username not in existing:
+            yield username
+
+    if len(seen) < 100:
+        logger.info("[ML-SCRAPE] Pochi candidati, aggiungo da scraping globale.")
+        # Lazy: il cursore globale avanza solo sugli username effettivamente letti
+        with closing(iter_github_usernames_global()) as global_users:
+            for username in islice(global_users, 500):
+                if username not in seen and username not in existing:
+                    seen.add(username)
+                    yield username
+
+@scraper_bp.route("/frontier_status")
+def frontier_status():
+    return jsonify(FrontierCrawler(crawl=request.args.get("crawl", "default")).status())
+
 @scraper_bp.route("/scrape_with_ml", methods=["POST"])
+@scrape_run("ml-scrape")
 def scrape_with_ml():
+    # Modalità frontiera: username ricevuti dal crawler, da rimettere in coda se non valutati
+    crawler, yielded = None, []
     try:
         requested_limit = int(request.args.get("limit", 5))
         uncertainty_range = float(request.args.get("uncertainty_range", 0.2))  # default più ampio
+        # "graph" = followers/following diretti dei KEY_USERS, "frontier" = crawl best-first del grafo
+        mode = request.args.get("mode", "graph")
         logger.info(f"[ML-SCRAPE] Avvio scraping ML (limit={requested_limit}, uncertainty_range={uncertainty_range})")
 
         # ============================
@@ -125,35 +228,19 @@ def scrape_with_ml():
             return jsonify({"success": False, "error": str(e)}), 500
 
         # ============================
-        # Raccolta candidati
+        # Raccolta candidati (in streaming)
         # ============================
-        candidate_usernames = set()
         filtered_counts = {"public_repos": 0, "type": 0, "no_info": 0}
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            futures = [executor.submit(get_followers_or_following, ku, typ)
-                       for ku in KEY_USERS for typ in ["followers", "following"]]
-            for future in as_completed(futures):
-                try:
-                    candidate_usernames.update(future.result())
-                except Exception as exc:
-                    logger.warning(f"Errore recupero candidati: {exc}")
-
-        if len(candidate_usernames) < 100:
-            logger.info("[ML-SCRAPE] Pochi candidati, aggiungo da scraping globale.")
-            candidate_usernames.update(get_github_usernames_global(limit=500, since=0))
-
         existing = {u["username"] for u in collection.find(
             {"$or": [{"annotation": {"$exists": True}}, {"pred_prob": {"$exists": True}}]},
             {"username": 1}
         )}
-        candidate_usernames = [u for u in candidate_usernames if u not in existing]
-
-        if not candidate_usernames:
-            logger.info("[ML-SCRAPE] Nessun nuovo candidato disponibile.")
-            return jsonify({"success": False, "error": "Nessun nuovo candidato disponibile."}), 200
-
-        random.shuffle(candidate_usernames)
-        logger.info(f"[ML-SCRAPE] Totale candidati unici: {len(candidate_usernames)}")
+        if mode == "frontier":
+            crawler = FrontierCrawler()
+            crawler.seed(KEY_USERS)
+            candidate_stream = crawler.candidates(exclude=existing)
+        else:
+            candidate_stream = _stream_candidates(existing)
 
         # ============================
         # Valutazione batch con ML
@@ -164,11 +251,15 @@ def scrape_with_ml():
         max_batches = 100
         total_users_evaluated = 0
 
-        while len(found_uncertain_users) < requested_limit and candidate_usernames and batches_processed < max_batches:
-            batches_processed += 1
-            users_to_fetch = [candidate_usernames.pop(0) for _ in range(min(batch_size, len(candidate_usernames)))]
+        while len(found_uncertain_users) < requested_limit and batches_processed < max_batches:
+            # Il batch parte appena ci sono abbastanza candidati, senza attendere tutti gli elenchi
+            users_to_fetch = list(islice(candidate_stream, batch_size))
             if not users_to_fetch:
                 break
+            batches_processed += 1
+            random.shuffle(users_to_fetch)
+            if crawler:
+                yielded.extend(users_to_fetch)
 
             batch_user_docs = []
             with ThreadPoolExecutor(max_workers=10) as executor:
@@ -180,14 +271,20 @@ def scrape_with_ml():
                         if not info:
                             filtered_counts["no_info"] += 1
                             logger.debug(f"[ML-SCRAPE] Utente {username} ignorato: nessuna info.")
+                            if crawler:
+                                crawler.discard(username)
                             continue
                         if info.get("public_repos", 0) < 5:
                             filtered_counts["public_repos"] += 1
                             logger.debug(f"[ML-SCRAPE] Utente {username} ignorato: public_repos < 5")
+                            if crawler:
+                                crawler.discard(username)
                             continue
                         if info.get("type") != "User":
                             filtered_counts["type"] += 1
                             logger.debug(f"[ML-SCRAPE] Utente {username} ignorato: type != User")
+                            if crawler:
+                                crawler.discard(username)
                             continue
 
                         doc = {
@@ -199,12 +296,14 @@ def scrape_with_ml():
                             "bio": info.get("bio", ""),
                             "location": info.get("location", ""),
                             "company": info.get("company", ""),
-                            "email_to_notify": extract_email_from_github_profile(username),
+                            "email_to_notify": extract_email_from_github_profile(username, info=info),
                             "github_url": info.get("html_url", f"https://github.com/{username}")
                         }
                         batch_user_docs.append(doc)
                     except Exception as exc:
                         logger.warning(f"Errore fetch info {username}: {exc}")
+                        if crawler:
+                            crawler.discard(username)
 
             if not batch_user_docs:
                 continue
@@ -230,23 +329,37 @@ def scrape_with_ml():
                 doc["pred_prob"] = round(prob, 3)
                 doc["uncertainty_score"] = abs(prob - 0.5)
                 total_users_evaluated += 1
+                if crawler:
+                    # La probabilità del modello guida le prossime espansioni della frontiera
+                    crawler.score(doc["username"], prob)
 
                 logger.debug(f"[ML-SCRAPE] Utente {doc['username']}, prob={prob:.3f}, uncertainty_score={doc['uncertainty_score']:.3f}")
 
                 if 0.5 - uncertainty_range <= prob <= 0.5 + uncertainty_range:
                     collection.update_one({"username": doc["username"]}, {"$set": doc}, upsert=True)
+                    seen_users.add(doc["username"])
                     found_uncertain_users.append(doc)
                     if len(found_uncertain_users) >= requested_limit:
                         break
 
             logger.info(f"[ML-SCRAPE] Batch {batches_processed} → trovati {len(found_uncertain_users)} incerti (target={requested_limit})")
 
+        candidate_stream.close()
+        if batches_processed == 0:
+            logger.info("[ML-SCRAPE] Nessun nuovo candidato disponibile.")
+            return jsonify({"success": False, "error": "Nessun nuovo candidato disponibile."}), 200
+
         final_users_for_ui = found_uncertain_users[:requested_limit]
         logger.info(f"[ML-SCRAPE] Completato. Restituiti {len(final_users_for_ui)} utenti incerti. Totale utenti valutati: {total_users_evaluated}")
         logger.info(f"[ML-SCRAPE] Filtrati: {filtered_counts}")
+        if crawler:
+            logger.info(f"[ML-SCRAPE] Frontiera: {crawler.status()}")
 
         return jsonify({"success": True, "users": final_users_for_ui, "inserted": len(final_users_for_ui)}), 200
 
     except Exception as e:
         logger.exception("[ML-SCRAPE] Errore generale:")
         return jsonify({"success": False, "error": str(e)}), 500
+    finally:
+        if crawler:
+            crawler.release(yielded)
@@ -1,5 +1,7 @@
 import requests
-import time
+import threading
+from contextlib import closing
+from itertools import islice
 from io import BytesIO
 from threading import Lock
 from flask import send_file, jsonify, Blueprint
@@ -7,7 +9,25 @@ import pandas as pd
 from flask import flash, redirect, url_for
 from loguru import logger
 from db import collection
-from config import HEADERS, GITHUB_API
+from config import HEADERS, GITHUB_API, REFRESH_LIMIT
+from scraping1.transport import session
+from scraping1.pagination import iter_logins
+from scraping1.search import cache_stats as search_cache_stats
+from scraping1.following import following
+from scraping1.seen import seen_users
+from scraping1.email_resolver import resolver_stats
+from scraping1.pipeline import pipelines
+from scraping1.work_queue import queue_status
+from scraping1.jobs import JobRun, create_job, find_resumable, is_running
+from scraping1.refresh import refresh_stale_users, count_due, stats as refresh_stats
+from scraping1.rescore import rescore_all
+from scraping1.scoring import scorers
+from scraping1.locations import cache_stats as location_cache_stats
+from scraping1.cursors import claim_range, checkpoint_range, release_range, cursor_status
+from scraping1.tokens import token_pool
+from scraping1.http_cache import response_cache
+from scraping1.graphql_api import query_stats as graphql_stats
+from scraping1.run_memo import open_memos
 
 utils_bp = Blueprint("utils", __name__)
 
@@ -42,65 +62,83 @@ def export(fmt):
 # ==============================
 # Scraping globale utenti GitHub
 # ==============================
-def get_github_usernames_global(limit=100, since=0):
-    usernames = []
-    per_page = min(limit, 100)  # max consentito da GitHub
-
-    logger.info(f"[SCRAPE-GLB] Avvio scraping globale utenti GitHub, limit={limit}, since={since}")
-
-    try:
-        while len(usernames) < limit:
-            url = f"{GITHUB_API}/users?since={since}&per_page={per_page}"
-            resp = requests.get(url, headers=HEADERS, timeout=5)
-
-            if resp.status_code != 200:
-                logger.warning(f"[SCRAPE-GLB] Errore API GitHub status {resp.status_code}: {resp.text}")
-                break
+def _fetch_users_page(since, per_page=100):
+    resp = session.get(f"{GITHUB_API}/users", headers=HEADERS, params={"since": since, "per_page": per_page})
+    if resp.status_code != 200:
+        logger.warning(f"[SCRAPE-GLB] Errore API GitHub status {resp.status_code}: {resp.text}")
+        return None
+    data = resp.json()
+    if not data:
+        logger.info("[SCRAPE-GLB] Nessun utente restituito, fine paginazione")
+    return data
 
-            data = resp.json()
+def iter_github_usernames_global(since=None, worker=None):
+    """
+    Enumerazione globale (lazy) degli utenti GitHub.
+    Con since esplicito scorre da quell'ID. Senza since riprende dal cursore
+    persistente su MongoDB reclamando intervalli di ID: ogni chiamata (o worker)
+    continua da dove si è fermata la precedente, senza rivedere gli stessi utenti.
+    Il cursore avanza solo sugli username già consegnati al chiamante: quelli
+    di una pagina non ancora letti restano per la prossima chiamata.
+    """
+    logger.info(f"[SCRAPE-GLB] Avvio scraping globale utenti GitHub, since={since}")
+    if since is not None:
+        while True:
+            data = _fetch_users_page(since)
             if not data:
-                logger.info("[SCRAPE-GLB] Nessun utente restituito, fine paginazione")
-                break
-
+                return
             for user in data:
-                usernames.append(user["login"])
-                since = user["id"]  # aggiorna l'ID per il prossimo batch
-                if len(usernames) >= limit:
+                since = user["id"]
+                yield user["login"]
+
+    while True:
+        id_range = claim_range(worker=worker)
+        done = False
+        try:
+            while not done:
+                data = _fetch_users_page(id_range["next"])
+                if not data:
                     break
+                for user in data:
+                    if user["id"] >= id_range["end"]:
+                        done = True
+                        break
+                    # Consegnato = elaborato: il checkpoint lo include
+                    id_range["next"] = user["id"]
+                    yield user["login"]
+                checkpoint_range(id_range, id_range["next"])
+        finally:
+            # Anche quando il chiamante smette di leggere (close del generatore)
+            checkpoint_range(id_range, id_range["next"])
+            release_range(id_range, done=done)
+        if not done:
+            # Errore API o fine degli utenti GitHub
+            return
 
-            time.sleep(0.5)  # evita rate limit
 
+def get_github_usernames_global(limit=100, since=None, worker=None):
+    """Primi limit username dell'enumerazione globale (vedi iter_github_usernames_global)."""
+    try:
+        with closing(iter_github_usernames_global(since=since, worker=worker)) as stream:
+            usernames = list(islice(stream, limit))
     except Exception as e:
         logger.error(f"[SCRAPE-GLB] Errore generale: {e}", exc_info=True)
-
+        usernames = []
     logger.info(f"[SCRAPE-GLB] Completato, raccolti {len(usernames)} username")
     return usernames
 
 # ==============================
 # Recupero followers o following
 # ==============================
-def get_followers_or_following(username, type="followers", per_page=50):
-    users = []
-    page = 1
-    while True:
-        url = f"{GITHUB_API}/users/{username}/{type}?per_page={per_page}&page={page}"
-        try:
-            resp = requests.get(url, headers=HEADERS, timeout=5)
-            if resp.status_code != 200:
-                logger.warning(f"Failed to get {type} for {username}: {resp.status_code} - {resp.text}")
-                break
-            data = resp.json()
-            if not data:
-                break
-            users.extend([u["login"] for u in data])
-            if len(data) < per_page:
-                break
-            page += 1
-            time.sleep(0.2)  # rispetta rate limit
-        except requests.RequestException as e:
-            logger.error(f"Request error for {username} {type}: {e}")
-            break
-    return users
+def iter_followers_or_following(username, type="followers", per_page=100):
+    """Stream dei login: dopo la prima pagina le altre arrivano in parallelo (header Link)."""
+    try:
+        yield from iter_logins(f"{GITHUB_API}/users/{username}/{type}", per_page=per_page)
+    except requests.RequestException as e:
+        logger.error(f"Request error for {username} {type}: {e}")
+
+def get_followers_or_following(username, type="followers", per_page=100):
+    return list(iter_followers_or_following(username, type, per_page))
 
 # ==============================
 # Cache semplice per info utente
@@ -135,7 +173,7 @@ def get_user_info_cached(username):
     # Chiamata API GitHub
     url = f"{GITHUB_API}/users/{username}"
     try:
-        resp = requests.get(url, headers=HEADERS, timeout=5)
+        resp = session.get(url, headers=HEADERS)
         if resp.status_code == 200:
             user_data = resp.json()
             with _cache_lock:
@@ -154,10 +192,83 @@ def get_user_info_cached(username):
         return None
 
 
+# ==============================
+# Stato client GitHub (budget token, cache)
+# ==============================
+@utils_bp.route("/github_status")
+def github_status():
+    return jsonify({
+        "rate_limits": token_pool.status(),
+        "http_cache": response_cache.stats() if response_cache else None,
+        "graphql": graphql_stats,
+        "run_memo": open_memos(),
+        "global_cursor": cursor_status(),
+        "search_cache": search_cache_stats,
+        "following_snapshot": following.status(),
+        "seen_users": seen_users.status(),
+        "email_resolver": resolver_stats,
+        "pipelines": {name: p.metrics() for name, p in pipelines.items()},
+        "work_queue": queue_status(),
+        "refresh": refresh_stats(),
+        "locations": location_cache_stats(),
+        "scoring": {name: scorer.stats() for name, scorer in list(scorers.items())},
+    })
+
+
+# ==============================
+# Aggiornamento incrementale degli utenti salvati
+# ==============================
+@utils_bp.route("/refresh_users")
+def refresh_users():
+    if is_running("refresh"):
+        flash("Aggiornamento utenti già in corso ⏳", "info")
+        return redirect(url_for("main.index"))
+    job = find_resumable("refresh")
+    if not job:
+        due = count_due()
+        job = create_job("refresh", params={"limit": REFRESH_LIMIT}, target=min(due, REFRESH_LIMIT) if REFRESH_LIMIT else due)
+    run = JobRun.start(job["_id"])
+    if not run:
+        flash("Aggiornamento utenti già in corso ⏳", "info")
+        return redirect(url_for("main.index"))
+    threading.Thread(target=_job_thread, args=(run, refresh_stale_users), daemon=True).start()
+    flash(f"Aggiornamento avviato per {job['target']} utenti scaduti 🔄", "success")
+    return redirect(url_for("main.index"))
+
+
+@utils_bp.route("/rescore_users")
+def rescore_users():
+    if is_running("rescore"):
+        flash("Ricalcolo degli score già in corso ⏳", "info")
+        return redirect(url_for("main.index"))
+    job = find_resumable("rescore")
+    if not job:
+        job = create_job("rescore", params={}, target=collection.estimated_document_count())
+    run = JobRun.start(job["_id"])
+    if not run:
+        flash("Ricalcolo degli score già in corso ⏳", "info")
+        return redirect(url_for("main.index"))
+    threading.Thread(target=_job_thread, args=(run, rescore_all), daemon=True).start()
+    flash("Ricalcolo degli score avviato 🔄", "success")
+    return redirect(url_for("main.index"))
+
+
+def _job_thread(run, task):
+    """Esegue task(run=...) su un job già preso in carico (heartbeat, annullamento, contatori)."""
+    try:
+        task(run=run)
+        run.finish("completed")
+    except Exception as e:
+        logger.error(f"[JOBS] Errore nel job {run.id}: {e}", exc_info=True)
+        run.finish("failed", error=str(e))
+
+
 @utils_bp.route("/refresh_db")
 def refresh_db():
     try:
         result = collection.delete_many({})
+        # Gli utenti cancellati tornano candidati (anche per gli altri processi)
+        seen_users.rebuild()
         flash(f"Database svuotato: {result.deleted_count} utenti rimossi ✅", "success")
     except Exception as e:
         logger.error(f"[ERROR] Errore nel refresh del DB: {e}", exc_info=True)
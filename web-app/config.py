@@ -49,23 +49,127 @@ MAIL_SETTINGS = {
 DEBUG_EMAIL = os.getenv("DEBUG_EMAIL")
 DEBUG_EMAIL_MODE = os.getenv("DEBUG_EMAIL_MODE", "false")
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
+# Pool di token (separati da virgola); se assente usa il solo GITHUB_TOKEN
+GITHUB_TOKENS = [t.strip() for t in os.getenv("GITHUB_TOKENS", GITHUB_TOKEN or "").split(",") if t.strip()]
 
 MY_CITY = os.getenv("MY_CITY", "Rome")
-NEARBY_CITIES = os.getenv("NEARBY_CITIES", "").split(",")
-KEYWORDS_BIO = os.getenv("KEYWORDS_BIO", "").split(",")
-KEYWORDS_README = os.getenv("KEYWORDS_README", "").split(",")
-ITALIAN_LOCATIONS = os.getenv("ITALIAN_LOCATIONS", "").split(",")
+NEARBY_CITIES = [v.strip() for v in os.getenv("NEARBY_CITIES", "").split(",") if v.strip()]
+KEYWORDS_BIO = [v.strip() for v in os.getenv("KEYWORDS_BIO", "").split(",") if v.strip()]
+KEYWORDS_README = [v.strip() for v in os.getenv("KEYWORDS_README", "").split(",") if v.strip()]
+ITALIAN_LOCATIONS = [v.strip() for v in os.getenv("ITALIAN_LOCATIONS", "").split(",") if v.strip()]
 
 N_USERS = int(os.getenv("N_USERS", 10))
 REQUEST_DELAY = int(os.getenv("REQUEST_DELAY", 5))
 
 GITHUB_API = "https://api.github.com"
 HEADERS = {"Authorization": f"token {GITHUB_TOKEN}"}
-KEY_USERS = os.getenv("KEY_USERS", "").split(",")
+KEY_USERS = [v.strip() for v in os.getenv("KEY_USERS", "").split(",") if v.strip()]
+
+# ==============================================================
+# Concorrenza verso GitHub
+# ==============================================================
+# Pagine scaricate in parallelo per ogni elenco paginato (followers/following, ...)
+PAGINATION_WORKERS = int(os.getenv("PAGINATION_WORKERS", 4))
+# Enumerazione globale /users: ampiezza degli intervalli di ID reclamati e durata del lease (s)
+GLOBAL_RANGE_SPAN = int(os.getenv("GLOBAL_RANGE_SPAN", 10000))
+GLOBAL_RANGE_LEASE = int(os.getenv("GLOBAL_RANGE_LEASE", 600))
+# Shard della Search API (max 1000 risultati per query) eseguiti in parallelo
+SEARCH_SHARD_WORKERS = int(os.getenv("SEARCH_SHARD_WORKERS", 3))
+# Pagine di ricerca riusate da MongoDB per questo numero di secondi (0 = cache disattivata)
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", 6 * 3600))
+# Snapshot locale degli account seguiti: risincronizzazione completa ogni N secondi
+FOLLOWING_SYNC_TTL = int(os.getenv("FOLLOWING_SYNC_TTL", 3600))
+
+# Stato del rate limit: "mongo" lo condivide tra processi, "memory" resta locale
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "mongo").lower()
+# Attesa massima (secondi) per il reset del budget prima di rinunciare alla richiesta
+RATE_LIMIT_MAX_WAIT = int(os.getenv("RATE_LIMIT_MAX_WAIT", 600))
+
+# Cache su disco delle risposte GitHub (richieste condizionali ETag / 304)
+HTTP_CACHE_ENABLED = os.getenv("HTTP_CACHE_ENABLED", "true").lower() == "true"
+HTTP_CACHE_PATH = os.getenv(
+    "HTTP_CACHE_PATH", os.path.join(os.path.dirname(__file__), ".cache", "github_http.sqlite3")
+)
+HTTP_CACHE_MAX_MB = int(os.getenv("HTTP_CACHE_MAX_MB", 200))
+
+# Trasporto HTTP condiviso: connessioni nel pool (>= thread concorrenti), timeout, HTTP/2
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 32))
+HTTP_TIMEOUT = (
+    float(os.getenv("HTTP_CONNECT_TIMEOUT", 5)),
+    float(os.getenv("HTTP_READ_TIMEOUT", 15)),
+)
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "false").lower() == "true"
+
+# README: "full" scarica tutto il file, "stream" legge a chunk fino a README_MAX_BYTES
+# fermandosi quando tutte le KEYWORDS_README sono state trovate
+README_FETCH_MODE = os.getenv("README_FETCH_MODE", "full").lower()
+README_MAX_BYTES = int(os.getenv("README_MAX_BYTES", 256 * 1024))
+# Keyword di bio e README solo come parole intere ("java" non trova "javascript")
+KEYWORD_WORD_BOUNDARY = os.getenv("KEYWORD_WORD_BOUNDARY", "false").lower() == "true"
+# Soglia sullo score: gli utenti sotto SCORE_THRESHOLD non vengono salvati (entrambi i backend).
+# Con l'arricchimento REST un branch-and-bound scarta senza leggerne i README quelli che non
+# possono raggiungerla; README_TIERS = README letti in totale a ogni livello (es. 1, poi 3, poi 5)
+SCORE_THRESHOLD = float(os.getenv("SCORE_THRESHOLD")) if os.getenv("SCORE_THRESHOLD") else None
+README_TIERS = sorted(int(t) for t in os.getenv("README_TIERS", "1,3,5").split(",") if t.strip())
+
+# Backend di arricchimento utenti: "rest" (una chiamata per risorsa) o "graphql" (batch)
+ENRICH_BACKEND = os.getenv("ENRICH_BACKEND", "rest").lower()
+# Utenti per singola query GraphQL
+GRAPHQL_BATCH_SIZE = int(os.getenv("GRAPHQL_BATCH_SIZE", 25))
+
+# Pipeline di scraping: worker per stadio e dimensione delle code tra gli stadi
+PIPELINE_PROFILE_WORKERS = int(os.getenv("PIPELINE_PROFILE_WORKERS", 8))
+PIPELINE_ENRICH_WORKERS = int(os.getenv("PIPELINE_ENRICH_WORKERS", 8))
+PIPELINE_SCORING_WORKERS = int(os.getenv("PIPELINE_SCORING_WORKERS", 2))
+PIPELINE_PERSIST_WORKERS = int(os.getenv("PIPELINE_PERSIST_WORKERS", 2))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 100))
+# Memoizzazione per run di scraping: risultati GitHub tenuti al massimo per run (LRU)
+RUN_MEMO_MAX_ENTRIES = int(os.getenv("RUN_MEMO_MAX_ENTRIES", 2000))
+# Job di scraping persistenti: heartbeat del processo che li esegue e soglia oltre cui
+# un job "running" senza heartbeat è considerato interrotto (ripristinabile)
+JOB_HEARTBEAT_EVERY = int(os.getenv("JOB_HEARTBEAT_EVERY", 10))
+JOB_STALE_AFTER = int(os.getenv("JOB_STALE_AFTER", 60))
+# Coda di lavoro per i worker esterni (python -m scraping1.worker): durata del lease (s),
+# intervallo di heartbeat, username per task, tentativi massimi e attesa a coda vuota
+WORK_LEASE_SECONDS = int(os.getenv("WORK_LEASE_SECONDS", 300))
+WORK_HEARTBEAT_EVERY = int(os.getenv("WORK_HEARTBEAT_EVERY", 30))
+WORK_BATCH_SIZE = int(os.getenv("WORK_BATCH_SIZE", 25))
+WORK_MAX_ATTEMPTS = int(os.getenv("WORK_MAX_ATTEMPTS", 3))
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", 5))
+# Crawl best-first del grafo followers/following: profondità massima dai KEY_USERS,
+# richieste API per run, vicini letti per direzione e attenuazione della priorità
+FRONTIER_MAX_DEPTH = int(os.getenv("FRONTIER_MAX_DEPTH", 3))
+FRONTIER_BUDGET = int(os.getenv("FRONTIER_BUDGET", 300))
+FRONTIER_MAX_NEIGHBORS = int(os.getenv("FRONTIER_MAX_NEIGHBORS", 300))
+FRONTIER_DECAY = float(os.getenv("FRONTIER_DECAY", 0.8))
+# Durata della presa in carico di un nodo in espansione: scaduta, un altro crawler lo riprende
+FRONTIER_EXPAND_LEASE_SECONDS = int(os.getenv("FRONTIER_EXPAND_LEASE_SECONDS", 600))
+# Aggiornamento incrementale degli utenti salvati: intervallo base tra due refresh e
+# limiti minimo/massimo (giorni), worker paralleli e utenti massimi per run (0 = tutti)
+REFRESH_BASE_DAYS = float(os.getenv("REFRESH_BASE_DAYS", 30))
+REFRESH_MIN_DAYS = float(os.getenv("REFRESH_MIN_DAYS", 2))
+REFRESH_MAX_DAYS = float(os.getenv("REFRESH_MAX_DAYS", 120))
+REFRESH_WORKERS = int(os.getenv("REFRESH_WORKERS", 8))
+REFRESH_LIMIT = int(os.getenv("REFRESH_LIMIT", 0))
+# Ricalcolo dello score di tutta la collection (senza GitHub): utenti per blocco di bulk_write
+RESCORE_CHUNK = int(os.getenv("RESCORE_CHUNK", 5000))
+
+# Utenti già salvati (de-duplicazione candidati): "set" in memoria o "bloom" compatto su disco
+SEEN_BACKEND = os.getenv("SEEN_BACKEND", "set").lower()
+SEEN_BLOOM_PATH = os.getenv(
+    "SEEN_BLOOM_PATH", os.path.join(os.path.dirname(__file__), ".cache", "seen_users.bloom")
+)
+SEEN_BLOOM_CAPACITY = int(os.getenv("SEEN_BLOOM_CAPACITY", 1_000_000))
+SEEN_BLOOM_ERROR_RATE = float(os.getenv("SEEN_BLOOM_ERROR_RATE", 0.001))
+
+# Cache delle email risolte (secondi): risultati trovati e "nessuna email"
+EMAIL_CACHE_TTL = int(os.getenv("EMAIL_CACHE_TTL", 30 * 24 * 3600))
+EMAIL_NEGATIVE_TTL = int(os.getenv("EMAIL_NEGATIVE_TTL", 7 * 24 * 3600))
+# Ricerca dell'email negli eventi pubblici: costa una chiamata API core per utente
+EMAIL_EVENTS_LOOKUP = os.getenv("EMAIL_EVENTS_LOOKUP", "false").lower() == "true"
 
 # ==============================================================
 # Variabili globali condivise
 # ==============================================================
-scraping_in_progress = False
 new_users_buffer = []
 buffer_lock = Lock()
@@ -1,6 +1,151 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, IndexModel, ASCENDING, DESCENDING
+from pymongo.errors import ConnectionFailure, OperationFailure
+from loguru import logger
 import os
+from datetime import datetime, timezone
 
 client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017/"))
 db = client["GitScore-Dashboard"]
 collection = db["users"]
+
+# ==============================================================
+# Indici della collection utenti
+# ==============================================================
+# Uno per ogni forma di query frequente (filtro + ordinamento). MongoDB
+# non accetta "$exists: false" nei filtri parziali: gli utenti non
+# annotati usano l'indice normale su annotation, mentre gli indici
+# parziali coprono i lati piccoli (annotati, già valutati dal modello).
+USER_INDEXES = [
+    # save_user, save_annotation, email, refresh: upsert/lookup per username
+    IndexModel([("username", ASCENDING)], unique=True),
+    # Dashboard: ordinamento, filtro città + ordinamento, followers minimi
+    IndexModel([("score", DESCENDING)]),
+    IndexModel([("heuristic_score", DESCENDING)]),
+    IndexModel([("followers", DESCENDING)]),
+    IndexModel([("following", DESCENDING)]),
+    IndexModel([("location_tokens", ASCENDING), ("score", DESCENDING)]),
+    IndexModel([("location_tokens", ASCENDING), ("followers", DESCENDING)]),
+    IndexModel([("location_tokens", ASCENDING), ("following", DESCENDING)]),
+    # Active learning: utenti non annotati ($exists: false) e dataset di training
+    IndexModel([("annotation", ASCENDING)]),
+    # scrape_with_ml: utenti già annotati o già valutati dal modello (solo username)
+    IndexModel([("annotation", ASCENDING), ("username", ASCENDING)], name="annotated_username",
+               partialFilterExpression={"annotation": {"$exists": True}}),
+    IndexModel([("pred_prob", ASCENDING), ("username", ASCENDING)], name="predicted_username",
+               partialFilterExpression={"pred_prob": {"$exists": True}}),
+    # Refresh incrementale (scraping1.refresh)
+    IndexModel([("next_refresh_at", ASCENDING)]),
+    IndexModel([("scraped_at", ASCENDING)]),
+]
+# Indici sostituiti (filtro città ora su location_tokens): rimossi da ensure_indexes
+OBSOLETE_INDEXES = ["location_1_score_-1", "location_1_followers_-1", "location_1_following_-1"]
+
+
+def _duplicate_usernames(limit=10):
+    return [d["_id"] for d in collection.aggregate([
+        {"$group": {"_id": "$username", "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$limit": limit},
+    ], allowDiskUse=True)]
+
+
+def ensure_indexes():
+    """
+    Crea gli indici mancanti (operazione idempotente). Un errore su un indice
+    non blocca gli altri; restituisce {nome: "ok" | errore}.
+    """
+    result = {}
+    for index in USER_INDEXES:
+        name = index.document["name"]
+        try:
+            collection.create_indexes([index])
+            result[name] = "ok"
+        except ConnectionFailure as e:
+            # MongoDB non raggiungibile: inutile provare gli altri indici
+            logger.error(f"[DB] Indici non verificati, MongoDB non raggiungibile: {e}")
+            result[name] = str(e)
+            break
+        except OperationFailure as e:
+            result[name] = str(e)
+            if index.document.get("unique"):
+                logger.error(f"[DB] Indice unico {name} non creato, username duplicati: {_duplicate_usernames()}")
+            else:
+                logger.error(f"[DB] Indice {name} non creato: {e}")
+        except Exception as e:
+            result[name] = str(e)
+            logger.error(f"[DB] Indice {name} non creato: {e}")
+    for name in OBSOLETE_INDEXES:
+        try:
+            collection.drop_index(name)
+            logger.info(f"[DB] Indice obsoleto {name} rimosso")
+        except OperationFailure:
+            pass  # già assente
+        except Exception as e:
+            logger.warning(f"[DB] Indice obsoleto {name} non rimosso: {e}")
+    created = sum(1 for r in result.values() if r == "ok")
+    logger.info(f"[DB] Indici utenti verificati: {created}/{len(USER_INDEXES)}")
+    return result
+
+
+# ==============================================================
+# Report dei piani di esecuzione
+# ==============================================================
+# Le forme di query usate dalle route, con valori di esempio: explain()
+# mostra quale indice viene scelto e segnala quelle ancora in COLLSCAN.
+# Le ricerche $regex case-insensitive non possono usare un indice in modo
+# selettivo: il loro COLLSCAN è atteso (EXPECTED_COLLSCAN) e non conta
+# come regressione in "worker explain".
+QUERY_SHAPES = [
+    ("save_user / save_annotation", {"username": "octocat"}, None),
+    ("dashboard (ordinamento score)", {}, [("score", DESCENDING)]),
+    ("dashboard (ordinamento followers)", {}, [("followers", DESCENDING)]),
+    ("dashboard (filtro città)", {"location_tokens": "roma"}, [("score", DESCENDING)]),
+    ("dashboard (followers minimi)", {"followers": {"$gte": 10}}, [("followers", DESCENDING)]),
+    ("dashboard (keyword bio)", {"bio": {"$regex": "python", "$options": "i"}}, [("score", DESCENDING)]),
+    ("active learning (non annotati)", {"annotation": {"$exists": False}}, None),
+    ("training modello", {"annotation": {"$in": [0, 1]}}, None),
+    ("scrape_with_ml (già noti)",
+     {"$or": [{"annotation": {"$exists": True}}, {"pred_prob": {"$exists": True}}]}, None),
+    ("search_users", {"$or": [{"location": {"$regex": "roma", "$options": "i"}},
+                              {"username": {"$regex": "roma", "$options": "i"}}]}, None),
+    ("refresh (utenti scaduti)", {"next_refresh_at": {"$lte": datetime(2100, 1, 1, tzinfo=timezone.utc)}}, None),
+]
+EXPECTED_COLLSCAN = {"dashboard (keyword bio)", "search_users"}
+
+
+def _plan_stages(plan):
+    """Stadi del piano vincente dall'alto verso il basso, con il nome dell'indice per gli IXSCAN."""
+    stages = []
+    while plan:
+        stage = plan.get("stage")
+        if stage:
+            stages.append(f"{stage}({plan['indexName']})" if plan.get("indexName") else stage)
+        children = plan.get("inputStages") or []
+        if children:
+            for child in children:
+                stages.extend(_plan_stages(child))
+            break
+        plan = plan.get("inputStage") or plan.get("queryPlan")
+    return stages
+
+
+def explain_report(limit=20):
+    """Piano di ogni forma di query: stadi, documenti esaminati, flag COLLSCAN e se è atteso."""
+    report = []
+    for name, query, sort in QUERY_SHAPES:
+        cursor = collection.find(query).limit(limit)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = cursor.explain()
+        stages = _plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {}))
+        stats = explain.get("executionStats", {})
+        report.append({
+            "query": name,
+            "plan": " > ".join(stages),
+            "docs_examined": stats.get("totalDocsExamined"),
+            "returned": stats.get("nReturned"),
+            "collscan": any(s.startswith("COLLSCAN") for s in stages),
+            "expected": name in EXPECTED_COLLSCAN,
+        })
+    return report
+
@@ -7,6 +7,7 @@ from sklearn.preprocessing import StandardScaler, OneHotEncoder
 from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import Pipeline
 from db import collection
+from scraping1.locations import location_key
 
 # ==============================================================
 # Percorso modello
@@ -41,6 +42,8 @@ def get_dataset():
         df[col] = df[col].fillna(0)
     for col in cat_features_present:
         df[col] = df[col].apply(lambda x: ";".join(x) if isinstance(x, list) else (x or "unknown"))
+    if "location" in df.columns:
+        df["location"] = df["location"].map(location_key)
     if text_feature_present:
         df[text_feature_present] = df[text_feature_present].fillna("")
 
@@ -137,6 +140,8 @@ def predict_proba(users):
     for col in CAT_FEATURES:
         if col in df.columns:
             df[col] = df[col].apply(lambda x: ";".join(x) if isinstance(x, list) else (x or "unknown"))
+    if "location" in df.columns:
+        df["location"] = df["location"].map(location_key)
     if TEXT_FEATURE in df.columns:
         df[TEXT_FEATURE] = df[TEXT_FEATURE].fillna("")
 
@@ -0,0 +1,105 @@
+import os
+import socket
+from datetime import datetime, timezone, timedelta
+from pymongo import ASCENDING, ReturnDocument
+from loguru import logger
+from config import GLOBAL_RANGE_SPAN, GLOBAL_RANGE_LEASE
+from db import db
+
+# ==============================================================
+# Cursore persistente per l'enumerazione globale di /users
+# ==============================================================
+# Lo spazio degli ID utente GitHub è diviso in intervalli [start, end)
+# di GLOBAL_RANGE_SPAN ID. Ogni chiamata (o worker) reclama in modo
+# atomico un intervallo, lo scorre con /users?since= salvando in "next"
+# l'ultimo ID consegnato, e lo rilascia: la chiamata successiva
+# riprende esattamente da lì. /users?since=N restituisce gli ID > N,
+# quindi un intervallo nuovo parte da next = start - 1. Un intervallo rimasto "claimed" oltre il
+# lease (worker crashato) torna disponibile per gli altri.
+
+counters = db["cursors"]
+ranges = db["cursor_ranges"]
+
+_indexes_ready = False
+
+
+def _ensure_indexes():
+    global _indexes_ready
+    if not _indexes_ready:
+        ranges.create_index([("cursor", ASCENDING), ("status", ASCENDING), ("start", ASCENDING)])
+        _indexes_ready = True
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_range(cursor="global_users", worker=None, span=None):
+    """
+    Reclama il prossimo intervallo di ID da enumerare: prima quelli lasciati a
+    metà (o con lease scaduto), altrimenti ne apre uno nuovo dopo l'ultimo.
+    """
+    _ensure_indexes()
+    worker = worker or default_worker_id()
+    now = datetime.now(timezone.utc)
+    lease_until = now + timedelta(seconds=GLOBAL_RANGE_LEASE)
+
+    doc = ranges.find_one_and_update(
+        {"cursor": cursor, "$or": [
+            {"status": "pending"},
+            {"status": "claimed", "lease_until": {"$lt": now}},
+        ]},
+        {"$set": {"status": "claimed", "owner": worker, "lease_until": lease_until}},
+        sort=[("start", ASCENDING)],
+        return_document=ReturnDocument.AFTER,
+    )
+    if doc:
+        return doc
+
+    span = span or GLOBAL_RANGE_SPAN
+    counter = counters.find_one_and_update(
+        {"_id": cursor},
+        {"$inc": {"next_id": span}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    start = counter["next_id"] - span
+    doc = {
+        "cursor": cursor, "start": start, "end": start + span, "next": start - 1,
+        "status": "claimed", "owner": worker, "lease_until": lease_until,
+    }
+    doc["_id"] = ranges.insert_one(doc).inserted_id
+    return doc
+
+
+def checkpoint_range(range_doc, next_id):
+    """Salva l'ultimo ID elaborato e rinnova il lease."""
+    ranges.update_one(
+        {"_id": range_doc["_id"], "owner": range_doc["owner"]},
+        {"$set": {"next": next_id,
+                  "lease_until": datetime.now(timezone.utc) + timedelta(seconds=GLOBAL_RANGE_LEASE)}},
+    )
+    range_doc["next"] = next_id
+
+
+def release_range(range_doc, done=False):
+    """Rilascia l'intervallo: 'done' se completato, altrimenti riprendibile da 'next'."""
+    ranges.update_one(
+        {"_id": range_doc["_id"], "owner": range_doc["owner"]},
+        {"$set": {"status": "done" if done else "pending", "owner": None, "lease_until": None}},
+    )
+    if done:
+        logger.debug(f"[CURSOR] Intervallo {range_doc['start']}-{range_doc['end']} completato")
+
+
+def cursor_status(cursor="global_users"):
+    """Riepilogo: prossimo ID da aprire e intervalli per stato."""
+    counter = counters.find_one({"_id": cursor}) or {}
+    by_status = {
+        d["_id"]: d["count"]
+        for d in ranges.aggregate([
+            {"$match": {"cursor": cursor}},
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+        ])
+    }
+    return {"next_id": counter.get("next_id", 0), "ranges": by_status}
@@ -0,0 +1,185 @@
+import re
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from pymongo import ASCENDING
+from loguru import logger
+from config import HEADERS, EMAIL_CACHE_TTL, EMAIL_NEGATIVE_TTL, EMAIL_EVENTS_LOOKUP
+from db import db
+from .transport import session
+from .run_memo import memoized, skip_memo
+
+# ==============================================================
+# Risoluzione email a livelli, con cache dei risultati
+# ==============================================================
+# Le fonti vengono provate dalla più economica alla più costosa:
+#   1. campi già scaricati (email del profilo, bio, README già letti)
+#   2. email degli autori dei commit negli eventi pubblici (1 richiesta API,
+#      solo con EMAIL_EVENTS_LOOKUP=true)
+#   3. scansione mirata dell'HTML del profilo (link mailto / itemprop email)
+# Sia le email trovate sia i "nessuna email" finiscono in MongoDB con
+# scadenza (EMAIL_CACHE_TTL / EMAIL_NEGATIVE_TTL): entro il TTL un
+# utente non viene mai risolto di nuovo. Il "nessuna email" viene salvato
+# solo se tutte le fonti hanno risposto: una fonte fallita (rate limit,
+# timeout, ...) lascia l'utente da risolvere alla prossima occasione.
+
+EMAIL_RE = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}")
+NOREPLY_RE = re.compile(r"no-?reply|users\.noreply\.github\.com", re.IGNORECASE)
+MAILTO_RE = re.compile(r'href="mailto:([^"?]+)', re.IGNORECASE)
+ITEMPROP_RE = re.compile(r'itemprop="email"[^>]*?aria-label="Email:\s*([^"]+)"', re.IGNORECASE)
+
+email_cache = db["email_cache"]
+_index_ready = False
+_index_lock = threading.Lock()
+_stats_lock = threading.Lock()
+resolver_stats = {"cache_hits": 0, "fields": 0, "events": 0, "html": 0, "not_found": 0, "failed": 0}
+
+
+class SourceFailed(Exception):
+    """La fonte non ha risposto (rate limit, errore del server, timeout): esito sconosciuto."""
+
+
+def find_email(text):
+    """Prima email valida (non noreply) contenuta nel testo."""
+    if not text:
+        return None
+    for match in EMAIL_RE.finditer(text):
+        email = match.group(0).rstrip(".")
+        if not NOREPLY_RE.search(email):
+            return email
+    return None
+
+
+def _count(source):
+    with _stats_lock:
+        resolver_stats[source] += 1
+
+
+# ==============================
+# Cache MongoDB
+# ==============================
+def _ensure_index():
+    global _index_ready
+    with _index_lock:
+        if not _index_ready:
+            # Ogni documento porta la propria scadenza (TTL diversi per hit e miss)
+            email_cache.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+            _index_ready = True
+
+
+def _cache_get(username):
+    _ensure_index()
+    return email_cache.find_one({"_id": username.lower(),
+                                 "expires_at": {"$gt": datetime.now(timezone.utc)}})
+
+
+def _cache_put(username, email, source):
+    now = datetime.now(timezone.utc)
+    ttl = EMAIL_CACHE_TTL if email else EMAIL_NEGATIVE_TTL
+    email_cache.replace_one(
+        {"_id": username.lower()},
+        {"_id": username.lower(), "email": email, "source": source,
+         "resolved_at": now, "expires_at": now + timedelta(seconds=ttl)},
+        upsert=True,
+    )
+
+
+# ==============================
+# Fonti
+# ==============================
+def _from_fields(info, texts):
+    if info and info.get("email") and not NOREPLY_RE.search(info["email"]):
+        return info["email"]
+    for text in [(info or {}).get("bio"), *texts]:
+        email = find_email(text)
+        if email:
+            return email
+    return None
+
+
+def _from_events(username):
+    """Email più frequente tra gli autori dei commit pubblicati dall'utente."""
+    url = f"https://api.github.com/users/{username}/events/public"
+    try:
+        resp = session.get(url, headers=HEADERS, params={"per_page": 100})
+        if resp.status_code == 404:
+            return None
+        if resp.status_code != 200:
+            raise SourceFailed(f"eventi {username}: status {resp.status_code}")
+        emails = Counter()
+        for event in resp.json():
+            if event.get("type") != "PushEvent":
+                continue
+            for commit in event.get("payload", {}).get("commits", []):
+                email = (commit.get("author") or {}).get("email", "")
+                if email and not NOREPLY_RE.search(email):
+                    emails[email] += 1
+        return emails.most_common(1)[0][0] if emails else None
+    except SourceFailed:
+        raise
+    except Exception as e:
+        raise SourceFailed(f"eventi {username}: {e}") from e
+
+
+def _from_html(username):
+    """Scansione mirata dell'HTML del profilo, senza parser completo."""
+    try:
+        resp = session.get(f"https://github.com/{username}")
+        if resp.status_code == 404:
+            return None
+        if resp.status_code != 200:
+            raise SourceFailed(f"profilo {username}: status {resp.status_code}")
+        html = resp.text
+        for regex in (MAILTO_RE, ITEMPROP_RE):
+            match = regex.search(html)
+            if match and not NOREPLY_RE.search(match.group(1)):
+                return match.group(1).strip()
+    except SourceFailed:
+        raise
+    except Exception as e:
+        raise SourceFailed(f"profilo {username}: {e}") from e
+    return None
+
+
+@memoized("email_resolved")
+def _resolve_remote(username):
+    """(email, fonte); fonte "not_found" se tutte le fonti hanno risposto, "failed" se qualcuna è fallita."""
+    sources = [("events", _from_events)] if EMAIL_EVENTS_LOOKUP else []
+    sources.append(("html", _from_html))
+    failed = False
+    for source, fetch in sources:
+        try:
+            email = fetch(username)
+        except SourceFailed as e:
+            logger.warning(f"[EMAIL] Fonte non disponibile, {e}")
+            failed = True
+            continue
+        if email:
+            return email, source
+    if failed:
+        # Esito sconosciuto: né memorizzato per il run né salvato come "nessuna email"
+        skip_memo()
+        return None, "failed"
+    return None, "not_found"
+
+
+def resolve_email(username, info=None, texts=()):
+    """
+    Email dell'utente o None. info = profilo già scaricato (se disponibile),
+    texts = testi già in memoria (es. README) in cui cercare.
+    """
+    email = _from_fields(info, texts)
+    if email:
+        _count("fields")
+        return email
+
+    cached = _cache_get(username)
+    if cached:
+        _count("cache_hits")
+        return cached.get("email")
+
+    email, source = _resolve_remote(username)
+    _count(source)
+    if source != "failed":
+        _cache_put(username, email, source)
+    return email
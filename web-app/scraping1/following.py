@@ -0,0 +1,102 @@
+import time
+import threading
+from loguru import logger
+from config import GITHUB_TOKEN, FOLLOWING_SYNC_TTL
+from db import db
+from .tokens import token_id
+from .pagination import iter_logins
+
+# ==============================================================
+# Snapshot locale degli account seguiti
+# ==============================================================
+# L'elenco completo di /user/following (tutte le pagine) viene salvato
+# su MongoDB e tenuto in memoria come set: is_followed diventa un
+# lookup O(1) senza chiamate di rete. Lo snapshot si aggiorna dopo ogni
+# follow/unfollow fatto dall'app e viene riscaricato per intero ogni
+# FOLLOWING_SYNC_TTL secondi (follow fatti fuori dall'app).
+
+FOLLOWING_URL = "https://api.github.com/user/following"
+# Dopo una sincronizzazione fallita si riprova dopo questo numero di secondi
+SYNC_RETRY = 60
+
+
+class FollowingSnapshot:
+    def __init__(self, store=None, ttl=FOLLOWING_SYNC_TTL, owner=None):
+        self.store = store if store is not None else db["following"]
+        self.ttl = ttl
+        # Un documento per account (token anonimizzato)
+        self.owner = owner or token_id(GITHUB_TOKEN)
+        self._lock = threading.Lock()
+        self._logins = None  # login minuscolo -> login
+        self._synced_at = 0.0
+
+    def _fresh(self):
+        return self._logins is not None and time.time() - self._synced_at < self.ttl
+
+    def ensure_fresh(self):
+        """Carica lo snapshot da MongoDB o lo risincronizza da GitHub se è scaduto."""
+        if self._fresh():
+            return
+        with self._lock:
+            if self._fresh():
+                return
+            doc = self.store.find_one({"_id": self.owner})
+            if doc and time.time() - doc.get("synced_at", 0) < self.ttl:
+                self._logins = {login.lower(): login for login in doc.get("logins", [])}
+                self._synced_at = doc["synced_at"]
+                return
+            self._sync_locked()
+
+    def sync(self):
+        """Riscarica l'elenco completo degli account seguiti."""
+        with self._lock:
+            self._sync_locked()
+
+    def _sync_locked(self):
+        try:
+            logins = list(iter_logins(FOLLOWING_URL, strict=True))
+        except Exception as e:
+            logger.warning(f"[FOLLOWING] Sincronizzazione fallita, nuovo tentativo tra {SYNC_RETRY}s: {e}")
+            if self._logins is None:
+                self._logins = {}
+            self._synced_at = time.time() - self.ttl + SYNC_RETRY
+            return
+        now = time.time()
+        self.store.replace_one(
+            {"_id": self.owner}, {"_id": self.owner, "logins": logins, "synced_at": now}, upsert=True
+        )
+        self._logins = {login.lower(): login for login in logins}
+        self._synced_at = now
+        logger.info(f"[FOLLOWING] Snapshot sincronizzato: {len(logins)} account seguiti")
+
+    def contains(self, username):
+        self.ensure_fresh()
+        return username.lower() in self._logins
+
+    def logins(self):
+        self.ensure_fresh()
+        return list(self._logins.values())
+
+    def add(self, username):
+        """Da chiamare dopo un follow riuscito."""
+        with self._lock:
+            if self._logins is not None:
+                self._logins[username.lower()] = username
+        self.store.update_one({"_id": self.owner}, {"$addToSet": {"logins": username}})
+
+    def remove(self, username):
+        """Da chiamare dopo un unfollow riuscito."""
+        with self._lock:
+            if self._logins is not None:
+                self._logins.pop(username.lower(), None)
+        self.store.update_one({"_id": self.owner}, {"$pull": {"logins": username}})
+
+    def status(self):
+        return {
+            "count": len(self._logins) if self._logins is not None else None,
+            "synced_at": self._synced_at or None,
+        }
+
+
+# Snapshot unico condiviso da tutti i moduli
+following = FollowingSnapshot()
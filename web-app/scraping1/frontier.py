@@ -0,0 +1,238 @@
+import math
+import threading
+from datetime import datetime, timezone, timedelta
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from loguru import logger
+from config import (
+    GITHUB_API, FRONTIER_MAX_DEPTH, FRONTIER_BUDGET, FRONTIER_MAX_NEIGHBORS, FRONTIER_DECAY,
+    FRONTIER_EXPAND_LEASE_SECONDS
+)
+from db import db, collection
+from .pagination import iter_pages
+from .seen import seen_users
+
+# ==============================================================
+# Crawl best-first del grafo followers/following
+# ==============================================================
+# La frontiera (collection frontier, persistente e senza duplicati) parte
+# dai KEY_USERS. Ogni nodo ha una priorità: per i nodi ancora da valutare
+# è una stima economica (rilevanza del genitore * FRONTIER_DECAY, la
+# migliore tra tutti i genitori), per quelli valutati è la rilevanza vera
+# (pred_prob del modello o heuristic_score normalizzato). A ogni passo:
+#   - se il miglior nodo valutato promette più del miglior nodo in attesa,
+#     se ne espandono followers/following (spendendo budget API);
+#   - altrimenti il miglior nodo in attesa viene dato al chiamante, che lo
+#     valuta e riporta la rilevanza con score() (o discard()).
+# Così il budget va dove i candidati rilevanti sono più densi.
+#
+# Un nodo in espansione ha un lease (come i task di work_queue): se
+# l'espansione fallisce torna "scored", se il processo muore il lease
+# scade e il nodo viene ripreso da reclaim_stale().
+
+frontier = db["frontier"]
+_indexes_ready = False
+_indexes_lock = threading.Lock()
+
+PAGE_SIZE = 100
+
+
+def _ensure_indexes():
+    global _indexes_ready
+    with _indexes_lock:
+        if not _indexes_ready:
+            frontier.create_index([("crawl", ASCENDING), ("status", ASCENDING), ("priority", DESCENDING)])
+            frontier.create_index([("crawl", ASCENDING), ("status", ASCENDING), ("relevance", DESCENDING)])
+            _indexes_ready = True
+
+
+def relevance_of(doc):
+    """Rilevanza in [0, 1] di un utente già salvato: pred_prob o heuristic_score normalizzato."""
+    if not doc:
+        return None
+    if doc.get("pred_prob") is not None:
+        return float(doc["pred_prob"])
+    if doc.get("heuristic_score") is not None:
+        return 1 / (1 + math.exp(-float(doc["heuristic_score"]) / 10))
+    return None
+
+
+class FrontierCrawler:
+    def __init__(self, crawl="default", max_depth=FRONTIER_MAX_DEPTH, budget=FRONTIER_BUDGET,
+                 max_neighbors=FRONTIER_MAX_NEIGHBORS, decay=FRONTIER_DECAY):
+        _ensure_indexes()
+        self.crawl = crawl
+        self.max_depth = max_depth
+        self.budget = budget
+        self.max_neighbors = max_neighbors
+        self.decay = decay
+        self.spent = 0
+        self.expanded = 0
+        self.yielded = 0
+
+    def _id(self, username):
+        return f"{self.crawl}:{username.lower()}"
+
+    # ==============================
+    # Inserimento nodi
+    # ==============================
+    def seed(self, usernames):
+        """I KEY_USERS entrano come nodi valutati con rilevanza massima (profondità 0)."""
+        for username in (u.strip() for u in usernames):
+            if not username:
+                continue
+            frontier.update_one(
+                {"_id": self._id(username)},
+                {"$setOnInsert": {"crawl": self.crawl, "username": username, "status": "scored",
+                                  "relevance": 1.0, "priority": 1.0, "depth": 0, "parent": None,
+                                  "created_at": datetime.now(timezone.utc)}},
+                upsert=True,
+            )
+
+    def push(self, username, prior, depth, parent):
+        """
+        Aggiunge un vicino (o ne alza la priorità se già presente). Gli utenti già nel DB
+        entrano direttamente come valutati con la loro rilevanza salvata.
+        """
+        status, relevance = "queued", None
+        if username in seen_users:
+            relevance = relevance_of(collection.find_one({"username": username},
+                                                         {"pred_prob": 1, "heuristic_score": 1}))
+            status = "scored" if relevance is not None else "known"
+        frontier.update_one(
+            {"_id": self._id(username)},
+            {"$setOnInsert": {"crawl": self.crawl, "username": username, "status": status,
+                              "relevance": relevance, "parent": parent,
+                              "created_at": datetime.now(timezone.utc)},
+             "$max": {"priority": relevance if relevance is not None else prior},
+             "$min": {"depth": depth},
+             "$inc": {"inlinks": 1}},
+            upsert=True,
+        )
+
+    # ==============================
+    # Feedback del chiamante
+    # ==============================
+    def score(self, username, relevance):
+        """Rilevanza misurata di un nodo dato dal crawler (es. pred_prob del modello)."""
+        frontier.update_one(
+            {"_id": self._id(username)},
+            {"$set": {"status": "scored", "relevance": float(relevance), "priority": float(relevance),
+                      "scored_at": datetime.now(timezone.utc)}},
+        )
+
+    def discard(self, username):
+        """Nodo non valutabile (filtrato, inesistente, ...): non verrà espanso."""
+        frontier.update_one({"_id": self._id(username)}, {"$set": {"status": "discarded"}})
+
+    def release(self, usernames):
+        """Rimette in coda i nodi ricevuti ma né valutati né scartati (run terminato prima)."""
+        ids = [self._id(u) for u in usernames]
+        if ids:
+            frontier.update_many({"_id": {"$in": ids}, "status": "yielded"}, {"$set": {"status": "queued"}})
+
+    # ==============================
+    # Espansione
+    # ==============================
+    def _best(self, status, extra=None, key="priority"):
+        query = {"crawl": self.crawl, "status": status, **(extra or {})}
+        return frontier.find_one(query, sort=[(key, DESCENDING), ("inlinks", DESCENDING)])
+
+    def _neighbors(self, username):
+        max_pages = max(1, math.ceil(self.max_neighbors / PAGE_SIZE))
+        for kind in ("followers", "following"):
+            pages = iter_pages(f"{GITHUB_API}/users/{username}/{kind}", per_page=PAGE_SIZE, max_pages=max_pages)
+            try:
+                for page in pages:
+                    self.spent += 1
+                    for user in page:
+                        if user.get("type", "User") == "User":
+                            yield user["login"]
+                    if self.spent >= self.budget:
+                        return
+            finally:
+                pages.close()
+
+    def reclaim_stale(self):
+        """Rimette "scored" i nodi rimasti in espansione oltre il lease (crawler interrotto)."""
+        result = frontier.update_many(
+            {"crawl": self.crawl, "status": "expanding",
+             "$or": [{"lease_until": {"$lt": datetime.now(timezone.utc)}}, {"lease_until": {"$exists": False}}]},
+            {"$set": {"status": "scored"}, "$unset": {"lease_until": ""}},
+        )
+        if result.modified_count:
+            logger.warning(f"[FRONTIER] {result.modified_count} nodi in espansione scaduti rimessi in coda")
+        return result.modified_count
+
+    def expand(self, node):
+        """Legge followers/following del nodo e li inserisce nella frontiera."""
+        # Presa in carico atomica con lease: due crawler non espandono lo stesso nodo
+        now = datetime.now(timezone.utc)
+        node = frontier.find_one_and_update(
+            {"_id": node["_id"], "$or": [{"status": "scored"},
+                                         {"status": "expanding", "lease_until": {"$lt": now}}]},
+            {"$set": {"status": "expanding",
+                      "lease_until": now + timedelta(seconds=FRONTIER_EXPAND_LEASE_SECONDS)}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if not node:
+            return 0
+        prior = (node.get("relevance") or 0) * self.decay
+        count = 0
+        try:
+            for login in self._neighbors(node["username"]):
+                if login.lower() != node["username"].lower():
+                    self.push(login, prior, node["depth"] + 1, node["username"])
+                    count += 1
+        except Exception:
+            # Espansione non riuscita: il nodo resta espandibile (i vicini già inseriti restano)
+            frontier.update_one({"_id": node["_id"], "status": "expanding"},
+                                {"$set": {"status": "scored"}, "$unset": {"lease_until": ""}})
+            raise
+        frontier.update_one({"_id": node["_id"]},
+                            {"$set": {"status": "expanded", "neighbors": count,
+                                      "expanded_at": datetime.now(timezone.utc)},
+                             "$unset": {"lease_until": ""}})
+        self.expanded += 1
+        logger.debug(f"[FRONTIER] Espanso {node['username']} (rilevanza {node.get('relevance')}, "
+                     f"profondità {node['depth']}): {count} vicini")
+        return count
+
+    def candidates(self, exclude=()):
+        """
+        Generatore di username da valutare, in ordine best-first. Il chiamante
+        deve riportare score() o discard() per ogni username ricevuto.
+        """
+        self.reclaim_stale()
+        while True:
+            queued = self._best("queued")
+            scored = self._best("scored", {"depth": {"$lt": self.max_depth}}, key="relevance") if self.spent < self.budget else None
+            if scored and (not queued or (scored.get("relevance") or 0) * self.decay >= queued["priority"]):
+                self.expand(scored)
+                continue
+            if not queued and not scored and self.reclaim_stale():
+                continue
+            if not queued:
+                logger.info(f"[FRONTIER] Frontiera esaurita (budget speso {self.spent}/{self.budget})")
+                return
+            node = frontier.find_one_and_update(
+                {"_id": queued["_id"], "status": "queued"}, {"$set": {"status": "yielded"}},
+                return_document=ReturnDocument.AFTER,
+            )
+            if not node:
+                continue
+            if node["username"] in exclude:
+                self.discard(node["username"])
+                continue
+            self.yielded += 1
+            yield node["username"]
+
+    def status(self):
+        counts = {
+            d["_id"]: d["count"]
+            for d in frontier.aggregate([
+                {"$match": {"crawl": self.crawl}},
+                {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+            ])
+        }
+        return {"crawl": self.crawl, "nodes": counts, "spent": self.spent, "budget": self.budget,
+                "expanded": self.expanded, "yielded": self.yielded}
@@ -1,25 +1,20 @@
-import requests, base64, time, re, os
-from requests.adapters import HTTPAdapter, Retry
-from config import HEADERS, REQUEST_DELAY
-from db import collection
-
-# Session con retry/backoff
-session = requests.Session()
-retry_strategy = Retry(
-    total=5,
-    backoff_factor=1,
-    status_forcelist=[429, 500, 502, 503, 504],
-    allowed_methods=["HEAD", "GET", "OPTIONS", "PUT", "GET"]
-)
-adapter = HTTPAdapter(max_retries=retry_strategy)
-session.mount("https://", adapter)
-session.mount("http://", adapter)
+import base64, os, codecs
+from collections import namedtuple
+from config import HEADERS, README_MAX_BYTES, KEYWORD_WORD_BOUNDARY
+from .transport import session
+from .run_memo import memoized, active_memo, skip_memo
+from .following import following
+from .email_resolver import resolve_email, find_email
+from .seen import seen_users
+from .search import iter_queries_logins, plan_queries
+from .matcher import matcher_for
 
 # ---------------- User Info ----------------
+@memoized("user_info")
 def get_user_info(username):
     url = f"https://api.github.com/users/{username}"
     try:
-        resp = session.get(url, headers=HEADERS, timeout=10)
+        resp = session.get(url, headers=HEADERS)
         if resp.status_code == 200:
             return resp.json()
         else:
@@ -29,116 +24,133 @@ def get_user_info(username):
     return None
 
 def get_user_repos(username, max_repos=5):
+    memo = active_memo()
+    if memo is None:
+        return _fetch_user_repos(username, max_repos)
+    # Nello stesso run un elenco più lungo (stesso ordinamento) serve anche richieste più corte
+    return memo.get_sized(("repos", username), max_repos, lambda: _fetch_user_repos(username, max_repos))
+
+def _fetch_user_repos(username, max_repos):
     url = f"https://api.github.com/users/{username}/repos?sort=updated&per_page={max_repos}"
     repos = []
     try:
-        resp = session.get(url, headers=HEADERS, timeout=10)
+        resp = session.get(url, headers=HEADERS)
         if resp.status_code == 200:
-            for r in resp.json():
-                repos.append({
-                    "name": r["name"],
-                    "language": r["language"],
-                    "full_name": r["full_name"],
-                    "updated_at": r["updated_at"],
-                    "stars": r["stargazers_count"],
-                    "forks": r["forks_count"]
-                })
+            repos = [repo_summary(r) for r in resp.json()]
+        else:
+            skip_memo()
     except Exception as e:
+        skip_memo()
         print(f"[GitHub Repo Error] {username}: {e}")
     return repos
 
+def repo_summary(r):
+    """Campi usati dallo scoring di un repo restituito da /users/{username}/repos."""
+    return {
+        "name": r["name"],
+        "language": r["language"],
+        "full_name": r["full_name"],
+        "updated_at": r["updated_at"],
+        "pushed_at": r.get("pushed_at"),
+        "stars": r["stargazers_count"],
+        "forks": r["forks_count"]
+    }
+
+@memoized("readme")
 def get_repo_readme(full_name):
     url = f"https://api.github.com/repos/{full_name}/readme"
     try:
-        resp = session.get(url, headers=HEADERS, timeout=10)
+        resp = session.get(url, headers=HEADERS)
         if resp.status_code == 200:
             content = resp.json().get("content", "")
             return base64.b64decode(content).decode("utf-8", errors="ignore")
+        if resp.status_code != 404:
+            # Rate limit/errore del server: nessun README memorizzato, si riprova
+            skip_memo()
     except Exception as e:
+        skip_memo()
         print(f"[GitHub README Error] {full_name}: {e}")
     return ""
 
-# ---------------- Email Extraction ----------------
-def extract_email_from_text(text):
-    if not text:
-        return None
-    pattern = r"[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+"
-    matches = re.findall(pattern, text)
-    return matches[0] if matches else None
-
-def extract_email_from_github_profile(username):
-    user_info = get_user_info(username)
-    if user_info and user_info.get("email"):
-        return user_info["email"]
-
-    repos = get_user_repos(username, max_repos=3)
-    for repo in repos:
-        readme = get_repo_readme(repo["full_name"])
-        email = extract_email_from_text(readme)
-        if email:
-            return email
-
-    url = f"https://github.com/{username}"
+# Risultato di una scansione README in streaming: {keyword: occorrenze} e primi caratteri (minuscoli)
+ReadmeScan = namedtuple("ReadmeScan", ["hits", "sample"])
+
+@memoized("readme_scan")
+def scan_repo_readme(full_name, keywords, max_bytes=README_MAX_BYTES, sample_chars=2000, chunk_size=16384):
+    """
+    Legge il README in streaming (media type raw) senza scaricarlo tutto:
+    cerca le keyword chunk per chunk e si ferma appena sono state trovate
+    tutte (le occorrenze sono quindi contate fino a quel punto) o dopo
+    max_bytes. keywords deve essere una tupla (chiave di memoizzazione).
+    """
+    matcher = matcher_for(keywords, KEYWORD_WORD_BOUNDARY)
+    hits = {}
+    overlap = max((len(kw) for kw in matcher.keywords), default=1) - 1
+    sample, tail, read = "", "", 0
+
+    url = f"https://api.github.com/repos/{full_name}/readme"
+    headers = {**HEADERS, "Accept": "application/vnd.github.raw"}
     try:
-        response = requests.get(url, timeout=10)
-        if response.status_code == 200:
-            match = re.search(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}", response.text)
-            if match:
-                return match.group(0)
+        with session.get(url, headers=headers, stream=True) as resp:
+            if resp.status_code != 200:
+                if resp.status_code != 404:
+                    skip_memo()
+                return ReadmeScan(hits, "")
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+            for chunk in resp.iter_content(chunk_size=chunk_size):
+                read += len(chunk)
+                text = decoder.decode(chunk).lower()
+                if len(sample) < sample_chars:
+                    sample += text[:sample_chars - len(sample)]
+                # La coda del chunk precedente copre le keyword a cavallo tra due chunk
+                window = tail + text
+                for kw, n in matcher.counts(window, skip_before=len(tail)).items():
+                    hits[kw] = hits.get(kw, 0) + n
+                tail = window[-overlap:] if overlap else ""
+                if len(hits) == len(matcher) or read >= max_bytes:
+                    break
     except Exception as e:
-        print(f"[Profile Scrape Error] {username}: {e}")
+        skip_memo()
+        print(f"[GitHub README Error] {full_name}: {e}")
+    return ReadmeScan(hits, sample)
 
-    return None
+# ---------------- Email Extraction ----------------
+def extract_email_from_text(text):
+    return find_email(text)
+
+def extract_email_from_github_profile(username, info=None):
+    # Fonti a costo crescente con cache dei risultati (vedi email_resolver)
+    return resolve_email(username, info=info or get_user_info(username))
 
 # ---------------- Candidate Users ----------------
 def is_followed(username):
-    url = f"https://api.github.com/user/following/{username}"
-    try:
-        resp = session.get(url, headers=HEADERS, timeout=10)
-        return resp.status_code == 204
-    except Exception:
-        return False
+    # Lookup sullo snapshot locale degli account seguiti, senza chiamate di rete
+    return following.contains(username)
 
 def get_candidate_users(n_users=50, keywords=None, location="Italy", language="Python", followers_range="10..2000"):
     candidates = []
-    per_page = min(n_users, 30)
-    page = 1
 
-    keywords = [kw.strip() for kw in (keywords or []) if kw.strip()]
+    # Keyword unite in OR nel minor numero di query valide
+    queries = plan_queries(keywords, location=location, language=language)
 
-    while len(candidates) < n_users:
-        q = f"location:{location} followers:{followers_range} language:{language}"
-        if keywords:
-            q += " " + " ".join([f"{kw} in:bio" for kw in keywords])
-        url = f"https://api.github.com/search/users?q={q}&per_page={per_page}&page={page}"
-        print(f"[DEBUG] GitHub Search Query: {url}")  # per debug 422
-
-        try:
-            resp = session.get(url, headers=HEADERS, timeout=10)
-            if resp.status_code != 200:
-                print(f"[GitHub Search API] Status {resp.status_code}")
-                break
-            items = resp.json().get("items", [])
-            if not items:
+    # Gli shard oltre i 1000 risultati vengono generati solo se servono
+    logins = iter_queries_logins(queries, followers_range)
+    try:
+        for username in logins:
+            if is_followed(username):
+                continue
+            info = get_user_info(username)
+            if not info:
+                continue
+            if info.get("followers", 0) == 0 and info.get("following", 0) == 0:
+                continue
+            candidates.append(username)
+            if len(candidates) >= n_users:
                 break
-
-            for u in items:
-                username = u["login"]
-                if is_followed(username):
-                    continue
-                info = get_user_info(username)
-                if not info:
-                    continue
-                if info.get("followers", 0) == 0 and info.get("following", 0) == 0:
-                    continue
-                candidates.append(username)
-                if len(candidates) >= n_users:
-                    break
-        except Exception as e:
-            print(f"[GitHub Search API] Error: {e}")
-            break
-        page += 1
-        time.sleep(REQUEST_DELAY)
+    except Exception as e:
+        print(f"[GitHub Search API] Error: {e}")
+    finally:
+        logins.close()
 
     return candidates[:n_users]
 
@@ -154,9 +166,9 @@ def get_candidate_users_advanced(target_count, location=None, keywords_bio=None,
     seen = set()
     valid_users = []
 
-    existing_users = set(u["username"] for u in collection.find({}, {"username": 1}))
-
-    all_keywords = [kw.strip() for kw in (keywords_bio or []) + (keywords_readme or []) if kw.strip()]
+    # Solo le keyword bio vanno nella ricerca: quelle README non sono cercabili con
+    # in:bio e vengono valutate sul contenuto dei README in fase di scoring
+    bio_keywords = [kw.strip() for kw in (keywords_bio or []) if kw.strip()]
     locations = [loc.strip() for loc in (locations or []) if loc.strip()]
 
     search_locations = [location] if location else locations or [None]  # None = ricerca globale senza filtro città
@@ -167,14 +179,15 @@ def get_candidate_users_advanced(target_count, location=None, keywords_bio=None,
 
         candidate_users = get_candidate_users(
             n_users=target_count,
-            keywords=all_keywords,
+            keywords=bio_keywords,
             location=loc,
             language="Python",
             followers_range="10..2000"
         )
 
         for user in candidate_users:
-            if user in seen or user in existing_users:
+            # seen_users: utenti già salvati, caricati una volta e aggiornati a ogni salvataggio
+            if user in seen or user in seen_users:
                 continue
             seen.add(user)
             if is_followed(user):
@@ -182,6 +195,27 @@ def get_candidate_users_advanced(target_count, location=None, keywords_bio=None,
             valid_users.append(user)
             if len(valid_users) >= target_count:
                 break
-        time.sleep(REQUEST_DELAY)
 
     return valid_users[:target_count]
+
+
+def iter_candidate_users(location=None, keywords_bio=None, locations=None,
+                         language="Python", followers_range="10..2000"):
+    """
+    Versione in streaming di get_candidate_users_advanced (usata dalla pipeline):
+    restituisce gli username nuovi (non nel DB, non già seguiti) appena la ricerca
+    li trova, senza scaricarne i profili.
+    """
+    bio_keywords = [kw.strip() for kw in (keywords_bio or []) if kw.strip()]
+    locations = [loc.strip() for loc in (locations or []) if loc.strip()]
+    search_locations = [location] if location else locations or [None]
+
+    queries = [q for loc in search_locations for q in plan_queries(bio_keywords, location=loc, language=language)]
+    logins = iter_queries_logins(queries, followers_range)
+    try:
+        for username in logins:
+            if username in seen_users or is_followed(username):
+                continue
+            yield username
+    finally:
+        logins.close()
@@ -0,0 +1,73 @@
+import requests
+from urllib.parse import urlparse
+from config import HTTP_TIMEOUT
+from .rate_limit import resource_for_url
+from .tokens import token_pool, token_id
+from .http_cache import response_cache
+
+# ==============================================================
+# Session requests che passa dallo scheduler rate limit
+# ==============================================================
+MAX_RATE_LIMIT_RETRIES = 3
+
+
+def _account_token(url, headers):
+    """
+    Token del chiamante per gli endpoint dell'utente autenticato (/user, /user/...):
+    following, follow/unfollow ecc. devono restare sull'account di GITHUB_TOKEN
+    e non ruotare sul pool.
+    """
+    path = urlparse(url).path
+    if path != "/user" and not path.startswith("/user/"):
+        return None
+    for k, v in (headers or {}).items():
+        if k.lower() == "authorization" and v:
+            return v.split(" ", 1)[-1]
+    return None
+
+
+class GitHubSession(requests.Session):
+    """
+    Session drop-in per le API GitHub: prima di ogni richiesta sceglie
+    il token con più budget sul bucket giusto (attendendo se serve), dopo
+    aggiorna lo scheduler dagli header e ripete la richiesta se GitHub ha
+    risposto con un rate limit o ha rifiutato il token.
+    Gli endpoint /user usano sempre il token passato dal chiamante.
+    Le GET (non in streaming) passano dalla cache condizionale ETag.
+    Ogni richiesta senza timeout esplicito usa HTTP_TIMEOUT.
+    """
+
+    def request(self, method, url, *args, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = HTTP_TIMEOUT
+        resource = resource_for_url(url)
+        cacheable = (response_cache is not None and resource is not None
+                     and method.upper() == "GET" and not kwargs.get("stream"))
+        pinned = _account_token(url, kwargs.get("headers")) if resource is not None else None
+        caller_headers = {k: v for k, v in (kwargs.get("headers") or {}).items() if k.lower() != "authorization"}
+        # La chiave di cache usa l'URL completo, query string (params) compresa
+        cache_url = requests.Request(method, url, params=kwargs.get("params")).prepare().url if cacheable else url
+
+        for _ in range(MAX_RATE_LIMIT_RETRIES + 1):
+            token = token_pool.acquire_token(resource, pinned) if pinned else token_pool.acquire(resource)
+            cache_key, entry = None, None
+            if resource is not None:
+                # Il token scelto dal pool sostituisce quello passato dal chiamante
+                headers = dict(caller_headers)
+                if token:
+                    headers["Authorization"] = f"token {token}"
+                if cacheable:
+                    cache_key = response_cache.make_key(cache_url, token_id(token), headers.get("Accept", ""))
+                    entry = response_cache.lookup(cache_key)
+                    if entry:
+                        headers.update(response_cache.conditional_headers(entry))
+                kwargs["headers"] = headers
+            resp = super().request(method, url, *args, **kwargs)
+            if token_pool.report(token, resource, resp) and not (pinned and resp.status_code == 401):
+                continue
+            if cache_key:
+                if resp.status_code == 304 and entry:
+                    return response_cache.serve(cache_key, entry, resp)
+                response_cache.store(cache_key, resp)
+            return resp
+        return resp
@@ -0,0 +1,197 @@
+import json
+import threading
+import requests
+from loguru import logger
+from config import GRAPHQL_BATCH_SIZE
+from .transport import session
+
+# ==============================================================
+# Arricchimento utenti via GraphQL (profilo + repo + README in batch)
+# ==============================================================
+# Una sola query restituisce, per GRAPHQL_BATCH_SIZE utenti, il profilo,
+# gli N repo aggiornati più di recente e il testo dei loro README.
+# I dati vengono convertiti nello stesso formato delle chiamate REST
+# (get_user_info / get_user_repos / get_repo_readme), così il documento
+# finale è identico a quello di build_user_document.
+#
+# Un batch viene diviso a metà solo se GitHub non riesce a completarlo
+# (timeout, query troppo complessa). Rate limit, errori di autenticazione
+# o di rete non si risolvono dividendo: gli utenti del batch risultano
+# "falliti" (da riprovare), distinti da quelli inesistenti (NOT_FOUND).
+
+GRAPHQL_URL = "https://api.github.com/graphql"
+
+# Nomi di file README più comuni, provati in ordine
+README_PATHS = ["README.md", "readme.md", "README.rst", "README"]
+
+USER_FRAGMENT = """
+fragment UserFields on User {
+  login name bio location company email createdAt updatedAt url
+  followers { totalCount }
+  following { totalCount }
+  publicRepos: repositories(privacy: PUBLIC, ownerAffiliations: OWNER) { totalCount }
+  gists(privacy: PUBLIC) { totalCount }
+  topRepos: repositories(first: %(max_repos)d, privacy: PUBLIC, ownerAffiliations: OWNER,
+                         orderBy: {field: UPDATED_AT, direction: DESC}) {
+    nodes {
+      name nameWithOwner stargazerCount forkCount updatedAt pushedAt
+      primaryLanguage { name }
+      %(readmes)s
+    }
+  }
+}
+"""
+
+# Errori GraphQL che si risolvono con una query più piccola
+SPLIT_ERROR_TYPES = {"MAX_NODE_LIMIT_EXCEEDED", "RESOURCE_LIMITS_EXCEEDED", "TIMEOUT"}
+# Status HTTP con cui GitHub segnala una query non completata in tempo
+SPLIT_STATUS = (502, 504)
+
+
+class EnrichmentFailed(Exception):
+    """Arricchimento non riuscito per un utente (errore transitorio): va riprovato."""
+
+
+# Costo cumulato delle query (punti del rate limit GraphQL)
+_cost_lock = threading.Lock()
+query_stats = {"queries": 0, "cost": 0, "remaining": None, "reset_at": None}
+
+
+def build_query(logins, max_repos=5):
+    readmes = "\n      ".join(
+        f'readme{i}: object(expression: {json.dumps("HEAD:" + path)}) {{ ... on Blob {{ text }} }}'
+        for i, path in enumerate(README_PATHS)
+    )
+    users = "\n".join(
+        f"  u{i}: user(login: {json.dumps(login)}) {{ ...UserFields }}"
+        for i, login in enumerate(logins)
+    )
+    return (
+        "query {\n  rateLimit { cost remaining resetAt }\n" + users + "\n}\n"
+        + USER_FRAGMENT % {"max_repos": max_repos, "readmes": readmes}
+    )
+
+
+def _to_rest_shapes(node):
+    """Converte un nodo User GraphQL in (info, repos, readmes) nel formato REST."""
+    info = {
+        "login": node["login"],
+        "name": node.get("name"),
+        "bio": node.get("bio"),
+        "location": node.get("location"),
+        "company": node.get("company"),
+        "email": node.get("email") or None,
+        "followers": node["followers"]["totalCount"],
+        "following": node["following"]["totalCount"],
+        "public_repos": node["publicRepos"]["totalCount"],
+        "public_gists": node["gists"]["totalCount"],
+        "created_at": node.get("createdAt"),
+        "updated_at": node.get("updatedAt"),
+        "html_url": node.get("url"),
+        "type": "User",
+    }
+    repos, readmes = [], []
+    for r in node["topRepos"]["nodes"]:
+        repos.append({
+            "name": r["name"],
+            "language": (r.get("primaryLanguage") or {}).get("name"),
+            "full_name": r["nameWithOwner"],
+            "updated_at": r["updatedAt"],
+            "pushed_at": r.get("pushedAt"),
+            "stars": r["stargazerCount"],
+            "forks": r["forkCount"],
+        })
+        text = ""
+        for i in range(len(README_PATHS)):
+            blob = r.get(f"readme{i}")
+            if blob and blob.get("text"):
+                text = blob["text"]
+                break
+        readmes.append(text)
+    return info, repos, readmes
+
+
+def _record_cost(rate_limit):
+    if not rate_limit:
+        return
+    with _cost_lock:
+        query_stats["queries"] += 1
+        query_stats["cost"] += rate_limit.get("cost", 0)
+        query_stats["remaining"] = rate_limit.get("remaining")
+        query_stats["reset_at"] = rate_limit.get("resetAt")
+
+
+def _too_big(errors):
+    return any(e.get("type") in SPLIT_ERROR_TYPES or "timeout" in (e.get("message") or "").lower()
+               for e in errors)
+
+
+def _fetch_batch(logins, max_repos):
+    """
+    Esegue una query per un batch: (risultati, falliti). risultati = login ->
+    (info, repos, readmes) o None se l'utente non esiste; falliti = login senza
+    esito. Il batch viene diviso a metà solo su timeout o query troppo complessa.
+    """
+    split, reason, data, errors = False, None, None, []
+    try:
+        resp = session.post(GRAPHQL_URL, json={"query": build_query(logins, max_repos)}, timeout=30)
+        if resp.status_code == 200:
+            payload = resp.json()
+            data, errors = payload.get("data"), payload.get("errors") or []
+            if data is None:
+                split, reason = _too_big(errors), f"errori {[e.get('type') or e.get('message') for e in errors]}"
+        else:
+            split, reason = resp.status_code in SPLIT_STATUS, f"status {resp.status_code}"
+    except requests.Timeout as e:
+        split, reason = True, f"timeout ({e})"
+    except Exception as e:
+        reason = str(e)
+
+    if data is None:
+        if split and len(logins) > 1:
+            mid = len(logins) // 2
+            left, left_failed = _fetch_batch(logins[:mid], max_repos)
+            right, right_failed = _fetch_batch(logins[mid:], max_repos)
+            return {**left, **right}, left_failed + right_failed
+        logger.warning(f"[GRAPHQL] Batch di {len(logins)} utenti non riuscito: {reason}")
+        return {}, list(logins)
+
+    _record_cost(data.get("rateLimit"))
+    # Utenti inesistenti o organizzazioni restituiscono null con errore NOT_FOUND;
+    # un null senza NOT_FOUND è un errore parziale: l'utente va riprovato
+    not_found = {(e.get("path") or [None])[0] for e in errors if e.get("type") == "NOT_FOUND"}
+    results, failed = {}, []
+    for i, login in enumerate(logins):
+        node = data.get(f"u{i}")
+        if node:
+            results[login] = _to_rest_shapes(node)
+        elif f"u{i}" in not_found:
+            results[login] = None
+        else:
+            failed.append(login)
+    return results, failed
+
+
+def fetch_users_enrichment(usernames, max_repos=5, batch_size=None):
+    """
+    (risultati, falliti): risultati = username -> (info, repos, readmes) o None se
+    l'utente non esiste (formato di scoring.assemble_user_document); falliti =
+    username senza esito anche dopo un secondo tentativo.
+    """
+    batch_size = batch_size or GRAPHQL_BATCH_SIZE
+    usernames = list(dict.fromkeys(usernames))
+    results, failed = {}, []
+    for start in range(0, len(usernames), batch_size):
+        batch_results, batch_failed = _fetch_batch(usernames[start:start + batch_size], max_repos)
+        results.update(batch_results)
+        failed += batch_failed
+    if failed:
+        # Secondo tentativo per gli utenti senza esito (errori transitori)
+        retry, failed = failed, []
+        for start in range(0, len(retry), batch_size):
+            batch_results, batch_failed = _fetch_batch(retry[start:start + batch_size], max_repos)
+            results.update(batch_results)
+            failed += batch_failed
+    logger.info(f"[GRAPHQL] {len(usernames)} utenti ({len(failed)} falliti), costo totale "
+                f"{query_stats['cost']} (residuo {query_stats['remaining']})")
+    return results, failed
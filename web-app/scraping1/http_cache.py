@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import requests
+from requests.structures import CaseInsensitiveDict
+from config import HTTP_CACHE_ENABLED, HTTP_CACHE_PATH, HTTP_CACHE_MAX_MB
+
+# ==============================================================
+# Cache su disco delle risposte REST con richieste condizionali
+# ==============================================================
+# Ogni GET verso le API viene salvata (chiave = URL + token + Accept)
+# con ETag/Last-Modified. Alla richiesta successiva si invia
+# If-None-Match/If-Modified-Since: un 304 non consuma rate limit
+# primario e il body viene servito dalla cache. Eviction LRU oltre
+# la dimensione massima.
+
+# Header di rate limit: vengono dalla risposta reale, non dalla cache
+_VOLATILE_HEADERS = ("x-ratelimit-", "retry-after", "date")
+
+
+class ResponseCache:
+    def __init__(self, path, max_bytes):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                url TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                headers TEXT,
+                body BLOB,
+                size INTEGER,
+                last_access REAL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses(last_access)")
+        self._conn.commit()
+        self._size = self._total_size()
+        self._counters = {"hits": 0, "misses": 0, "not_modified": 0, "stored": 0, "evicted": 0}
+
+    @staticmethod
+    def make_key(url, token_id, accept=""):
+        return hashlib.sha256(f"{token_id}|{accept}|{url}".encode()).hexdigest()
+
+    def _total_size(self):
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    # ---------------- Lettura ----------------
+    def lookup(self, key):
+        """Entry in cache (dict) o None. Aggiorna i contatori hit/miss."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT url, etag, last_modified, headers, body FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        url, etag, last_modified, headers, body = row
+        return {"url": url, "etag": etag, "last_modified": last_modified,
+                "headers": json.loads(headers), "body": body}
+
+    @staticmethod
+    def conditional_headers(entry):
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def serve(self, key, entry, not_modified_resp):
+        """Costruisce la risposta 200 dal body in cache a fronte di un 304."""
+        self._count("not_modified")
+        with self._lock:
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+
+        resp = requests.Response()
+        resp.status_code = 200
+        resp._content = entry["body"]
+        resp.headers = CaseInsensitiveDict(entry["headers"])
+        # Gli header volatili (rate limit) vengono dalla risposta 304 appena ricevuta
+        for name, value in not_modified_resp.headers.items():
+            if name.lower().startswith(_VOLATILE_HEADERS):
+                resp.headers[name] = value
+        resp.url = entry["url"]
+        resp.request = not_modified_resp.request
+        resp.encoding = requests.utils.get_encoding_from_headers(resp.headers)
+        resp.from_cache = True
+        return resp
+
+    # ---------------- Scrittura ----------------
+    def store(self, key, resp):
+        """Salva una risposta 200 che ha un validatore (ETag o Last-Modified)."""
+        etag = resp.headers.get("ETag")
+        last_modified = resp.headers.get("Last-Modified")
+        if resp.status_code != 200 or not (etag or last_modified):
+            return
+        headers = {k: v for k, v in resp.headers.items() if not k.lower().startswith(_VOLATILE_HEADERS)}
+        body = resp.content
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, resp.url, etag, last_modified, json.dumps(headers), body, len(body), time.time()),
+            )
+            self._conn.commit()
+            self._size += len(body) - (old[0] if old else 0)
+            self._counters["stored"] += 1
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Ricalcola la dimensione reale (altri processi possono aver scritto) e poi LRU
+        self._size = self._total_size()
+        target = int(self.max_bytes * 0.9)
+        while self._size > target:
+            rows = self._conn.execute(
+                "SELECT key, size FROM responses ORDER BY last_access LIMIT 100"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._size -= size
+                self._counters["evicted"] += 1
+                if self._size <= target:
+                    break
+            self._conn.commit()
+
+    # ---------------- Statistiche ----------------
+    def stats(self):
+        """
+        Contatori del processo e occupazione della cache. hits/misses = entry
+        trovata o no (richiesta condizionale inviata o no); not_modified = risposte
+        servite davvero dalla cache dopo un 304.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            stats["size_bytes"] = self._size
+        lookups = stats["hits"] + stats["misses"]
+        stats["entry_hit_ratio"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        stats["served_from_cache_ratio"] = round(stats["not_modified"] / lookups, 3) if lookups else 0.0
+        # Ogni 304 è una richiesta che non ha consumato rate limit primario
+        stats["saved_requests"] = stats["not_modified"]
+        return stats
+
+
+# Cache unica condivisa (None se disabilitata)
+response_cache = ResponseCache(HTTP_CACHE_PATH, HTTP_CACHE_MAX_MB * 1024 * 1024) if HTTP_CACHE_ENABLED else None
@@ -0,0 +1,279 @@
+import threading
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from loguru import logger
+from config import JOB_HEARTBEAT_EVERY, JOB_STALE_AFTER
+from db import db
+from .cursors import default_worker_id
+
+# ==============================================================
+# Job di scraping persistenti e ripristinabili
+# ==============================================================
+# Ogni scraping è un documento in scrape_jobs con i parametri con cui è
+# partito, lo stato, i contatori, un checkpoint per stadio e l'heartbeat
+# del processo che lo esegue. Ogni utente scoperto diventa un documento
+# in scrape_job_items con il proprio stato (discovered -> saved/skipped/
+# failed). Se il processo muore l'heartbeat invecchia e il job può
+# essere ripreso: prima gli utenti scoperti ma non completati, poi la
+# discovery dal punto salvato nel checkpoint.
+
+jobs = db["scrape_jobs"]
+job_items = db["scrape_job_items"]
+
+_indexes_ready = False
+_indexes_lock = threading.Lock()
+
+
+def _ensure_indexes():
+    global _indexes_ready
+    with _indexes_lock:
+        if not _indexes_ready:
+            jobs.create_index([("kind", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING)])
+            job_items.create_index([("job_id", ASCENDING), ("username", ASCENDING)], unique=True)
+            job_items.create_index([("job_id", ASCENDING), ("status", ASCENDING)])
+            _indexes_ready = True
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _as_id(job_id):
+    try:
+        return job_id if isinstance(job_id, ObjectId) else ObjectId(job_id)
+    except (InvalidId, TypeError):
+        return None
+
+
+def _stale_before():
+    return _now() - timedelta(seconds=JOB_STALE_AFTER)
+
+
+def _resumable_filter(kind):
+    """Job da (ri)prendere: in coda, interrotti o 'running' senza heartbeat recente."""
+    return {"kind": kind, "$or": [
+        {"status": {"$in": ["queued", "interrupted"]}},
+        {"status": "running", "heartbeat_at": {"$lt": _stale_before()}},
+    ]}
+
+
+# ==============================
+# Gestione job
+# ==============================
+def create_job(kind, params, target):
+    _ensure_indexes()
+    now = _now()
+    doc = {
+        "kind": kind,
+        "params": params,
+        "target": target,
+        "status": "queued",
+        "created_at": now,
+        "updated_at": now,
+        "started_at": None,
+        "finished_at": None,
+        "heartbeat_at": None,
+        "owner": None,
+        "cancel_requested": False,
+        "checkpoint": {},
+        "counters": {"discovered": 0, "saved": 0, "skipped": 0, "failed": 0},
+        "stages": [],
+        "error": None,
+    }
+    doc["_id"] = jobs.insert_one(doc).inserted_id
+    return doc
+
+
+def is_running(kind):
+    """
+    True se un job di questo tipo è in esecuzione con heartbeat recente. I job
+    "queued" non contano: se il thread non è mai arrivato a JobRun.start
+    (crash/riavvio) restano da riprendere con find_resumable.
+    """
+    _ensure_indexes()
+    return jobs.count_documents({
+        "kind": kind, "status": "running", "heartbeat_at": {"$gte": _stale_before()},
+    }, limit=1) > 0
+
+
+def find_resumable(kind):
+    _ensure_indexes()
+    return jobs.find_one(_resumable_filter(kind), sort=[("created_at", DESCENDING)])
+
+
+def request_cancel(job_id):
+    """Chiede l'annullamento: il processo che esegue il job lo vede al prossimo heartbeat."""
+    job_id = _as_id(job_id)
+    now = _now()
+    # Job non in esecuzione: annullati subito
+    result = jobs.update_one(
+        {"_id": job_id, "$or": [{"status": {"$in": ["queued", "interrupted"]}},
+                                {"status": "running", "heartbeat_at": {"$lt": _stale_before()}}]},
+        {"$set": {"status": "cancelled", "cancel_requested": True, "finished_at": now, "updated_at": now}},
+    )
+    if result.modified_count:
+        return True
+    result = jobs.update_one({"_id": job_id, "status": "running"},
+                             {"$set": {"cancel_requested": True, "updated_at": now}})
+    return result.modified_count > 0
+
+
+def _serialize(job):
+    out = {k: v for k, v in job.items() if k != "_id"}
+    out["id"] = str(job["_id"])
+    for k in ("created_at", "updated_at", "started_at", "finished_at", "heartbeat_at"):
+        if out.get(k):
+            out[k] = out[k].isoformat()
+    return out
+
+
+def job_status(job_id):
+    """Stato del job con avanzamento (saved/target) e stima del tempo residuo."""
+    job = jobs.find_one({"_id": _as_id(job_id)})
+    if not job:
+        return None
+    status = _serialize(job)
+    saved, target = job["counters"].get("saved", 0), job.get("target") or 0
+    status["progress"] = round(min(saved / target, 1.0), 3) if target else None
+    status["eta_seconds"] = None
+    if job["status"] == "running" and job.get("started_at") and saved and target > saved:
+        started = job["started_at"].replace(tzinfo=job["started_at"].tzinfo or timezone.utc)
+        elapsed = (_now() - started).total_seconds()
+        status["eta_seconds"] = round(elapsed / saved * (target - saved))
+    return status
+
+
+def list_jobs(kind=None, limit=20):
+    query = {"kind": kind} if kind else {}
+    return [_serialize(j) for j in jobs.find(query, {"stages": 0}).sort("created_at", DESCENDING).limit(limit)]
+
+
+# ==============================
+# Esecuzione
+# ==============================
+class JobRun:
+    """
+    Esecuzione di un job da parte di questo processo: heartbeat, stato
+    degli utenti, checkpoint e annullamento.
+    """
+
+    def __init__(self, job, owner):
+        self.job = job
+        self.id = job["_id"]
+        self.owner = owner
+        self.params = job.get("params", {})
+        self.target = job.get("target")
+        self.cancelled = False
+        self._pipeline = None
+        self._stop = threading.Event()
+        self._heartbeat = threading.Thread(target=self._run_heartbeat, daemon=True)
+
+    @classmethod
+    def start(cls, job_id, owner=None):
+        """Prende in carico il job (se nessun altro lo sta eseguendo). None se non disponibile."""
+        _ensure_indexes()
+        owner = owner or default_worker_id()
+        now = _now()
+        job = jobs.find_one_and_update(
+            {"_id": _as_id(job_id), "$or": _resumable_filter(None)["$or"]},
+            {"$set": {"status": "running", "owner": owner, "heartbeat_at": now, "updated_at": now}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if not job:
+            return None
+        if not job.get("started_at"):
+            jobs.update_one({"_id": job["_id"]}, {"$set": {"started_at": now}})
+            job["started_at"] = now
+        run = cls(job, owner)
+        resumed = job["counters"].get("discovered", 0)
+        logger.info(f"[JOBS] Job {run.id} ({job['kind']}) avviato"
+                    + (f", ripreso con {resumed} utenti già scoperti" if resumed else ""))
+        run._heartbeat.start()
+        return run
+
+    # ---------- heartbeat e annullamento ----------
+    def attach(self, pipeline):
+        """Collega la pipeline: metriche salvate nel job, stop su annullamento."""
+        self._pipeline = pipeline
+
+    def _run_heartbeat(self):
+        while not self._stop.wait(JOB_HEARTBEAT_EVERY):
+            update = {"heartbeat_at": _now(), "updated_at": _now()}
+            if self._pipeline:
+                update["stages"] = self._pipeline.metrics()["stages"]
+            job = jobs.find_one_and_update({"_id": self.id, "owner": self.owner}, {"$set": update},
+                                           projection={"cancel_requested": 1},
+                                           return_document=ReturnDocument.AFTER)
+            if job is None:
+                # Job ripreso da un altro processo (heartbeat perso): questo si ferma
+                logger.warning(f"[JOBS] Job {self.id} non più assegnato a {self.owner}, stop")
+                self._cancel()
+                return
+            if job.get("cancel_requested"):
+                logger.info(f"[JOBS] Job {self.id} annullato")
+                self._cancel()
+                return
+
+    def _cancel(self):
+        self.cancelled = True
+        if self._pipeline:
+            self._pipeline.stop()
+
+    # ---------- stato utenti ----------
+    def discovered(self, username):
+        """Registra un utente scoperto. False se il job lo conosceva già (ripresa)."""
+        try:
+            job_items.insert_one({"job_id": self.id, "username": username, "status": "discovered",
+                                  "stage": "discovery", "updated_at": _now()})
+        except DuplicateKeyError:
+            return False
+        jobs.update_one({"_id": self.id}, {"$inc": {"counters.discovered": 1}})
+        return True
+
+    def mark(self, username, status, stage=None, error=None):
+        """Stato finale di un utente: saved, skipped (scartato da uno stadio) o failed."""
+        update = {"status": status, "updated_at": _now()}
+        if stage:
+            update["stage"] = stage
+        if error:
+            update["error"] = str(error)
+        result = job_items.update_one({"job_id": self.id, "username": username, "status": "discovered"},
+                                      {"$set": update})
+        if result.modified_count:
+            jobs.update_one({"_id": self.id}, {"$inc": {f"counters.{status}": 1}})
+
+    def count(self, **counters):
+        """Incrementa contatori liberi del job (es. esiti del refresh)."""
+        jobs.update_one({"_id": self.id}, {"$inc": {f"counters.{k}": v for k, v in counters.items()}})
+
+    def pending(self):
+        """Utenti scoperti in una esecuzione precedente ma non ancora completati."""
+        return [d["username"] for d in job_items.find({"job_id": self.id, "status": "discovered"},
+                                                      {"username": 1})]
+
+    @property
+    def saved(self):
+        job = jobs.find_one({"_id": self.id}, {"counters.saved": 1})
+        return job["counters"].get("saved", 0) if job else 0
+
+    # ---------- checkpoint ----------
+    def checkpoint(self, stage, **data):
+        jobs.update_one({"_id": self.id}, {"$set": {f"checkpoint.{stage}": data, "updated_at": _now()}})
+        self.job.setdefault("checkpoint", {})[stage] = data
+
+    def get_checkpoint(self, stage):
+        return self.job.get("checkpoint", {}).get(stage, {})
+
+    # ---------- chiusura ----------
+    def finish(self, status="completed", error=None):
+        self._stop.set()
+        if self.cancelled and status == "completed":
+            status = "cancelled"
+        update = {"status": status, "finished_at": _now(), "updated_at": _now(), "error": error}
+        if self._pipeline:
+            update["stages"] = self._pipeline.metrics()["stages"]
+        jobs.update_one({"_id": self.id, "owner": self.owner}, {"$set": update})
+        logger.info(f"[JOBS] Job {self.id} terminato: {status}")
@@ -0,0 +1,114 @@
+import re
+import unicodedata
+from collections import namedtuple
+from functools import lru_cache
+from config import NEARBY_CITIES, ITALIAN_LOCATIONS
+
+# ==============================================================
+# Classificazione delle località
+# ==============================================================
+# Le località GitHub sono testo libero ("Rome, Italy", "Roma", "MILANO 🇮🇹")
+# e migliaia di utenti condividono poche stringhe. Ogni stringa viene
+# normalizzata (accenti, maiuscole, punteggiatura, alias comuni) e
+# cercata in un indice per token costruito una volta dalle liste di
+# configurazione; il risultato è memorizzato per stringa grezza, quindi
+# ogni località distinta viene classificata una volta sola.
+# Il confronto è per parole intere: "Roma" non trova più "Romania".
+# I documenti utente salvano location_key e location_tokens (location_fields),
+# così il filtro città della dashboard interroga un campo indicizzato.
+
+# Alias comuni -> forma usata nell'indice (applicati a token singoli)
+ALIASES = {
+    "rome": "roma", "milan": "milano", "naples": "napoli", "turin": "torino",
+    "florence": "firenze", "venice": "venezia", "genoa": "genova", "padua": "padova",
+    "syracuse": "siracusa", "mantua": "mantova", "leghorn": "livorno",
+    "sicily": "sicilia", "sardinia": "sardegna", "tuscany": "toscana", "lombardy": "lombardia",
+    "piedmont": "piemonte", "apulia": "puglia", "italia": "italy", "italien": "italy", "italie": "italy",
+}
+
+# Classi in ordine di priorità
+NEARBY, ITALY, OTHER = "nearby", "italy", "other"
+
+LocationMatch = namedtuple("LocationMatch", ["location_class", "city", "key"])
+
+_SEPARATORS = re.compile(r"[\W_]+")
+
+
+@lru_cache(maxsize=65536)
+def normalize_tokens(text):
+    """Token normalizzati: senza accenti, minuscoli, senza punteggiatura, con alias risolti."""
+    if not text or not isinstance(text, str):
+        return ()
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    return tuple(ALIASES.get(tok, tok) for tok in _SEPARATORS.split(text) if tok)
+
+
+class Gazetteer:
+    """Indice primo token -> [(token della voce, classe, nome)], voci più lunghe prima."""
+
+    def __init__(self, nearby=(), italy=()):
+        self._index = {}
+        for cls, names in ((NEARBY, nearby), (ITALY, italy)):
+            for name in names:
+                tokens = normalize_tokens(name)
+                if tokens:
+                    self._index.setdefault(tokens[0], []).append((tokens, cls, " ".join(tokens)))
+        for entries in self._index.values():
+            entries.sort(key=lambda e: len(e[0]), reverse=True)
+
+    def lookup(self, tokens):
+        """Migliore voce presente nei token: prima le NEARBY, poi la prima ITALY trovata."""
+        best = None
+        for i, tok in enumerate(tokens):
+            for entry_tokens, cls, name in self._index.get(tok, ()):
+                if tokens[i:i + len(entry_tokens)] == entry_tokens:
+                    if cls == NEARBY:
+                        return cls, name
+                    best = best or (cls, name)
+        return best
+
+
+gazetteer = Gazetteer(NEARBY_CITIES, ITALIAN_LOCATIONS)
+
+
+@lru_cache(maxsize=65536)
+def classify(location):
+    """
+    LocationMatch(location_class, city, key) per una località grezza:
+    classe "nearby"/"italy"/"other", voce trovata (o None) e chiave
+    normalizzata (la voce trovata, altrimenti il testo normalizzato;
+    "unknown" se vuota) usata come feature del modello.
+    """
+    tokens = normalize_tokens(location)
+    found = gazetteer.lookup(tokens)
+    if found:
+        return LocationMatch(found[0], found[1], found[1])
+    return LocationMatch(OTHER, None, " ".join(tokens) or "unknown")
+
+
+def location_class(location):
+    return classify(location if isinstance(location, str) else "").location_class
+
+
+def location_key(location):
+    return classify(location if isinstance(location, str) else "").key
+
+
+def location_fields(location):
+    """Campi località salvati sul documento utente: chiave normalizzata e token (per il filtro città)."""
+    location = location if isinstance(location, str) else ""
+    return {"location_key": classify(location).key, "location_tokens": list(normalize_tokens(location))}
+
+
+def city_query(city):
+    """Filtro MongoDB sui location_tokens per una città (parole intere, alias risolti); None se vuota."""
+    tokens = normalize_tokens(city)
+    if not tokens:
+        return None
+    return {"location_tokens": tokens[0] if len(tokens) == 1 else {"$all": list(tokens)}}
+
+
+def cache_stats():
+    info = classify.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize}
@@ -0,0 +1,107 @@
+import re
+from functools import lru_cache
+from config import KEYWORDS_BIO, KEYWORDS_README, KEYWORD_WORD_BOUNDARY
+
+# ==============================================================
+# Ricerca di più keyword in una sola passata
+# ==============================================================
+# Le keyword vengono compilate una volta in un'unica regex a trie
+# (es. "py(?:thon|torch)"): a ogni posizione del testo il motore prova
+# il prefisso comune una volta sola e restituisce la keyword più lunga
+# che inizia lì. Le keyword più corte che ne sono prefisso vengono
+# contate dalla tabella _prefixes, così il risultato è identico a
+# "kw in testo" per ogni keyword, ma il testo viene letto una volta.
+# Con word_boundary=True una keyword conta solo se non è attaccata ad
+# altre lettere/cifre ("java" non trova "javascript").
+
+_WORD = re.compile(r"\w")
+
+
+def _trie_pattern(words):
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node):
+        alts = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        # Quantificatore greedy: prima la keyword più lunga, poi quella che finisce qui
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """
+    Matcher compilato per un elenco di keyword (case-insensitive).
+    Le keyword vuote o duplicate vengono ignorate.
+    """
+
+    def __init__(self, keywords, word_boundary=False):
+        self.word_boundary = word_boundary
+        names = {}
+        for kw in keywords:
+            kw = kw.strip()
+            if kw and kw.lower() not in names:
+                names[kw.lower()] = kw
+        self._names = names
+        self.keywords = list(names.values())
+        self._prefixes = {w: [p for p in names if w.startswith(p)] for w in names}
+        self._regex = None
+        if names:
+            trie = _trie_pattern(names)
+            self._regex = re.compile(rf"(?<!\w)(?=({trie})(?!\w))" if word_boundary else f"(?=({trie}))")
+
+    def __len__(self):
+        return len(self.keywords)
+
+    def _ends_ok(self, text, end):
+        return not self.word_boundary or end == len(text) or not _WORD.match(text, end)
+
+    def counts(self, text, skip_before=0):
+        """
+        {keyword: occorrenze} delle keyword presenti nel testo. Con skip_before
+        si ignorano le occorrenze che finiscono entro i primi skip_before caratteri
+        (già contate nel blocco precedente durante una lettura a chunk).
+        """
+        found = {}
+        if not text or self._regex is None:
+            return found
+        text = text.lower()
+        for m in self._regex.finditer(text):
+            start = m.start()
+            for word in self._prefixes[m.group(1)]:
+                end = start + len(word)
+                if end > skip_before and self._ends_ok(text, end):
+                    name = self._names[word]
+                    found[name] = found.get(name, 0) + 1
+        return found
+
+    def count(self, text):
+        """Numero di keyword distinte presenti (come sum(1 for kw in ... if kw in testo))."""
+        return len(self.counts(text))
+
+    def any(self, text):
+        if not text or self._regex is None:
+            return False
+        return self._regex.search(text.lower()) is not None
+
+    def pairs(self, counts):
+        """Vettore di hit [[keyword, n], ...] nell'ordine delle keyword, salvabile in MongoDB."""
+        return [[kw, counts[kw]] for kw in self.keywords if counts.get(kw)]
+
+
+@lru_cache(maxsize=32)
+def matcher_for(keywords, word_boundary=False):
+    """Matcher compilato una volta per tupla di keyword."""
+    return KeywordMatcher(keywords, word_boundary=word_boundary)
+
+
+# Matcher dalle liste di configurazione (località: vedi scraping1.locations)
+bio_matcher = KeywordMatcher(KEYWORDS_BIO, word_boundary=KEYWORD_WORD_BOUNDARY)
+readme_matcher = KeywordMatcher(KEYWORDS_README, word_boundary=KEYWORD_WORD_BOUNDARY)
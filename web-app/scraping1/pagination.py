@@ -0,0 +1,130 @@
+import re
+import queue
+import threading
+from urllib.parse import urlparse, parse_qs
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from loguru import logger
+from config import HEADERS, PAGINATION_WORKERS
+from .transport import session
+
+# ==============================================================
+# Paginazione parallela guidata dall'header Link
+# ==============================================================
+# La prima pagina (per_page=100) dice, tramite Link rel="last", quante
+# pagine ci sono: le restanti vengono scaricate in parallelo (sempre
+# dentro il budget dello scheduler rate limit) e consegnate appena
+# arrivano, così il chiamante può iniziare a lavorare subito.
+
+LINK_LAST_RE = re.compile(r'<([^>]+)>;\s*rel="last"')
+
+
+def last_page(resp):
+    """Numero dell'ultima pagina dall'header Link (None se c'è una sola pagina)."""
+    match = LINK_LAST_RE.search(resp.headers.get("Link", ""))
+    if not match:
+        return None
+    page = parse_qs(urlparse(match.group(1)).query).get("page")
+    return int(page[0]) if page else None
+
+
+def _get_page(url, params, page, strict=False):
+    resp = session.get(url, headers=HEADERS, params={**params, "page": page})
+    if strict:
+        resp.raise_for_status()
+    if resp.status_code != 200:
+        logger.warning(f"[PAGINATION] {url} pagina {page}: status {resp.status_code}")
+        return []
+    return resp.json()
+
+
+def iter_pages(url, params=None, per_page=100, max_pages=None, max_workers=None, strict=False):
+    """
+    Genera le pagine (liste JSON) di un endpoint paginato. La prima pagina
+    arriva per prima, le altre nell'ordine in cui vengono completate.
+    Se il chiamante smette di iterare le pagine non ancora partite vengono annullate.
+    Con strict=True una pagina in errore solleva un'eccezione invece di essere saltata.
+    """
+    params = {**(params or {}), "per_page": per_page}
+    resp = session.get(url, headers=HEADERS, params={**params, "page": 1})
+    if strict:
+        resp.raise_for_status()
+    if resp.status_code != 200:
+        logger.warning(f"[PAGINATION] {url}: status {resp.status_code} - {resp.text[:200]}")
+        return
+    yield resp.json()
+
+    last = last_page(resp)
+    if not last:
+        return
+    if max_pages:
+        last = min(last, max_pages)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers or PAGINATION_WORKERS)
+    try:
+        futures = [executor.submit(_get_page, url, params, page, strict) for page in range(2, last + 1)]
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                if strict:
+                    raise
+                logger.error(f"[PAGINATION] Errore pagina di {url}: {e}")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_logins(url, params=None, **kwargs):
+    """Login degli utenti di un endpoint paginato (followers, following, ...), in streaming."""
+    for page in iter_pages(url, params, **kwargs):
+        for user in page:
+            yield user["login"]
+
+
+def merge_streams(generators, max_workers=5):
+    """
+    Consuma più generatori in parallelo e ne restituisce gli elementi appena
+    disponibili, con al massimo max_workers generatori attivi insieme.
+    """
+    generators = list(generators)
+    out = queue.Queue(maxsize=1000)
+    stop = threading.Event()
+    done = object()
+    slots = threading.Semaphore(max_workers)
+
+    def put(item):
+        # put con timeout: se il consumatore ha smesso il thread non resta bloccato
+        while not stop.is_set():
+            try:
+                out.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def pump(gen):
+        with slots:
+            try:
+                if stop.is_set():
+                    return
+                for item in gen:
+                    if not put(item):
+                        break
+            except Exception as e:
+                logger.error(f"[PAGINATION] Errore stream: {e}")
+            finally:
+                gen.close()
+                put(done)
+
+    threads = [threading.Thread(target=pump, args=(g,), daemon=True) for g in generators]
+    for t in threads:
+        t.start()
+    try:
+        remaining = len(threads)
+        while remaining:
+            item = out.get()
+            if item is done:
+                remaining -= 1
+                continue
+            yield item
+    finally:
+        stop.set()
@@ -0,0 +1,250 @@
+import time
+import queue
+import threading
+from loguru import logger
+from .run_memo import carry_context
+
+# ==============================================================
+# Pipeline a stadi con code limitate
+# ==============================================================
+# Una sorgente (discovery) alimenta una catena di stadi; tra uno stadio
+# e il successivo c'è una coda di dimensione fissa, quindi uno stadio
+# lento rallenta quelli a monte (backpressure) senza accumulare lavoro
+# in memoria. Ogni stadio ha il proprio numero di worker e, se serve,
+# elabora gli elementi a batch (es. GraphQL). Le metriche (throughput,
+# profondità della coda, tempo di lavoro) sono leggibili in ogni momento.
+
+_DONE = object()
+
+# Attesa massima per completare un batch parziale (secondi)
+BATCH_WAIT = 0.5
+# Intervallo tra due log di metriche (secondi)
+METRICS_EVERY = 30
+
+
+class Stage:
+    """
+    Stadio della pipeline. func(item) restituisce l'elemento per lo stadio
+    successivo, oppure None per scartarlo. Con batch_size > 1 func riceve
+    una lista e restituisce una lista (None = scartato) della stessa lunghezza;
+    un'eccezione nella lista segna come fallito solo quell'elemento.
+    """
+
+    def __init__(self, name, func, workers=1, queue_size=100, batch_size=1):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.inbox = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._active = 0
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.started_at = None
+
+    def _record(self, processed=0, dropped=0, errors=0, busy=0.0):
+        with self._lock:
+            self.processed += processed
+            self.dropped += dropped
+            self.errors += errors
+            self.busy_seconds += busy
+
+    def metrics(self):
+        elapsed = time.time() - self.started_at if self.started_at else 0
+        return {
+            "stage": self.name,
+            "workers": self.workers,
+            "queue_depth": self.inbox.qsize(),
+            "queue_size": self.inbox.maxsize,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "throughput": round(self.processed / elapsed, 2) if elapsed else 0.0,
+            # Frazione del tempo in cui i worker sono stati occupati (1.0 = collo di bottiglia)
+            "utilization": round(self.busy_seconds / (elapsed * self.workers), 2) if elapsed else 0.0,
+        }
+
+
+class Pipeline:
+    def __init__(self, name, source, stages, on_drop=None):
+        self.name = name
+        self.source = source
+        self.stages = stages
+        # on_drop(stage, item, error) per gli elementi scartati o falliti in uno stadio
+        self.on_drop = on_drop
+        self.discovered = 0
+        self._stop = threading.Event()
+        self._threads = []
+        self.started_at = None
+
+    # ==============================
+    # Code
+    # ==============================
+    def _put(self, q, item):
+        # put con timeout: dopo stop() nessun thread resta bloccato su una coda piena
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _close(self, index):
+        """Segnala la fine del flusso ai worker dello stadio index."""
+        if index < len(self.stages):
+            stage = self.stages[index]
+            for _ in range(stage.workers):
+                # Le sentinelle passano anche dopo stop(): i worker devono poter uscire
+                stage.inbox.put(_DONE)
+
+    def _forward(self, index, item):
+        if index < len(self.stages):
+            self._put(self.stages[index].inbox, item)
+
+    # ==============================
+    # Thread
+    # ==============================
+    def _run_source(self):
+        try:
+            for item in self.source:
+                if self._stop.is_set():
+                    break
+                self.discovered += 1
+                if not self._put(self.stages[0].inbox, item):
+                    break
+        except Exception as e:
+            logger.error(f"[PIPELINE] {self.name}: errore nella discovery: {e}", exc_info=True)
+        finally:
+            close = getattr(self.source, "close", None)
+            if close:
+                close()
+            self._close(0)
+
+    def _take_batch(self, stage):
+        """Fino a batch_size elementi; (batch, fine_flusso)."""
+        first = stage.inbox.get()
+        if first is _DONE:
+            return [], True
+        batch = [first]
+        deadline = time.time() + BATCH_WAIT
+        while len(batch) < stage.batch_size:
+            try:
+                item = stage.inbox.get(timeout=max(0.0, deadline - time.time()))
+            except queue.Empty:
+                break
+            if item is _DONE:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run_worker(self, index):
+        stage = self.stages[index]
+        try:
+            while True:
+                batch, finished = self._take_batch(stage)
+                if batch and not self._stop.is_set():
+                    self._process(index, stage, batch)
+                if finished:
+                    break
+        finally:
+            with stage._lock:
+                stage._active -= 1
+                last = stage._active == 0
+            if last:
+                self._close(index + 1)
+
+    def _process(self, index, stage, batch):
+        start = time.time()
+        try:
+            if stage.batch_size > 1:
+                results = stage.func(batch)
+            else:
+                results = [stage.func(batch[0])]
+        except Exception as e:
+            logger.error(f"[PIPELINE] {self.name}/{stage.name}: {e}", exc_info=True)
+            stage._record(errors=len(batch), busy=time.time() - start)
+            self._dropped(stage, batch, e)
+            return
+        kept = [r for r in results if r is not None and not isinstance(r, Exception)]
+        failed = [(item, r) for item, r in zip(batch, results) if isinstance(r, Exception)]
+        stage._record(processed=len(batch) - len(failed), dropped=len(batch) - len(kept) - len(failed),
+                      errors=len(failed), busy=time.time() - start)
+        self._dropped(stage, [item for item, r in zip(batch, results) if r is None])
+        for item, error in failed:
+            self._dropped(stage, [item], error)
+        for result in kept:
+            self._forward(index + 1, result)
+
+    def _dropped(self, stage, items, error=None):
+        if not self.on_drop:
+            return
+        for item in items:
+            try:
+                self.on_drop(stage.name, item, error)
+            except Exception as e:
+                logger.warning(f"[PIPELINE] {self.name}: on_drop fallito: {e}")
+
+    def _run_monitor(self):
+        while not self._stop.wait(METRICS_EVERY):
+            self.log_metrics()
+
+    # ==============================
+    # API
+    # ==============================
+    def start(self):
+        self.started_at = time.time()
+        pipelines[self.name] = self
+        for index, stage in enumerate(self.stages):
+            stage.started_at = self.started_at
+            stage._active = stage.workers
+            for n in range(stage.workers):
+                # carry_context: i worker usano la memo del run che ha avviato la pipeline
+                self._threads.append(threading.Thread(
+                    target=carry_context(self._run_worker), args=(index,), name=f"{self.name}-{stage.name}-{n}", daemon=True
+                ))
+        self._threads.append(threading.Thread(target=carry_context(self._run_source), name=f"{self.name}-discovery", daemon=True))
+        for t in self._threads:
+            t.start()
+        threading.Thread(target=self._run_monitor, daemon=True).start()
+        return self
+
+    def stop(self):
+        """Ferma la discovery e scarta il lavoro ancora in coda."""
+        self._stop.set()
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+    def join(self):
+        for t in self._threads:
+            t.join()
+        self._stop.set()
+        self.log_metrics()
+
+    def run(self):
+        self.start()
+        self.join()
+
+    def metrics(self):
+        return {
+            "name": self.name,
+            "running": any(t.is_alive() for t in self._threads),
+            "discovered": self.discovered,
+            "elapsed": round(time.time() - self.started_at, 1) if self.started_at else 0,
+            "stages": [stage.metrics() for stage in self.stages],
+        }
+
+    def log_metrics(self):
+        parts = [
+            f"{m['stage']}: {m['processed']} ({m['throughput']}/s, coda {m['queue_depth']}/{m['queue_size']})"
+            for m in (stage.metrics() for stage in self.stages)
+        ]
+        logger.info(f"[PIPELINE] {self.name} - discovery {self.discovered} | " + " | ".join(parts))
+
+
+# Ultima pipeline avviata per nome (per lo stato nella dashboard)
+pipelines = {}
@@ -0,0 +1,237 @@
+import time
+import threading
+from loguru import logger
+from config import RATE_LIMIT_BACKEND, RATE_LIMIT_MAX_WAIT
+
+# ==============================================================
+# Scheduler rate limit guidato dagli header di GitHub
+# ==============================================================
+# Ogni risorsa GitHub (core, search, graphql) ha il suo bucket: i
+# "token" disponibili sono X-RateLimit-Remaining e si ricaricano a
+# X-RateLimit-Reset. Retry-After e i 403 da secondary rate limit
+# bloccano il bucket fino alla scadenza indicata da GitHub.
+
+SECONDARY_LIMIT_WAIT = 60  # GitHub consiglia almeno un minuto se manca Retry-After
+
+
+class RateLimitExceeded(Exception):
+    """Il budget non torna disponibile entro il tempo massimo di attesa."""
+
+
+def resource_for_url(url):
+    """Risorsa rate limit di un URL, None per URL fuori dalle API GitHub."""
+    if "api.github.com" not in url:
+        return None
+    if "/search/" in url:
+        return "search"
+    if url.rstrip("/").endswith("/graphql"):
+        return "graphql"
+    return "core"
+
+
+def wait_time(state, now):
+    """Secondi da attendere per un bucket (0 = richiesta consentita)."""
+    if not state:
+        return 0
+    blocked_until = state.get("blocked_until") or 0
+    if blocked_until > now:
+        return blocked_until - now
+    remaining = state.get("remaining")
+    reset_at = state.get("reset_at") or 0
+    if remaining is not None and remaining <= 0 and reset_at > now:
+        return reset_at - now + 1
+    return 0
+
+
+# ==============================
+# Stato in memoria (thread del processo)
+# ==============================
+class MemoryStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def reserve(self, key, now):
+        with self._lock:
+            state = self._buckets.get(key)
+            wait = wait_time(state, now)
+            if wait <= 0 and state and state.get("remaining") is not None:
+                state["remaining"] -= 1
+            return wait
+
+    def update(self, key, remaining=None, reset_at=None, blocked_until=None):
+        with self._lock:
+            state = self._buckets.setdefault(key, {"remaining": None, "reset_at": 0, "blocked_until": 0})
+            if remaining is not None:
+                # Nuova finestra: vale l'header. Stessa finestra: vince il valore più basso
+                # (le risposte concorrenti possono arrivare fuori ordine)
+                if (reset_at or 0) > state["reset_at"] or state["remaining"] is None:
+                    state["remaining"] = remaining
+                else:
+                    state["remaining"] = min(state["remaining"], remaining)
+            if reset_at:
+                state["reset_at"] = max(state["reset_at"], reset_at)
+            if blocked_until:
+                state["blocked_until"] = max(state["blocked_until"], blocked_until)
+
+    def get_many(self, keys):
+        with self._lock:
+            return {k: dict(self._buckets[k]) for k in keys if k in self._buckets}
+
+    def snapshot(self):
+        with self._lock:
+            return {k: dict(v) for k, v in self._buckets.items()}
+
+
+# ==============================
+# Stato condiviso su MongoDB (processi e macchine diverse)
+# ==============================
+class MongoStore:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def reserve(self, key, now):
+        # Decremento atomico solo se il budget è noto e il bucket non è bloccato né esaurito
+        state = self.collection.find_one_and_update(
+            {
+                "_id": key,
+                "blocked_until": {"$lte": now},
+                "remaining": {"$type": "number"},
+                "$or": [
+                    {"remaining": {"$gt": 0}},
+                    {"reset_at": {"$lte": now}},
+                ],
+            },
+            {"$inc": {"remaining": -1}},
+        )
+        if state is not None:
+            return 0
+        # Bucket assente o budget ancora ignoto (nessun header letto): nulla da decrementare
+        return wait_time(self.collection.find_one({"_id": key}), now)
+
+    def update(self, key, remaining=None, reset_at=None, blocked_until=None):
+        if remaining is not None:
+            # Nuova finestra: sovrascrive
+            result = self.collection.update_one(
+                {"_id": key, "$or": [{"reset_at": {"$lt": reset_at or 0}}, {"remaining": None}]},
+                {"$set": {"remaining": remaining, "reset_at": reset_at or 0}},
+            )
+            if result.matched_count == 0:
+                # Stessa finestra (o bucket nuovo): vince il valore più basso
+                self.collection.update_one(
+                    {"_id": key},
+                    {"$min": {"remaining": remaining}, "$max": {"reset_at": reset_at or 0},
+                     "$setOnInsert": {"blocked_until": 0}},
+                    upsert=True,
+                )
+        if blocked_until:
+            self.collection.update_one(
+                {"_id": key},
+                {"$max": {"blocked_until": blocked_until}, "$setOnInsert": {"reset_at": 0}},
+                upsert=True,
+            )
+
+    def get_many(self, keys):
+        return {d["_id"]: d for d in self.collection.find({"_id": {"$in": list(keys)}})}
+
+    def snapshot(self):
+        return {d["_id"]: {k: v for k, v in d.items() if k != "_id"} for d in self.collection.find({})}
+
+
+# ==============================
+# Scheduler
+# ==============================
+class RateLimiter:
+    def __init__(self, store=None, max_wait=RATE_LIMIT_MAX_WAIT):
+        self.store = store or MemoryStore()
+        self.max_wait = max_wait
+        self._secondary_strikes = {}
+
+    @staticmethod
+    def _key(resource, key):
+        return f"{key}:{resource}"
+
+    def acquire(self, resource="core", key="default"):
+        """Blocca finché il bucket ha budget. Solleva RateLimitExceeded oltre max_wait."""
+        if resource is None:
+            return
+        bucket = self._key(resource, key)
+        waited = 0
+        while True:
+            wait = self.store.reserve(bucket, time.time())
+            if wait <= 0:
+                return
+            if waited + wait > self.max_wait:
+                raise RateLimitExceeded(f"{bucket}: budget disponibile tra {int(wait)}s")
+            logger.info(f"[RATE-LIMIT] {bucket} esaurito, attendo {wait:.1f}s")
+            time.sleep(wait)
+            waited += wait
+
+    def try_acquire(self, resource="core", key="default"):
+        """Come acquire ma senza attendere: True se la richiesta è stata riservata."""
+        if resource is None:
+            return True
+        return self.store.reserve(self._key(resource, key), time.time()) <= 0
+
+    def peek(self, resource, keys):
+        """Stato dei bucket di una risorsa per più chiavi: dict chiave -> stato (o None)."""
+        states = self.store.get_many([self._key(resource, k) for k in keys])
+        return {k: states.get(self._key(resource, k)) for k in keys}
+
+    def block(self, resource, key, until):
+        """Toglie dalla rotazione un bucket fino a 'until' (epoch)."""
+        self.store.update(self._key(resource, key), blocked_until=until)
+
+    def update(self, resource, response, key="default"):
+        """
+        Aggiorna il bucket dagli header della risposta.
+        Restituisce True se la risposta è un rate limit (la richiesta va ripetuta).
+        """
+        if resource is None:
+            return False
+        headers = response.headers
+        resource = headers.get("X-RateLimit-Resource", resource)
+        bucket = self._key(resource, key)
+        now = time.time()
+
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset_at = headers.get("X-RateLimit-Reset")
+        self.store.update(
+            bucket,
+            remaining=int(remaining) if remaining is not None else None,
+            reset_at=int(reset_at) if reset_at is not None else None,
+        )
+
+        if response.status_code not in (403, 429):
+            self._secondary_strikes.pop(bucket, None)
+            return False
+
+        retry_after = headers.get("Retry-After")
+        if retry_after is not None:
+            self.store.update(bucket, blocked_until=now + int(retry_after))
+            return True
+        if remaining == "0":
+            # Limite primario: il bucket resta esaurito fino al reset
+            return True
+        if "secondary rate limit" in response.text.lower():
+            # Backoff esponenziale sui secondary limit senza Retry-After
+            strikes = self._secondary_strikes.get(bucket, 0) + 1
+            self._secondary_strikes[bucket] = strikes
+            self.store.update(bucket, blocked_until=now + SECONDARY_LIMIT_WAIT * 2 ** (strikes - 1))
+            return True
+        return False
+
+    def status(self):
+        """Stato corrente dei bucket (per debug/monitoraggio)."""
+        return self.store.snapshot()
+
+
+def _build_limiter():
+    if RATE_LIMIT_BACKEND == "mongo":
+        from db import db
+        return RateLimiter(MongoStore(db["rate_limits"]))
+    return RateLimiter()
+
+
+# Istanza unica condivisa da tutti i moduli che parlano con GitHub
+limiter = _build_limiter()
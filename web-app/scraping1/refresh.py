@@ -0,0 +1,248 @@
+import threading
+from datetime import datetime, timedelta, timezone
+from pymongo import ASCENDING
+from loguru import logger
+from config import (
+    HEADERS, GITHUB_API, REFRESH_BASE_DAYS, REFRESH_MIN_DAYS, REFRESH_MAX_DAYS, REFRESH_WORKERS, REFRESH_LIMIT
+)
+from db import collection, ensure_indexes
+from .transport import session
+from .github_api import repo_summary, get_user_info, get_user_repos
+from .scoring import assemble_user_document, fetch_readmes, profile_fields, repo_fields, score_signals, user_signals
+from .frontier import relevance_of
+from .pipeline import Pipeline, Stage
+
+# ==============================================================
+# Aggiornamento incrementale degli utenti salvati
+# ==============================================================
+# Ogni utente ha un next_refresh_at calcolato da un intervallo adattivo:
+# più breve per gli utenti rilevanti (pred_prob / heuristic_score) e per
+# quelli attivi di recente, più lungo per chi non cambia da più refresh.
+# Gli utenti senza next_refresh_at (salvati dallo scraping) scadono
+# REFRESH_BASE_DAYS dopo scraped_at.
+#
+# Il refresh di un utente fa due richieste condizionali (If-None-Match):
+# profilo e repo. Un 304 non consuma rate limit. I README vengono riletti
+# solo se è cambiato l'updated_at del profilo o il pushed_at dei repo;
+# altrimenti si aggiornano solo i contatori (followers, stelle, ...).
+
+# Nuovo tentativo per gli utenti il cui refresh è fallito
+RETRY_AFTER = timedelta(hours=1)
+# Utenti letti da MongoDB per volta
+DUE_BATCH = 200
+
+DUE_PROJECTION = {
+    "username": 1, "updated_at": 1, "repos_pushed_at": 1, "profile_etag": 1, "repos_etag": 1,
+    "pred_prob": 1, "heuristic_score": 1, "last_commit_days": 1, "readme_keywords_hit": 1,
+    "n_repos_checked": 1, "refresh_unchanged": 1,
+}
+
+_indexes_ready = False
+_indexes_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+refresh_stats = {"users": 0, "unchanged": 0, "light": 0, "full": 0, "missing": 0, "errors": 0,
+                 "requests": 0, "not_modified": 0, "full_cost": 0}
+
+
+def _ensure_indexes():
+    global _indexes_ready
+    with _indexes_lock:
+        if not _indexes_ready:
+            # next_refresh_at / scraped_at sono in db.USER_INDEXES
+            ensure_indexes()
+            _indexes_ready = True
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _count(**counts):
+    with _stats_lock:
+        for k, v in counts.items():
+            refresh_stats[k] += v
+
+
+def stats():
+    """Contatori del refresh, con la quota di richieste risparmiate rispetto a un nuovo scraping."""
+    with _stats_lock:
+        out = dict(refresh_stats)
+    out["saved_ratio"] = round(1 - out["requests"] / out["full_cost"], 3) if out["full_cost"] else None
+    return out
+
+
+# ==============================
+# Scadenze
+# ==============================
+def refresh_interval(doc, unchanged=0):
+    """Intervallo fino al prossimo refresh, tra REFRESH_MIN_DAYS e REFRESH_MAX_DAYS."""
+    days = REFRESH_BASE_DAYS
+    relevance = relevance_of(doc)
+    if relevance is not None:
+        days *= 1.25 - relevance  # da 0.25x (più rilevanti) a 1.25x
+    active = doc.get("last_commit_days")
+    if active is None:
+        days *= 2
+    elif active <= 7:
+        days *= 0.35
+    elif active <= 30:
+        days *= 0.6
+    elif active > 365:
+        days *= 2
+    # Utenti che non cambiano da più refresh consecutivi: si torna sempre più di rado
+    days *= 1.5 ** min(unchanged, 4)
+    return timedelta(days=min(max(days, REFRESH_MIN_DAYS), REFRESH_MAX_DAYS))
+
+
+def _due_filter(now):
+    return {"$or": [
+        {"next_refresh_at": {"$lte": now}},
+        {"next_refresh_at": None, "scraped_at": {"$lte": now - timedelta(days=REFRESH_BASE_DAYS)}},
+        {"next_refresh_at": None, "scraped_at": None},
+    ]}
+
+
+def count_due():
+    _ensure_indexes()
+    return collection.count_documents(_due_filter(_now()))
+
+
+def due_users(limit=None):
+    """
+    Documenti da aggiornare, a blocchi di DUE_BATCH in ordine di _id: un
+    utente già aggiornato (o in coda) non viene restituito due volte.
+    """
+    _ensure_indexes()
+    now, last_id, returned = _now(), None, 0
+    while not limit or returned < limit:
+        query = _due_filter(now)
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        size = min(DUE_BATCH, limit - returned) if limit else DUE_BATCH
+        batch = list(collection.find(query, DUE_PROJECTION).sort("_id", ASCENDING).limit(size))
+        if not batch:
+            return
+        for doc in batch:
+            yield doc
+        returned += len(batch)
+        last_id = batch[-1]["_id"]
+
+
+# ==============================
+# Refresh di un utente
+# ==============================
+def _conditional_get(url, etag):
+    headers = dict(HEADERS)
+    if etag:
+        headers["If-None-Match"] = etag
+    resp = session.get(url, headers=headers)
+    # 304 diretto o servito dalla cache ETag della session: nessun cambiamento
+    unchanged = resp.status_code == 304 or getattr(resp, "from_cache", False)
+    _count(requests=1, not_modified=int(unchanged))
+    return resp, unchanged
+
+
+def refresh_user(doc, max_repos=5):
+    """
+    Aggiorna un utente salvato. Restituisce l'esito:
+    "unchanged", "light" (solo profilo/contatori), "full" (README riletti), "missing" o "error".
+    """
+    username = doc["username"]
+    now = _now()
+    # Costo di uno scraping da zero: profilo + elenco repo + un README per repo
+    _count(users=1, full_cost=2 + (doc.get("n_repos_checked") or max_repos))
+
+    profile, profile_unchanged = _conditional_get(f"{GITHUB_API}/users/{username}", doc.get("profile_etag"))
+    if profile.status_code == 404:
+        _count(missing=1)
+        collection.update_one({"_id": doc["_id"]}, {"$set": {
+            "refresh_status": "missing", "scraped_at": now,
+            "next_refresh_at": now + timedelta(days=REFRESH_MAX_DAYS),
+        }})
+        return "missing"
+    if profile.status_code not in (200, 304):
+        _count(errors=1)
+        collection.update_one({"_id": doc["_id"]}, {"$set": {
+            "refresh_status": f"http_{profile.status_code}", "next_refresh_at": now + RETRY_AFTER,
+        }})
+        return "error"
+
+    repos_resp, repos_unchanged = _conditional_get(
+        f"{GITHUB_API}/users/{username}/repos?sort=updated&per_page={max_repos}", doc.get("repos_etag")
+    )
+    info = profile.json() if profile.status_code == 200 else None
+    repos = [repo_summary(r) for r in repos_resp.json()] if repos_resp.status_code == 200 else None
+
+    update = {"refresh_status": "ok", "scraped_at": now}
+    if info is not None and profile.headers.get("ETag"):
+        update["profile_etag"] = profile.headers["ETag"]
+    if repos is not None and repos_resp.headers.get("ETag"):
+        update["repos_etag"] = repos_resp.headers["ETag"]
+
+    # Documenti salvati prima di repos_pushed_at: il primo refresh è completo
+    profile_updated = info is not None and info.get("updated_at") != doc.get("updated_at")
+    pushed = repo_fields(repos)["repos_pushed_at"] if repos is not None else doc.get("repos_pushed_at")
+    repos_pushed = repos is not None and (pushed != doc.get("repos_pushed_at") or "repos_pushed_at" not in doc)
+
+    if profile_updated or repos_pushed:
+        outcome = "full"
+        if info is None:
+            _count(requests=1)
+            info = get_user_info(username)
+        if repos is None:
+            _count(requests=1)
+            repos = get_user_repos(username, max_repos=max_repos)
+        if not info:
+            _count(errors=1)
+            collection.update_one({"_id": doc["_id"]}, {"$set": {"next_refresh_at": now + RETRY_AFTER}})
+            return "error"
+        _count(requests=len(repos))
+        update.update(assemble_user_document(info, repos, fetch_readmes(repos)))
+    elif profile_unchanged and repos_unchanged:
+        outcome = "unchanged"
+    else:
+        # Cambiati solo i contatori (followers, stelle, ...): README e email restano validi
+        outcome = "light"
+        if info is not None:
+            update.update(profile_fields(info))
+            signals = user_signals(info, doc.get("readme_keywords_hit") or 0)
+            update["location_class"] = signals["location_class"]
+            update["heuristic_score"] = score_signals(signals)
+        if repos is not None:
+            update.update(repo_fields(repos))
+
+    unchanged = (doc.get("refresh_unchanged") or 0) + 1 if outcome == "unchanged" else 0
+    update["refresh_unchanged"] = unchanged
+    update["next_refresh_at"] = now + refresh_interval({**doc, **update}, unchanged)
+    collection.update_one({"_id": doc["_id"]}, {"$set": update})
+    _count(**{outcome: 1})
+    return outcome
+
+
+# ==============================
+# Job di refresh
+# ==============================
+def refresh_stale_users(limit=None, workers=REFRESH_WORKERS, run=None):
+    """
+    Aggiorna gli utenti scaduti con `workers` thread in parallelo.
+    run (JobRun, opzionale) riceve i contatori e può annullare il refresh.
+    """
+    limit = limit if limit is not None else REFRESH_LIMIT
+    logger.info(f"[REFRESH] Utenti da aggiornare: {count_due()}" + (f" (max {limit})" if limit else ""))
+
+    def refresh(doc):
+        outcome = refresh_user(doc)
+        if run:
+            # "saved" = utenti elaborati, per avanzamento e ETA del job
+            run.count(saved=1, **{outcome: 1})
+        return outcome
+
+    pipeline = Pipeline("refresh", due_users(limit),
+                        [Stage("refresh", refresh, workers=workers, queue_size=workers * 4)])
+    if run:
+        run.attach(pipeline)
+    pipeline.run()
+    result = stats()
+    logger.info(f"[REFRESH] Completato: {result}")
+    return result
@@ -0,0 +1,98 @@
+import time
+from itertools import islice
+from pymongo import UpdateOne
+from loguru import logger
+from config import RESCORE_CHUNK
+from db import collection
+from .matcher import bio_matcher, readme_matcher
+from .locations import location_class, location_fields
+from .scoring import score_users
+
+# ==============================================================
+# Ricalcolo dello score di tutta la collection
+# ==============================================================
+# Legge gli utenti a blocchi di RESCORE_CHUNK, ricava i segnali dai
+# campi salvati con la configurazione attuale (località e bio dal testo,
+# README da readme_keyword_repos filtrato sulle KEYWORDS_README attuali),
+# calcola gli score con score_users e scrive con bulk_write solo i
+# documenti cambiati. Nessuna chiamata a GitHub: le keyword README nuove
+# richiedono invece di rileggere i README (refresh degli utenti).
+# Aggiorna anche location_key/location_tokens (filtro città della dashboard)
+# per i documenti salvati prima che esistessero.
+
+PROJECTION = {
+    "location": 1, "bio": 1, "followers": 1, "following": 1,
+    "readme_keywords_hit": 1, "readme_keyword_repos": 1,
+    "heuristic_score": 1, "location_class": 1, "bio_keywords_hit": 1, "bio_keyword_counts": 1,
+    "location_key": 1, "location_tokens": 1,
+}
+
+
+def _readme_hits(doc, current):
+    # Documenti salvati prima di readme_keyword_repos: si tiene il totale salvato
+    if "readme_keyword_repos" not in doc:
+        return doc.get("readme_keywords_hit") or 0
+    return sum(n for kw, n in doc["readme_keyword_repos"] if kw.lower() in current)
+
+
+def _chunks(cursor, size):
+    while True:
+        chunk = list(islice(cursor, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def rescore_chunk(docs):
+    """Operazioni UpdateOne per i documenti del blocco il cui score (o segnale) è cambiato."""
+    current = {kw.lower() for kw in readme_matcher.keywords}
+    fields = []
+    for doc in docs:
+        bio_counts = bio_matcher.counts(doc.get("bio"))
+        fields.append({
+            "location_class": location_class(doc.get("location")),
+            "bio_keywords_hit": len(bio_counts),
+            "bio_keyword_counts": bio_matcher.pairs(bio_counts),
+            "readme_keywords_hit": _readme_hits(doc, current),
+            **location_fields(doc.get("location")),
+        })
+    scores = score_users({
+        "location_class": [f["location_class"] for f in fields],
+        "bio_hits": [f["bio_keywords_hit"] for f in fields],
+        "bio_empty": [not doc.get("bio") for doc in docs],
+        "followers": [doc.get("followers") or 0 for doc in docs],
+        "following": [doc.get("following") or 0 for doc in docs],
+        "readme_hits": [f["readme_keywords_hit"] for f in fields],
+    })
+    ops = []
+    for doc, update, score in zip(docs, fields, scores.tolist()):
+        update["heuristic_score"] = score
+        if any(doc.get(k) != v for k, v in update.items()):
+            ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": update}))
+    return ops
+
+
+def rescore_all(chunk_size=None, run=None):
+    """
+    Ricalcola lo score di tutti gli utenti. run (JobRun, opzionale) riceve
+    l'avanzamento e può annullare il ricalcolo tra un blocco e l'altro.
+    """
+    chunk_size = chunk_size or RESCORE_CHUNK
+    started = time.time()
+    users = updated = 0
+    cursor = collection.find({}, PROJECTION, batch_size=chunk_size)
+    try:
+        for docs in _chunks(cursor, chunk_size):
+            if run and run.cancelled:
+                break
+            ops = rescore_chunk(docs)
+            if ops:
+                updated += collection.bulk_write(ops, ordered=False).modified_count
+            users += len(docs)
+            if run:
+                run.count(saved=len(docs), updated=len(ops))
+    finally:
+        cursor.close()
+    result = {"users": users, "updated": updated, "seconds": round(time.time() - started, 2)}
+    logger.info(f"[RESCORE] Completato: {result}")
+    return result
@@ -0,0 +1,188 @@
+import threading
+import functools
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import Future
+from loguru import logger
+from config import RUN_MEMO_MAX_ENTRIES
+
+# ==============================================================
+# Memoizzazione per singola esecuzione di scraping
+# ==============================================================
+# Durante uno scrape ogni risorsa GitHub (profilo, repo, README, ...)
+# viene richiesta al massimo una volta: le chiamate successive leggono
+# il risultato memorizzato e le chiamate concorrenti per la stessa
+# risorsa aspettano la richiesta già in volo (single-flight).
+#
+# La memo appartiene al run che l'ha aperta: è visibile solo nel suo
+# contesto (e nei thread che lo copiano, vedi carry_context), quindi
+# altri job dello stesso processo (es. il refresh) chiamano sempre
+# GitHub. I None e gli errori transitori (skip_memo) non vengono
+# memorizzati e la memo tiene al massimo RUN_MEMO_MAX_ENTRIES risultati
+# (i meno usati di recente escono per primi).
+
+_current = contextvars.ContextVar("run_memo", default=None)
+_local = threading.local()
+
+
+def skip_memo():
+    """Il risultato in calcolo non va memorizzato (es. 403/timeout): la prossima chiamata riprova."""
+    _local.skip = True
+
+
+class RunMemo:
+    def __init__(self, name="scrape", max_entries=RUN_MEMO_MAX_ENTRIES):
+        self.name = name
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._results = OrderedDict()
+        self._inflight = {}
+        self.stats = {"calls": 0, "fetched": 0, "saved": 0, "coalesced": 0, "not_cached": 0, "evicted": 0}
+
+    def _lookup_locked(self, key):
+        if key in self._results:
+            self._results.move_to_end(key)
+            return True, self._results[key]
+        return False, None
+
+    def _store_locked(self, key, value):
+        self._results[key] = value
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+            self.stats["evicted"] += 1
+
+    def _get(self, key, fetch):
+        with self._lock:
+            self.stats["calls"] += 1
+            found, value = self._lookup_locked(key)
+            if found:
+                self.stats["saved"] += 1
+                return value, True
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.stats["saved"] += 1
+                self.stats["coalesced"] += 1
+
+        if not owner:
+            return future.result(), False
+
+        previous = getattr(_local, "skip", False)
+        _local.skip = False
+        try:
+            value = fetch()
+            cacheable = value is not None and not _local.skip
+        except Exception as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+        finally:
+            _local.skip = previous
+        with self._lock:
+            self.stats["fetched"] += 1
+            if cacheable:
+                self._store_locked(key, value)
+            else:
+                self.stats["not_cached"] += 1
+            del self._inflight[key]
+        future.set_result(value)
+        return value, cacheable
+
+    def get(self, key, fetch):
+        """Risultato di fetch() per key, calcolato al massimo una volta per run (se memorizzabile)."""
+        return self._get(key, fetch)[0]
+
+    def get_sized(self, key, size, fetch):
+        """
+        Come get, per liste ordinate di lunghezza variabile (es. repo per_page=N):
+        un risultato già scaricato con size maggiore serve anche le richieste più piccole.
+        """
+        with self._lock:
+            found, best = self._lookup_locked(("sized", key))
+            if found and best[0] >= size:
+                self.stats["calls"] += 1
+                self.stats["saved"] += 1
+                return best[1][:size]
+        value, cached = self._get((key, size), fetch)
+        if cached:
+            with self._lock:
+                found, best = self._lookup_locked(("sized", key))
+                if not found or size > best[0]:
+                    self._store_locked(("sized", key), (size, value))
+        return value
+
+
+# ==============================
+# Run attivo (contesto del job che lo ha aperto)
+# ==============================
+_open = {}
+_open_lock = threading.Lock()
+
+
+def active_memo():
+    return _current.get()
+
+
+def open_memos():
+    """Statistiche delle memo aperte nel processo, per run."""
+    with _open_lock:
+        return {f"{memo.name}#{n}": dict(memo.stats) for n, memo in _open.items()}
+
+
+def carry_context(func):
+    """
+    func da eseguire in un altro thread con il contesto attuale (memo del run
+    compresa). Va chiamata una volta per thread/task: un contesto copiato non
+    può essere attivo in due thread insieme.
+    """
+    ctx = contextvars.copy_context()
+    return functools.wraps(func)(lambda *args, **kwargs: ctx.run(func, *args, **kwargs))
+
+
+@contextmanager
+def scrape_run(name="scrape"):
+    """
+    Attiva la memoizzazione per la durata del blocco, nel contesto corrente.
+    Un run annidato riusa la memo del run che lo contiene; run concorrenti in
+    thread diversi hanno ciascuno la propria, rilasciata (e riassunta nel log)
+    quando il blocco termina.
+    """
+    memo = _current.get()
+    if memo is not None:
+        yield memo
+        return
+    memo = RunMemo(name)
+    token = _current.set(memo)
+    with _open_lock:
+        _open[id(memo)] = memo
+    try:
+        yield memo
+    finally:
+        _current.reset(token)
+        with _open_lock:
+            _open.pop(id(memo), None)
+        s = memo.stats
+        logger.info(f"[RUN-MEMO] {memo.name}: {s['fetched']} richieste GitHub, "
+                    f"{s['saved']} risparmiate ({s['coalesced']} unite a richieste in volo), "
+                    f"{s['not_cached']} non memorizzate, {s['evicted']} rimosse per limite")
+
+
+def memoized(kind):
+    """Decoratore: durante uno scrape_run la funzione viene eseguita una sola volta per argomenti."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            memo = _current.get()
+            if memo is None:
+                return func(*args, **kwargs)
+            key = (kind, args, tuple(sorted(kwargs.items())))
+            return memo.get(key, lambda: func(*args, **kwargs))
+        wrapper.uncached = func
+        return wrapper
+    return decorator
@@ -1,69 +1,211 @@
-from config import KEYWORDS_BIO, KEYWORDS_README, ITALIAN_LOCATIONS, NEARBY_CITIES, REQUEST_DELAY
+from config import (
+    KEYWORDS_README, ENRICH_BACKEND, README_FETCH_MODE, SCORE_THRESHOLD, README_TIERS,
+    GRAPHQL_BATCH_SIZE, PIPELINE_PROFILE_WORKERS, PIPELINE_ENRICH_WORKERS, PIPELINE_SCORING_WORKERS,
+    PIPELINE_PERSIST_WORKERS, PIPELINE_QUEUE_SIZE
+)
+import threading
+import numpy as np
 from datetime import datetime, timezone
-from .github_api import get_user_info, get_user_repos, get_repo_readme, extract_email_from_text
-import time
+from loguru import logger
+from .github_api import (
+    get_user_info, get_user_repos, get_repo_readme, scan_repo_readme, ReadmeScan, extract_email_from_text
+)
+from .pipeline import Stage
+from .matcher import bio_matcher, readme_matcher
+from .locations import location_class, location_fields
 
-def score_user(user_info, max_repos=5):
+def fetch_readmes(repos):
+    """README dei repo: testi completi o, con README_FETCH_MODE=stream, scansioni ReadmeScan."""
+    if README_FETCH_MODE == "stream":
+        keywords = tuple(KEYWORDS_README)
+        return [scan_repo_readme(repo["full_name"], keywords) for repo in repos]
+    return [get_repo_readme(repo["full_name"]) for repo in repos]
+
+def readme_signals(readme):
+    """({keyword: occorrenze} delle KEYWORDS_README, primi 2000 caratteri in minuscolo) di un README."""
+    if isinstance(readme, ReadmeScan):
+        return readme.hits, readme.sample
+    return readme_matcher.counts(readme), readme[:2000].lower()
+
+# ==============================================================
+# Scoring su segnali grezzi (senza rete)
+# ==============================================================
+# Lo score dipende solo da segnali salvati nel documento utente: classe
+# della località, keyword nella bio, followers/following e keyword nei
+# README. score_users li elabora a colonne con NumPy, quindi ricalcolare
+# tutta la collection dopo un cambio di pesi o keyword non richiede
+# chiamate a GitHub (vedi scraping1.rescore).
+
+LOCATION_CLASSES = ("other", "italy", "nearby")
+
+
+def user_signals(user_info, readme_hits=0):
+    """Segnali di scoring di un profilo; readme_hits = somma delle keyword distinte per README."""
+    bio = user_info.get("bio") or ""
+    return {
+        "location_class": location_class(user_info.get("location")),
+        "bio_hits": bio_matcher.count(bio),
+        "bio_empty": not bio,
+        "followers": user_info.get("followers") or 0,
+        "following": user_info.get("following") or 0,
+        "readme_hits": readme_hits,
+    }
+
+
+def score_users(batch):
     """
-    Restituisce uno score complessivo per un utente GitHub.
-    Considera località, bio, followers/following e contenuto README.
+    Score euristico vettoriale. batch: dict colonna -> sequenza (chiavi di user_signals),
+    con location_class come stringa o indice in LOCATION_CLASSES. Restituisce un array int.
     """
-    if not user_info:
-        return -999
-
-    score = 0
+    loc = np.asarray(batch["location_class"])
+    if loc.dtype.kind in "UO":
+        loc = np.select([loc == "nearby", loc == "italy"], [2, 1], 0)
+    followers = np.asarray(batch["followers"], dtype=float)
+    following = np.asarray(batch["following"], dtype=float)
 
     # -------- Località ----------
-    location = (user_info.get("location") or "").lower()
-    if any(city.lower() in location for city in NEARBY_CITIES):
-        score += 15
-    elif any(loc.lower() in location for loc in ITALIAN_LOCATIONS):
-        score += 8
-    else:
-        score -= 5
+    score = np.select([loc == 2, loc == 1], [15, 8], -5)
 
     # -------- Bio ----------
-    bio = (user_info.get("bio") or "").lower()
-    bio_hits = sum(1 for kw in KEYWORDS_BIO if kw.lower() in bio)
-    score += bio_hits * 3
-    if not bio:
-        score -= 2
+    score += np.asarray(batch["bio_hits"], dtype=int) * 3
+    score -= np.asarray(batch["bio_empty"], dtype=bool) * 2
 
     # -------- Followers / Following ----------
-    followers = user_info.get("followers", 0)
-    following = user_info.get("following", 0)
-    
-    if 50 <= followers <= 1000:
-        score += 5
-    elif followers < 20:
-        score -= 3
-    elif followers > 5000:
-        score -= 5
-
-    if 30 <= following <= 500:
-        score += 3
-    elif following < 5:
-        score -= 3
-
-    if following > 0:
-        ratio = followers / following
-        if 0.5 <= ratio <= 5:
-            score += 4
-        elif ratio < 0.2 or ratio > 10:
-            score -= 4
-
-    # -------- Repository & README ----------
-    username = user_info.get("login")
-    repos = get_user_repos(username, max_repos=max_repos)
-    for repo in repos:
-        readme = get_repo_readme(repo["full_name"]).lower()
-        readme_hits = sum(1 for kw in KEYWORDS_README if kw.lower() in readme)
-        score += readme_hits * 2
-        time.sleep(REQUEST_DELAY)
+    score += np.select([(followers >= 50) & (followers <= 1000), followers < 20, followers > 5000], [5, -3, -5], 0)
+    score += np.select([(following >= 30) & (following <= 500), following < 5], [3, -3], 0)
+
+    ratio = np.divide(followers, following, out=np.zeros_like(followers), where=following > 0)
+    score += np.where(
+        following > 0,
+        np.select([(ratio >= 0.5) & (ratio <= 5), (ratio < 0.2) | (ratio > 10)], [4, -4], 0),
+        0,
+    )
 
+    # -------- README ----------
+    score += np.asarray(batch["readme_hits"], dtype=int) * 2
     return score
 
 
+def score_signals(signals):
+    """Score di un solo utente da user_signals."""
+    return int(score_users({k: [v] for k, v in signals.items()})[0])
+
+
+def score_user(user_info, readmes=None):
+    """
+    Restituisce uno score complessivo per un utente GitHub.
+    Considera località, bio, followers/following e contenuto README
+    (testi o ReadmeScan già scaricati): non fa chiamate di rete.
+    """
+    if not user_info:
+        return -999
+    readme_hits = sum(len(readme_signals(readme)[0]) for readme in readmes or [])
+    return score_signals(user_signals(user_info, readme_hits))
+
+
+# ==============================================================
+# Arricchimento con branch-and-bound sullo score
+# ==============================================================
+# La parte di profilo dello score non costa chiamate; ogni README può
+# aggiungere al massimo 2 punti per keyword README. Prima di leggere repo
+# e README si confronta il limite superiore (profilo + massimo dai README
+# rimanenti) con SCORE_THRESHOLD: se non può raggiungerla l'utente viene
+# scartato. I README vengono letti a livelli (README_TIERS), così uno
+# scarto si decide spesso dopo 1 o 3 README invece di 5. Gli utenti che
+# superano la soglia vengono salvati: per loro si leggono comunque tutti
+# i README, perché keyword, score ed email del documento siano completi.
+
+# Scorer per nome di run (per lo stato nella dashboard)
+scorers = {}
+
+
+class BoundedScorer:
+    def __init__(self, name="scrape", threshold=SCORE_THRESHOLD, tiers=README_TIERS, max_repos=5):
+        self.name = name
+        self.threshold = threshold
+        self.tiers = [t for t in tiers if t > 0]
+        self.max_repos = max_repos
+        self._lock = threading.Lock()
+        self.counters = {"users": 0, "accepted": 0, "pruned_profile": 0,
+                         "pruned_readmes": 0, "rejected": 0, "repo_calls": 0, "repo_calls_saved": 0,
+                         "readme_calls": 0, "readme_calls_saved": 0}
+        scorers[name] = self
+
+    def _count(self, **counts):
+        with self._lock:
+            for k, v in counts.items():
+                self.counters[k] += v
+
+    def _decided(self, score, remaining):
+        """True/False se l'esito è già deciso con `remaining` README ancora da leggere, None altrimenti."""
+        if self.threshold is None:
+            return None
+        if score >= self.threshold:
+            return True
+        if score + 2 * len(readme_matcher) * remaining < self.threshold:
+            return False
+        return None
+
+    def enrich(self, info):
+        """(info, repos, readmes) per assemble_user_document, o None se l'utente non raggiunge la soglia."""
+        self._count(users=1)
+        base = score_signals(user_signals(info))
+        possible = min(self.max_repos, info.get("public_repos") or 0)
+        if self._decided(base, possible) is False:
+            self._count(pruned_profile=1, repo_calls_saved=1, readme_calls_saved=possible)
+            return None
+
+        self._count(repo_calls=1)
+        repos = get_user_repos(info["login"], max_repos=self.max_repos)
+        readmes, hits = [], 0
+        for tier in self.tiers + [len(repos)]:
+            upto = min(tier, len(repos))
+            if upto <= len(readmes):
+                continue
+            remaining = len(repos) - len(readmes)
+            if self._decided(base + 2 * hits, remaining) is False:
+                self._count(readme_calls_saved=remaining, pruned_readmes=1)
+                return None
+            batch = fetch_readmes(repos[len(readmes):upto])
+            self._count(readme_calls=len(batch))
+            hits += sum(len(readme_signals(readme)[0]) for readme in batch)
+            readmes += batch
+
+        if self.threshold is not None and base + 2 * hits < self.threshold:
+            self._count(rejected=1)
+            return None
+        self._count(accepted=1)
+        return info, repos, readmes
+
+    def check(self, enriched):
+        """
+        Soglia su dati già scaricati per intero (backend GraphQL): enriched
+        (info, repos, readmes) se raggiunge SCORE_THRESHOLD, None altrimenti.
+        """
+        self._count(users=1)
+        if self.threshold is not None and score_user(enriched[0], enriched[2]) < self.threshold:
+            self._count(rejected=1)
+            return None
+        self._count(accepted=1)
+        return enriched
+
+    def stats(self):
+        with self._lock:
+            out = dict(self.counters)
+        made = out["repo_calls"] + out["readme_calls"]
+        saved = out["repo_calls_saved"] + out["readme_calls_saved"]
+        out.update(name=self.name, threshold=self.threshold, tiers=self.tiers,
+                   saved_ratio=round(saved / (made + saved), 3) if made + saved else None)
+        return out
+
+    def log_stats(self):
+        s = self.stats()
+        logger.info(f"[SCORING] {self.name}: {s['users']} utenti, {s['accepted']} sopra soglia, "
+                    f"{s['pruned_profile'] + s['pruned_readmes']} scartati in anticipo, "
+                    f"{s['repo_calls_saved'] + s['readme_calls_saved']} chiamate risparmiate "
+                    f"({s['saved_ratio']})")
+
+
 def build_user_document(username, max_repos=5):
     """
     Costruisce un documento utente arricchito con:
@@ -73,12 +215,43 @@ def build_user_document(username, max_repos=5):
     - Email estratte
     - Score euristico
     """
+    if ENRICH_BACKEND == "graphql":
+        return build_user_documents([username], max_repos=max_repos).get(username)
+
     info = get_user_info(username)
     if not info:
         return None
 
-    # Profilo base
-    user_doc = {
+    enriched = BoundedScorer("user", max_repos=max_repos).enrich(info)
+    return assemble_user_document(*enriched) if enriched else None
+
+
+def build_user_documents(usernames, max_repos=5, scorer=None):
+    """
+    Versione batch di build_user_document: dict username -> documento (None se non
+    disponibile o sotto SCORE_THRESHOLD). Con ENRICH_BACKEND=graphql profilo, repo e
+    README arrivano in poche query GraphQL; gli utenti il cui arricchimento è fallito
+    non compaiono nel risultato (da riprovare). scorer raccoglie le chiamate risparmiate.
+    """
+    scorer = scorer or BoundedScorer("batch", max_repos=max_repos)
+    if ENRICH_BACKEND == "graphql":
+        from .graphql_api import fetch_users_enrichment
+        enriched, _failed = fetch_users_enrichment(usernames, max_repos=max_repos)
+        docs = {u: scorer.check(enriched[u]) if enriched[u] else None for u in usernames if u in enriched}
+        return {u: assemble_user_document(*e) if e else None for u, e in docs.items()}
+
+    docs = {}
+    for username in usernames:
+        info = get_user_info(username)
+        enriched = scorer.enrich(info) if info else None
+        docs[username] = assemble_user_document(*enriched) if enriched else None
+    return docs
+
+
+def profile_fields(info):
+    """Campi del documento utente che vengono dal profilo GitHub."""
+    bio_hits = bio_matcher.counts(info.get("bio"))
+    return {
         "username": info.get("login"),
         "name": info.get("name"),
         "bio": info.get("bio"),
@@ -91,15 +264,15 @@ def build_user_document(username, max_repos=5):
         "public_gists": info.get("public_gists", 0),
         "created_at": info.get("created_at"),
         "updated_at": info.get("updated_at"),
-        "scraped_at": datetime.now(timezone.utc),  # coerente con timezone UTC
+        "bio_keywords_hit": len(bio_hits),
+        # Occorrenze per keyword, come coppie [keyword, n] (le keyword possono contenere ".")
+        "bio_keyword_counts": bio_matcher.pairs(bio_hits),
+        **location_fields(info.get("location")),
     }
 
-    # Repos info
-    repos = get_user_repos(username, max_repos=max_repos)
-    total_stars = sum(r["stars"] for r in repos)
-    total_forks = sum(r["forks"] for r in repos)
-    main_languages = list({r["language"] for r in repos if r["language"]})
 
+def repo_fields(repos):
+    """Campi aggregati dei repo (formato get_user_repos), compreso l'ultimo push."""
     last_commit_days = None
     if repos:
         updates = [r["updated_at"] for r in repos if r.get("updated_at")]
@@ -108,27 +281,48 @@ def build_user_document(username, max_repos=5):
             latest_dt = datetime.fromisoformat(latest_update.replace("Z", "+00:00"))
             last_commit_days = (datetime.now(timezone.utc) - latest_dt).days
 
-    user_doc.update({
+    pushes = [r["pushed_at"] for r in repos if r.get("pushed_at")]
+    return {
         "n_repos_checked": len(repos),
-        "total_stars": total_stars,
-        "total_forks": total_forks,
-        "main_languages": main_languages,
+        "total_stars": sum(r["stars"] for r in repos),
+        "total_forks": sum(r["forks"] for r in repos),
+        "main_languages": list({r["language"] for r in repos if r["language"]}),
         "last_commit_days": last_commit_days,
-    })
+        # Usato dal refresh incrementale per capire se i README vanno riletti
+        "repos_pushed_at": max(pushes) if pushes else None,
+    }
 
-    # Keywords check
-    bio = (user_doc["bio"] or "").lower()
-    user_doc["bio_keywords_hit"] = sum(1 for kw in KEYWORDS_BIO if kw.lower() in bio)
 
+def assemble_user_document(info, repos, readmes):
+    """
+    Costruisce il documento utente da dati già scaricati:
+    info (profilo REST), repos (formato get_user_repos), readmes (testi o ReadmeScan, uno per repo).
+    """
+    # Profilo base e repos info
+    user_doc = profile_fields(info)
+    user_doc["scraped_at"] = datetime.now(timezone.utc)  # coerente con timezone UTC
+    user_doc.update(repo_fields(repos))
+    # README letti (uno per repo controllato: gli utenti salvati li hanno letti tutti)
+    user_doc["readmes_checked"] = len(readmes)
+
+    # Keywords README
     readme_hits = 0
+    readme_counts = {}
+    readme_repos = {}
     sample_readme = ""
-    for repo in repos:
-        readme = get_repo_readme(repo["full_name"]).lower()
+    for readme in readmes:
+        hits, sample = readme_signals(readme)
         if not sample_readme:  # salvo solo il primo README per esempio
-            sample_readme = readme[:2000]
-        readme_hits += sum(1 for kw in KEYWORDS_README if kw.lower() in readme)
-        time.sleep(REQUEST_DELAY)
+            sample_readme = sample
+        readme_hits += len(hits)
+        for kw, n in hits.items():
+            readme_counts[kw] = readme_counts.get(kw, 0) + n
+            readme_repos[kw] = readme_repos.get(kw, 0) + 1
     user_doc["readme_keywords_hit"] = readme_hits
+    user_doc["readme_keyword_counts"] = readme_matcher.pairs(readme_counts)
+    # README che contengono ciascuna keyword: la loro somma è readme_keywords_hit,
+    # e permette di ricalcolarlo dopo aver tolto keyword dalla configurazione
+    user_doc["readme_keyword_repos"] = readme_matcher.pairs(readme_repos)
     user_doc["sample_readme"] = sample_readme
 
     # Email extraction
@@ -138,6 +332,65 @@ def build_user_document(username, max_repos=5):
     user_doc["email_extracted"] = email
 
     # Heuristic score
-    user_doc["heuristic_score"] = score_user(info, max_repos=max_repos)
+    signals = user_signals(info, readme_hits)
+    user_doc["location_class"] = signals["location_class"]
+    user_doc["heuristic_score"] = score_signals(signals)
 
     return user_doc
+
+
+# ==============================================================
+# Stadi della pipeline di scraping
+# ==============================================================
+def _is_ghost(info):
+    # Account senza followers né following: scartati come in get_candidate_users
+    return info.get("followers", 0) == 0 and info.get("following", 0) == 0
+
+
+def scrape_stages(persist, max_repos=5, scorer=None):
+    """
+    Stadi profile -> enrichment -> scoring -> persistence per Pipeline.
+    persist(user_doc) salva il documento; con ENRICH_BACKEND=graphql
+    profilo, repo e README arrivano insieme da un unico stadio a batch.
+    In entrambi i backend SCORE_THRESHOLD viene applicata da scorer (BoundedScorer).
+    """
+    scorer = scorer or BoundedScorer(max_repos=max_repos)
+
+    def profile(username):
+        info = get_user_info(username)
+        if not info or _is_ghost(info):
+            return None
+        return info
+
+    def enrichment(info):
+        return scorer.enrich(info)
+
+    def enrichment_graphql(usernames):
+        from .graphql_api import fetch_users_enrichment, EnrichmentFailed
+        enriched, _failed = fetch_users_enrichment(usernames, max_repos=max_repos)
+        # Fallito (errore transitorio) != inesistente (None): il job lo registra come "failed"
+        return [(scorer.check(enriched[u]) if enriched[u] else None) if u in enriched else EnrichmentFailed(u)
+                for u in usernames]
+
+    def scoring(enriched):
+        info, repos, readmes = enriched
+        if _is_ghost(info):
+            return None
+        return assemble_user_document(info, repos, readmes)
+
+    def persistence(user_doc):
+        persist(user_doc)
+        return user_doc
+
+    if ENRICH_BACKEND == "graphql":
+        stages = [Stage("enrichment", enrichment_graphql, workers=max(1, PIPELINE_ENRICH_WORKERS // 4),
+                        queue_size=PIPELINE_QUEUE_SIZE, batch_size=GRAPHQL_BATCH_SIZE)]
+    else:
+        stages = [
+            Stage("profile", profile, workers=PIPELINE_PROFILE_WORKERS, queue_size=PIPELINE_QUEUE_SIZE),
+            Stage("enrichment", enrichment, workers=PIPELINE_ENRICH_WORKERS, queue_size=PIPELINE_QUEUE_SIZE),
+        ]
+    return stages + [
+        Stage("scoring", scoring, workers=PIPELINE_SCORING_WORKERS, queue_size=PIPELINE_QUEUE_SIZE),
+        Stage("persistence", persistence, workers=PIPELINE_PERSIST_WORKERS, queue_size=PIPELINE_QUEUE_SIZE),
+    ]
@@ -0,0 +1,280 @@
+import re
+import threading
+from collections import namedtuple
+from datetime import date, datetime, timedelta, timezone
+from itertools import islice
+from pymongo import ASCENDING
+from loguru import logger
+from config import HEADERS, SEARCH_SHARD_WORKERS, SEARCH_CACHE_TTL
+from db import db
+from .transport import session
+from .pagination import merge_streams
+
+# ==============================================================
+# Search API oltre il limite dei 1000 risultati
+# ==============================================================
+# GitHub restituisce al massimo 1000 risultati per query di ricerca.
+# Se total_count supera il limite la query viene divisa in shard:
+# prima si bisecano gli intervalli followers:, poi (quando l'intervallo
+# è un solo valore) si aggiungono finestre created: sempre più strette,
+# finché ogni shard sta sotto il limite. Gli shard vengono paginati in
+# parallelo (dentro il bucket "search" del rate limiter) e i login
+# deduplicati.
+#
+# Le combinazioni di keyword vengono unite in OR in poche query valide
+# (limiti GitHub: 256 caratteri, 5 operatori AND/OR/NOT) e ogni pagina
+# di risultati è memorizzata su MongoDB per SEARCH_CACHE_TTL secondi con
+# chiave la query normalizzata: ricerche ripetute o sovrapposte non
+# costano chiamate API.
+
+SEARCH_URL = "https://api.github.com/search/users"
+SEARCH_CAP = 1000
+PER_PAGE = 100
+
+# Limiti delle query di ricerca GitHub
+MAX_QUERY_LEN = 256
+MAX_OPERATORS = 5
+# Spazio lasciato libero per i qualificatori followers:/created: aggiunti dagli shard
+SHARD_RESERVE = len(" followers:0000000..0000000 created:0000-00-00..0000-00-00")
+
+# Primo giorno utile per created: (GitHub è online da ottobre 2007)
+GITHUB_EPOCH = date(2007, 10, 1)
+
+# Shard con la prima pagina già scaricata durante la pianificazione
+Shard = namedtuple("Shard", ["query", "total", "first_items"])
+
+
+def parse_range(value):
+    """'10..2000' -> (10, 2000); None se l'intervallo non è bisecabile."""
+    try:
+        lo, hi = value.split("..")
+        return int(lo), int(hi)
+    except (AttributeError, ValueError):
+        return None
+
+
+# ==============================
+# Pianificazione delle query
+# ==============================
+def _quote(keyword):
+    return f'"{keyword}"' if re.search(r"\s", keyword) else keyword
+
+
+def plan_queries(keywords=None, location=None, language=None,
+                 max_len=MAX_QUERY_LEN, max_operators=MAX_OPERATORS):
+    """
+    Query di ricerca che coprono tutte le keyword (cercate nella bio),
+    unite in OR a gruppi entro i limiti di lunghezza e operatori.
+    """
+    base = []
+    if location:
+        base.append(f"location:{_quote(location)}")
+    if language:
+        base.append(f"language:{language}")
+    base = " ".join(base)
+
+    # Keyword uniche (case-insensitive), nell'ordine originale
+    unique = list({kw.strip().lower(): kw.strip() for kw in keywords or [] if kw.strip()}.values())
+    if not unique:
+        return [base]
+
+    budget = max_len - SHARD_RESERVE - len(base) - len(" in:bio ")
+    queries, group = [], []
+
+    def flush():
+        if group:
+            queries.append(f"{' OR '.join(group)} in:bio {base}".strip())
+
+    for kw in unique:
+        term = _quote(kw)
+        if len(term) > budget:
+            logger.warning(f"[GitHub Search API] Keyword troppo lunga per una query, ignorata: {kw}")
+            continue
+        if group and (len(group) > max_operators or len(" OR ".join(group + [term])) > budget):
+            flush()
+            group = []
+        group.append(term)
+    flush()
+    return queries
+
+
+# ==============================
+# Cache delle pagine di ricerca (MongoDB, TTL)
+# ==============================
+search_cache = db["search_cache"]
+_cache_ready = False
+_cache_lock = threading.Lock()
+cache_stats = {"hits": 0, "misses": 0}
+
+QUOTED_RE = re.compile(r'"[^"]*"|\S+')
+
+
+def normalize_query(q):
+    """Chiave canonica: testo libero nell'ordine dato, qualificatori ordinati, tutto minuscolo."""
+    tokens = QUOTED_RE.findall(q.lower())
+    qualifiers = sorted(t for t in tokens if ":" in t and not t.startswith('"'))
+    text = [t for t in tokens if ":" not in t or t.startswith('"')]
+    return " ".join(text + qualifiers)
+
+
+def _ensure_cache_index():
+    global _cache_ready
+    with _cache_lock:
+        if not _cache_ready:
+            # Ogni documento porta la propria scadenza: cambiare SEARCH_CACHE_TTL
+            # vale per le pagine salvate da quel momento, senza modificare l'indice
+            _cache_ready = True
+            try:
+                if "created_at_1" in search_cache.index_information():
+                    search_cache.drop_index("created_at_1")  # vecchio indice TTL a durata fissa
+                search_cache.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+            except Exception as e:
+                logger.warning(f"[GitHub Search API] Indice TTL della cache non creato: {e}")
+
+
+def _cache_get(key):
+    if not SEARCH_CACHE_TTL:
+        return None
+    try:
+        _ensure_cache_index()
+        # Il monitor TTL di MongoDB gira ogni minuto: si controlla anche la scadenza
+        doc = search_cache.find_one({"_id": key, "expires_at": {"$gt": datetime.now(timezone.utc)}})
+    except Exception as e:
+        # Cache non disponibile: la pagina viene chiesta a GitHub
+        logger.warning(f"[GitHub Search API] Cache non disponibile: {e}")
+        doc = None
+    with _cache_lock:
+        cache_stats["hits" if doc else "misses"] += 1
+    return (doc["total_count"], doc["items"]) if doc else None
+
+
+def _cache_put(key, total, items):
+    if not SEARCH_CACHE_TTL:
+        return
+    now = datetime.now(timezone.utc)
+    try:
+        search_cache.replace_one(
+            {"_id": key},
+            {"_id": key, "total_count": total, "items": [{"login": u["login"]} for u in items],
+             "created_at": now, "expires_at": now + timedelta(seconds=SEARCH_CACHE_TTL)},
+            upsert=True,
+        )
+    except Exception as e:
+        logger.warning(f"[GitHub Search API] Pagina non salvata in cache: {e}")
+
+
+def search_page(q, page=1, per_page=PER_PAGE):
+    """(total_count, items) di una pagina di ricerca utenti, dalla cache se disponibile."""
+    key = f"{normalize_query(q)}|{per_page}|{page}"
+    try:
+        cached = _cache_get(key)
+        if cached:
+            return cached
+        resp = session.get(SEARCH_URL, headers=HEADERS, params={"q": q, "per_page": per_page, "page": page})
+        if resp.status_code != 200:
+            logger.warning(f"[GitHub Search API] Status {resp.status_code} per '{q}'")
+            return 0, []
+        data = resp.json()
+        total, items = data.get("total_count", 0), data.get("items", [])
+        # Risultati incompleti (timeout lato GitHub) non vengono memorizzati
+        if not data.get("incomplete_results"):
+            _cache_put(key, total, items)
+        return total, items
+    except Exception as e:
+        logger.warning(f"[GitHub Search API] Error: {e}")
+        return 0, []
+
+
+def _shard_query(base_q, followers, created):
+    q = base_q
+    if followers:
+        q += f" followers:{followers[0]}..{followers[1]}"
+    if created:
+        q += f" created:{created[0].isoformat()}..{created[1].isoformat()}"
+    return q.strip()
+
+
+def plan_shards(base_q, followers=None, created=None):
+    """
+    Genera (depth-first, in modo lazy) gli shard della query con meno di
+    SEARCH_CAP risultati. followers = (min, max), created = (date, date).
+    """
+    q = _shard_query(base_q, followers, created)
+    total, items = search_page(q)
+    if total <= SEARCH_CAP:
+        if total:
+            yield Shard(q, total, items)
+        return
+
+    if followers and followers[0] < followers[1]:
+        lo, hi = followers
+        mid = (lo + hi) // 2
+        yield from plan_shards(base_q, (lo, mid), created)
+        yield from plan_shards(base_q, (mid + 1, hi), created)
+        return
+
+    start, end = created or (GITHUB_EPOCH, date.today())
+    if start < end:
+        mid = start + (end - start) // 2
+        yield from plan_shards(base_q, followers, (start, mid))
+        yield from plan_shards(base_q, followers, (mid + timedelta(days=1), end))
+        return
+
+    # Un solo valore di followers creato in un solo giorno: non si può dividere oltre
+    logger.warning(f"[GitHub Search API] Shard non divisibile oltre ({total} risultati, letti i primi {SEARCH_CAP}): {q}")
+    yield Shard(q, total, items)
+
+
+def iter_shard(shard):
+    """Login di uno shard: prima pagina già in memoria, poi le successive."""
+    for u in shard.first_items:
+        yield u["login"]
+    last = -(-min(shard.total, SEARCH_CAP) // PER_PAGE)
+    for page in range(2, last + 1):
+        _, items = search_page(shard.query, page)
+        if not items:
+            break
+        for u in items:
+            yield u["login"]
+
+
+def iter_search_logins(base_q, followers_range=None, max_workers=None):
+    """
+    Login unici per base_q (senza qualificatore followers:), anche oltre i
+    1000 risultati. Gli shard vengono pianificati a gruppi di max_workers,
+    così un chiamante che si ferma presto non paga la pianificazione completa.
+    """
+    max_workers = max_workers or SEARCH_SHARD_WORKERS
+    followers = parse_range(followers_range)
+    if followers_range and not followers:
+        # Intervallo non numerico (es. ">=10"): resta nella query, si divide solo per data
+        base_q = f"{base_q} followers:{followers_range}"
+
+    shards = plan_shards(base_q, followers)
+    seen = set()
+    try:
+        while True:
+            group = list(islice(shards, max_workers))
+            if not group:
+                break
+            logger.info(f"[GitHub Search API] {len(group)} shard, {sum(s.total for s in group)} risultati")
+            stream = merge_streams((iter_shard(s) for s in group), max_workers=max_workers)
+            try:
+                for login in stream:
+                    if login not in seen:
+                        seen.add(login)
+                        yield login
+            finally:
+                stream.close()
+    finally:
+        shards.close()
+
+
+def iter_queries_logins(queries, followers_range=None):
+    """Login unici dell'unione di più query, una dopo l'altra."""
+    seen = set()
+    for q in queries:
+        for login in iter_search_logins(q, followers_range):
+            if login not in seen:
+                seen.add(login)
+                yield login
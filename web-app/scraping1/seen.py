@@ -0,0 +1,221 @@
+import os
+import math
+import time
+import atexit
+import struct
+import hashlib
+import threading
+from loguru import logger
+from config import SEEN_BACKEND, SEEN_BLOOM_PATH, SEEN_BLOOM_CAPACITY, SEEN_BLOOM_ERROR_RATE
+from db import collection, db
+
+# ==============================================================
+# Utenti già visti (de-duplicazione dei candidati tra run)
+# ==============================================================
+# Gli username salvati vengono letti da MongoDB una sola volta per
+# processo e poi aggiornati a ogni salvataggio (save_user / upsert):
+# niente più scansioni complete della collection a ogni ricerca.
+# Con SEEN_BACKEND=bloom la struttura è un Bloom filter di dimensione
+# fissa salvato su disco: memoria costante e nessuna scansione nemmeno
+# all'avvio. Un falso positivo (SEEN_BLOOM_ERROR_RATE) scarta un
+# candidato nuovo; falsi negativi non sono possibili.
+#
+# Più processi (app e worker) condividono MongoDB e lo stesso file:
+# - ogni salvataggio unisce (OR dei bit) il filtro su disco con quello in
+#   memoria, così nessun processo perde gli inserimenti degli altri;
+# - rebuild() (es. dopo lo svuotamento della collection) incrementa
+#   un'epoca salvata su MongoDB: gli altri processi la controllano ogni
+#   SEEN_SYNC_SECONDS e ricaricano, e i filtri di un'epoca precedente non
+#   vengono più uniti né salvati.
+
+# Salvataggio su disco del Bloom filter ogni N inserimenti
+BLOOM_SAVE_EVERY = 100
+# Secondi tra due controlli dell'epoca condivisa
+SEEN_SYNC_SECONDS = 30
+
+seen_meta = db["seen_meta"]
+
+
+def _current_epoch():
+    doc = seen_meta.find_one({"_id": "users"})
+    return doc["epoch"] if doc else 0
+
+
+def _normalize(username):
+    # I login GitHub non distinguono maiuscole/minuscole
+    return username.strip().lower()
+
+
+class BloomFilter:
+    MAGIC = b"BLM2"
+    HEADER = struct.Struct("<4sQIIQ")  # formato, bit, funzioni hash, elementi inseriti, epoca
+
+    def __init__(self, capacity, error_rate, n_bits=None, n_hashes=None, bits=None, count=0, epoch=0):
+        self.n_bits = n_bits or max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.n_hashes = n_hashes or max(1, round(self.n_bits / capacity * math.log(2)))
+        self.bits = bits if bits is not None else bytearray((self.n_bits + 7) // 8)
+        self.count = count
+        self.epoch = epoch
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1, h2 = struct.unpack("<QQ", digest)
+        return ((h1 + i * h2) % self.n_bits for i in range(self.n_hashes))
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def merge(self, other):
+        """Aggiunge gli elementi di un filtro con la stessa geometria (OR dei bit)."""
+        if (other.n_bits, other.n_hashes) != (self.n_bits, self.n_hashes):
+            raise ValueError("Bloom filter con dimensioni diverse")
+        merged = int.from_bytes(self.bits, "little") | int.from_bytes(other.bits, "little")
+        self.bits = bytearray(merged.to_bytes(len(self.bits), "little"))
+        self.count = max(self.count, other.count)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.n_bits, self.n_hashes, self.count, self.epoch))
+            f.write(self.bits)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            magic, n_bits, n_hashes, count, epoch = cls.HEADER.unpack(f.read(cls.HEADER.size))
+            if magic != cls.MAGIC:
+                raise ValueError("formato del file non riconosciuto")
+            bits = bytearray(f.read())
+        if len(bits) != (n_bits + 7) // 8:
+            raise ValueError("file troncato")
+        return cls(None, None, n_bits=n_bits, n_hashes=n_hashes, bits=bits, count=count, epoch=epoch)
+
+
+class SeenUsers:
+    def __init__(self, backend=SEEN_BACKEND, path=SEEN_BLOOM_PATH,
+                 capacity=SEEN_BLOOM_CAPACITY, error_rate=SEEN_BLOOM_ERROR_RATE):
+        self.backend = backend
+        self.path = path
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self._members = None
+        self._unsaved = 0
+        self._epoch = 0
+        self._checked_at = 0
+
+    def _load(self):
+        epoch = _current_epoch()
+        if self.backend == "bloom" and os.path.exists(self.path):
+            try:
+                members = BloomFilter.load(self.path)
+                if members.epoch == epoch:
+                    self._members, self._epoch, self._checked_at = members, epoch, time.time()
+                    logger.info(f"[SEEN] Bloom filter caricato da disco ({members.count} utenti)")
+                    return
+                logger.info("[SEEN] Bloom filter su disco di un'epoca precedente, lo ricostruisco")
+            except Exception as e:
+                logger.warning(f"[SEEN] Bloom filter illeggibile, lo ricostruisco: {e}")
+        self._rebuild_locked(epoch)
+
+    def _rebuild_locked(self, epoch):
+        if self.backend == "bloom":
+            members = BloomFilter(self.capacity, self.error_rate, epoch=epoch)
+        else:
+            members = set()
+        for doc in collection.find({}, {"username": 1, "_id": 0}):
+            if doc.get("username"):
+                members.add(_normalize(doc["username"]))
+        self._members, self._epoch, self._checked_at = members, epoch, time.time()
+        self._unsaved = 0
+        count = members.count if self.backend == "bloom" else len(members)
+        logger.info(f"[SEEN] Caricati {count} utenti da MongoDB ({self.backend})")
+        if self.backend == "bloom":
+            # Nuova epoca: il file viene sostituito, non unito
+            self._save_locked(merge=False)
+
+    def _ensure_loaded(self):
+        if self._members is None:
+            with self._lock:
+                if self._members is None:
+                    self._load()
+        elif time.time() - self._checked_at >= SEEN_SYNC_SECONDS:
+            with self._lock:
+                self._checked_at = time.time()
+                epoch = _current_epoch()
+                if epoch != self._epoch:
+                    logger.info("[SEEN] Utenti salvati reimpostati da un altro processo, ricarico")
+                    self._rebuild_locked(epoch)
+
+    def rebuild(self):
+        """
+        Ricarica da MongoDB (es. dopo cancellazioni o import esterni) e apre
+        una nuova epoca: il Bloom filter su disco viene sostituito e gli altri
+        processi ricaricano entro SEEN_SYNC_SECONDS.
+        """
+        with self._lock:
+            epoch = max(int(time.time() * 1000), _current_epoch() + 1)
+            seen_meta.update_one({"_id": "users"}, {"$set": {"epoch": epoch}}, upsert=True)
+            self._rebuild_locked(epoch)
+
+    def _save_locked(self, merge=True):
+        try:
+            if merge and os.path.exists(self.path):
+                try:
+                    disk = BloomFilter.load(self.path)
+                except Exception as e:
+                    logger.warning(f"[SEEN] Bloom filter su disco illeggibile, lo sovrascrivo: {e}")
+                    disk = None
+                if disk is not None and disk.epoch != self._epoch:
+                    # Epoca diversa: il filtro di un'altra epoca non va né unito né salvato
+                    # (il prossimo controllo dell'epoca ricarica da MongoDB)
+                    self._checked_at = 0
+                    return
+                if disk is not None:
+                    self._members.merge(disk)
+            self._members.save(self.path)
+            self._unsaved = 0
+        except (OSError, ValueError) as e:
+            logger.warning(f"[SEEN] Impossibile salvare il Bloom filter: {e}")
+
+    def __contains__(self, username):
+        self._ensure_loaded()
+        return _normalize(username) in self._members
+
+    def add(self, username):
+        self._ensure_loaded()
+        key = _normalize(username)
+        with self._lock:
+            if key in self._members:
+                return
+            self._members.add(key)
+            if self.backend == "bloom":
+                self._unsaved += 1
+                if self._unsaved >= BLOOM_SAVE_EVERY:
+                    self._save_locked()
+
+    def flush(self):
+        """Salva su disco gli inserimenti pendenti del Bloom filter."""
+        if self.backend == "bloom" and self._members is not None and self._unsaved:
+            with self._lock:
+                self._save_locked()
+
+    def status(self):
+        if self._members is None:
+            return {"backend": self.backend, "loaded": False}
+        if self.backend == "bloom":
+            return {"backend": "bloom", "loaded": True, "count": self._members.count,
+                    "size_bytes": len(self._members.bits)}
+        return {"backend": "set", "loaded": True, "count": len(self._members)}
+
+
+# Insieme unico condiviso da tutti i moduli del processo
+seen_users = SeenUsers()
+atexit.register(seen_users.flush)
@@ -1,6 +1,8 @@
 from pymongo import MongoClient
 from .config import MONGO_URI, DB_NAME, COLLECTION_NAME
-from scraping1.scoring import build_user_document
+from scraping1.scoring import build_user_documents
+from scraping1.run_memo import scrape_run
+from scraping1.seen import seen_users
 
 client = MongoClient(MONGO_URI)
 db = client[DB_NAME]
@@ -9,11 +11,12 @@ collection = db[COLLECTION_NAME]
 def save_user(user_doc):
     """Salva o aggiorna un utente in MongoDB"""
     collection.update_one({"username": user_doc["username"]}, {"$set": user_doc}, upsert=True)
+    seen_users.add(user_doc["username"])
 
 
+@scrape_run("process_and_save")
 def process_and_save_users(usernames):
-    for username in usernames:
-        user_doc = build_user_document(username)
+    for username, user_doc in build_user_documents(usernames).items():
         if user_doc:
             save_user(user_doc)
             print(f"[DB] Salvato {username}")
@@ -0,0 +1,99 @@
+import time
+import hashlib
+from loguru import logger
+from config import GITHUB_TOKENS
+from .rate_limit import limiter, wait_time, RateLimitExceeded
+
+# ==============================================================
+# Pool di token GitHub con budget per token
+# ==============================================================
+# Il budget di ogni token vive nello scheduler rate limit (un bucket
+# per token e risorsa), quindi è condiviso tra thread e processi.
+# Ogni richiesta usa il token con più richieste residue; i token
+# esauriti restano fuori rotazione fino al reset, quelli revocati
+# (401) per REVOKED_COOLDOWN secondi.
+
+REVOKED_COOLDOWN = 3600
+RESOURCES = ("core", "search", "graphql")
+
+
+def token_id(token):
+    """Identificativo stabile e non sensibile di un token (per i bucket e i log)."""
+    if not token:
+        return "anonymous"
+    return hashlib.sha256(token.encode()).hexdigest()[:12]
+
+
+class TokenPool:
+    def __init__(self, tokens, rate_limiter=None):
+        # Senza token le richieste partono anonime (limiti GitHub ridotti)
+        self.tokens = [t for t in tokens if t] or [None]
+        self.limiter = rate_limiter or limiter
+        self._ids = {t: token_id(t) for t in self.tokens}
+
+    def acquire(self, resource="core"):
+        """
+        Riserva una richiesta sul token con più budget residuo e lo restituisce.
+        Se tutti i token sono esauriti attende il primo reset (fino a max_wait).
+        """
+        if resource is None:
+            return self.tokens[0]
+        waited = 0
+        while True:
+            now = time.time()
+            states = self.limiter.peek(resource, self._ids.values())
+            available, soonest = [], None
+            for token in self.tokens:
+                state = states.get(self._ids[token])
+                wait = wait_time(state, now)
+                if wait > 0:
+                    soonest = wait if soonest is None else min(soonest, wait)
+                    continue
+                remaining = state.get("remaining") if state else None
+                # Budget ignoto (token mai usato) = priorità massima, così ne leggiamo gli header
+                available.append((float("inf") if remaining is None else remaining, token))
+
+            for _, token in sorted(available, key=lambda x: x[0], reverse=True):
+                if self.limiter.try_acquire(resource, key=self._ids[token]):
+                    return token
+
+            if soonest is None:
+                # Tutti i bucket liberi ma prenotati da altri nel frattempo: riprova
+                continue
+            if waited + soonest > self.limiter.max_wait:
+                raise RateLimitExceeded(f"{resource}: nessun token disponibile per {int(soonest)}s")
+            logger.info(f"[TOKENS] Tutti i token esauriti su {resource}, attendo {soonest:.1f}s")
+            time.sleep(soonest)
+            waited += soonest
+
+    def acquire_token(self, resource, token):
+        """Come acquire, ma per un token imposto dal chiamante (endpoint legati all'account)."""
+        self.limiter.acquire(resource, key=self._ids.get(token, token_id(token)))
+        return token
+
+    def report(self, token, resource, response):
+        """
+        Aggiorna il budget del token dalla risposta.
+        Restituisce True se la richiesta va ripetuta (rate limit o token revocato).
+        """
+        if resource is None:
+            return False
+        tid = self._ids.get(token, token_id(token))
+        if response.status_code == 401 and token and len(self.tokens) > 1:
+            logger.warning(f"[TOKENS] Token {tid} non valido o revocato, escluso per {REVOKED_COOLDOWN}s")
+            until = time.time() + REVOKED_COOLDOWN
+            for res in RESOURCES:
+                self.limiter.block(res, tid, until)
+            return True
+        return self.limiter.update(resource, response, key=tid)
+
+    def status(self):
+        """Budget residuo per token e risorsa (id anonimizzati)."""
+        return {
+            res: {tid: state for tid, state in self.limiter.peek(res, self._ids.values()).items()}
+            for res in RESOURCES
+        }
+
+
+# Pool unico condiviso da tutti i moduli che parlano con GitHub
+token_pool = TokenPool(GITHUB_TOKENS)
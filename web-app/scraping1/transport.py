@@ -0,0 +1,136 @@
+import io
+import time
+import requests
+from requests.adapters import HTTPAdapter, BaseAdapter, Retry
+from requests.structures import CaseInsensitiveDict
+from loguru import logger
+from config import HTTP_POOL_SIZE, HTTP2_ENABLED
+from .github_session import GitHubSession
+
+# ==============================================================
+# Trasporto HTTP unico per tutte le chiamate GitHub
+# ==============================================================
+# Una sola GitHubSession (rate limit, token pool, cache ETag) con pool
+# di connessioni keep-alive dimensionato sui thread dell'app, retry con
+# backoff, timeout uniformi e decompressione gzip/deflate (br se è
+# installato brotli). Con HTTP2_ENABLED e httpx[http2] installato le
+# richieste verso api.github.com viaggiano multiplexate su HTTP/2.
+
+USER_AGENT = "Scraping-Project"
+API_PREFIX = "https://api.github.com"
+
+retry_strategy = Retry(
+    total=5,
+    backoff_factor=1,
+    status_forcelist=[429, 500, 502, 503, 504],
+    allowed_methods=["HEAD", "GET", "OPTIONS", "PUT", "DELETE"],
+    respect_retry_after_header=True,
+)
+
+
+# ==============================
+# Adapter HTTP/2 opzionale (httpx)
+# ==============================
+class _HttpxRaw(io.RawIOBase):
+    """Espone il body (già decompresso) di una risposta httpx in streaming come file per requests."""
+
+    def __init__(self, httpx_response):
+        self._resp = httpx_response
+        self._chunks = httpx_response.iter_bytes()
+        self._buffer = b""
+
+    def readable(self):
+        return True
+
+    def read(self, amt=-1):
+        while amt is None or amt < 0 or len(self._buffer) < amt:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if amt is None or amt < 0:
+            data, self._buffer = self._buffer, b""
+        else:
+            data, self._buffer = self._buffer[:amt], self._buffer[amt:]
+        return data
+
+    def close(self):
+        self._resp.close()
+        super().close()
+
+
+class HTTP2Adapter(BaseAdapter):
+    def __init__(self, pool_size, max_retries=3):
+        super().__init__()
+        import httpx
+        self._httpx = httpx
+        self.max_retries = max_retries
+        self.client = httpx.Client(
+            http2=True,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        if isinstance(timeout, tuple):
+            timeout = self._httpx.Timeout(timeout[1], connect=timeout[0])
+        httpx_request = self.client.build_request(
+            request.method, request.url, headers=dict(request.headers), content=request.body, timeout=timeout
+        )
+        for attempt in range(self.max_retries + 1):
+            try:
+                httpx_response = self.client.send(httpx_request, stream=stream)
+                break
+            except self._httpx.TransportError as e:
+                if attempt == self.max_retries:
+                    raise requests.ConnectionError(e, request=request)
+                time.sleep(2 ** attempt)
+
+        resp = requests.Response()
+        resp.status_code = httpx_response.status_code
+        resp.headers = CaseInsensitiveDict(httpx_response.headers)
+        # httpx decomprime già: evita che requests provi a decodificare di nuovo
+        resp.headers.pop("Content-Encoding", None)
+        resp.url = str(httpx_response.url)
+        resp.reason = httpx_response.reason_phrase
+        resp.request = request
+        resp.encoding = requests.utils.get_encoding_from_headers(resp.headers)
+        if stream:
+            resp.raw = _HttpxRaw(httpx_response)
+        else:
+            resp._content = httpx_response.content
+            resp._content_consumed = True
+        return resp
+
+    def close(self):
+        self.client.close()
+
+
+def _http2_available():
+    try:
+        import httpx  # noqa: F401
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def build_session():
+    s = GitHubSession()
+    s.headers.update({"User-Agent": USER_AGENT, "Accept": "application/vnd.github+json"})
+    # pool_block: con più thread che connessioni si attende una connessione libera
+    # invece di aprirne (e scartarne) di nuove
+    adapter = HTTPAdapter(
+        pool_connections=4, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry_strategy, pool_block=True
+    )
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    if HTTP2_ENABLED:
+        if _http2_available():
+            s.mount(API_PREFIX, HTTP2Adapter(HTTP_POOL_SIZE))
+        else:
+            logger.warning("[Transport] HTTP2_ENABLED ma httpx[http2] non è installato: uso HTTP/1.1")
+    return s
+
+
+# Session unica condivisa da tutti i moduli che parlano con GitHub
+session = build_session()
@@ -0,0 +1,136 @@
+import threading
+from datetime import datetime, timedelta, timezone
+from pymongo import ASCENDING, ReturnDocument
+from config import WORK_LEASE_SECONDS, WORK_BATCH_SIZE, WORK_MAX_ATTEMPTS
+from db import db
+
+# ==============================================================
+# Coda di lavoro su MongoDB con lease
+# ==============================================================
+# I task (batch di username da arricchire o shard di ricerca da
+# esplorare) vivono nella collection work_queue. Un worker prende un
+# task con find_one_and_update atomico e ne ottiene il lease fino a
+# lease_until, rinnovato dall'heartbeat finché lavora. Se il worker
+# muore il lease scade e il task torna disponibile per gli altri; dopo
+# WORK_MAX_ATTEMPTS tentativi (falliti o con lease scaduto) il task resta
+# "failed", così un task che fa cadere il worker non viene ripreso all'infinito.
+
+tasks = db["work_queue"]
+
+_indexes_ready = False
+_indexes_lock = threading.Lock()
+
+
+def _ensure_indexes():
+    global _indexes_ready
+    with _indexes_lock:
+        if not _indexes_ready:
+            tasks.create_index([("status", ASCENDING), ("kind", ASCENDING), ("created_at", ASCENDING)])
+            tasks.create_index([("status", ASCENDING), ("lease_until", ASCENDING)])
+            _indexes_ready = True
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _task(kind, payload):
+    now = _now()
+    return {"kind": kind, "payload": payload, "status": "pending", "owner": None,
+            "lease_until": None, "attempts": 0, "error": None, "created_at": now, "updated_at": now}
+
+
+# ==============================
+# Inserimento
+# ==============================
+def enqueue_users(usernames, batch_size=None):
+    """Divide gli username in task da batch_size; restituisce il numero di task creati."""
+    _ensure_indexes()
+    batch_size = batch_size or WORK_BATCH_SIZE
+    usernames = list(dict.fromkeys(usernames))
+    docs = [_task("users", {"usernames": usernames[i:i + batch_size]})
+            for i in range(0, len(usernames), batch_size)]
+    if docs:
+        tasks.insert_many(docs)
+    return len(docs)
+
+
+def enqueue_search(location=None, keywords_bio=None, locations=None):
+    """Un task di ricerca: il worker che lo prende accoda i batch di username trovati."""
+    _ensure_indexes()
+    tasks.insert_one(_task("search", {
+        "location": location, "keywords_bio": keywords_bio or [], "locations": locations or [],
+    }))
+
+
+# ==============================
+# Lease
+# ==============================
+def claim(owner, kinds=None, lease_seconds=None):
+    """Prende il task più vecchio libero (o con lease scaduto). None se la coda è vuota."""
+    _ensure_indexes()
+    now = _now()
+    # Lease scaduti senza tentativi rimasti: il task non torna in coda
+    tasks.update_many(
+        {"status": "leased", "lease_until": {"$lt": now}, "attempts": {"$gte": WORK_MAX_ATTEMPTS}},
+        {"$set": {"status": "failed", "owner": None, "lease_until": None, "updated_at": now,
+                  "error": f"lease scaduto dopo {WORK_MAX_ATTEMPTS} tentativi"}},
+    )
+    query = {"$or": [
+        {"status": "pending"},
+        {"status": "leased", "lease_until": {"$lt": now}, "attempts": {"$lt": WORK_MAX_ATTEMPTS}},
+    ]}
+    if kinds:
+        query["kind"] = {"$in": list(kinds)}
+    return tasks.find_one_and_update(
+        query,
+        {"$set": {"status": "leased", "owner": owner, "updated_at": now,
+                  "lease_until": now + timedelta(seconds=lease_seconds or WORK_LEASE_SECONDS)},
+         "$inc": {"attempts": 1}},
+        sort=[("created_at", ASCENDING)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def renew(task, lease_seconds=None):
+    """Rinnova il lease. False se il task non è più di questo worker (lease perso)."""
+    now = _now()
+    result = tasks.update_one(
+        {"_id": task["_id"], "owner": task["owner"], "status": "leased"},
+        {"$set": {"lease_until": now + timedelta(seconds=lease_seconds or WORK_LEASE_SECONDS),
+                  "updated_at": now}},
+    )
+    return result.matched_count > 0
+
+
+def complete(task, result=None):
+    tasks.update_one(
+        {"_id": task["_id"], "owner": task["owner"]},
+        {"$set": {"status": "done", "result": result, "lease_until": None, "updated_at": _now()}},
+    )
+
+
+def fail(task, error):
+    """Rimette il task in coda, oppure lo segna failed dopo WORK_MAX_ATTEMPTS tentativi."""
+    status = "failed" if task.get("attempts", 1) >= WORK_MAX_ATTEMPTS else "pending"
+    tasks.update_one(
+        {"_id": task["_id"], "owner": task["owner"]},
+        {"$set": {"status": status, "owner": None, "lease_until": None,
+                  "error": str(error), "updated_at": _now()}},
+    )
+    return status
+
+
+def queue_status():
+    """Numero di task per tipo e stato, più i lease attivi per worker."""
+    counts = {}
+    for d in tasks.aggregate([{"$group": {"_id": {"kind": "$kind", "status": "$status"}, "count": {"$sum": 1}}}]):
+        counts.setdefault(d["_id"]["kind"], {})[d["_id"]["status"]] = d["count"]
+    workers = {
+        d["_id"]: d["count"]
+        for d in tasks.aggregate([
+            {"$match": {"status": "leased", "lease_until": {"$gte": _now()}}},
+            {"$group": {"_id": "$owner", "count": {"$sum": 1}}},
+        ])
+    }
+    return {"tasks": counts, "active_leases": workers}
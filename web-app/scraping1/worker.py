@@ -0,0 +1,243 @@
+"""
+Worker di scraping indipendente dall'app Flask.
+
+Prende i task dalla coda MongoDB (scraping1.work_queue) e li esegue:
+se ne possono avviare quanti se ne vuole, su più core e più macchine,
+tutti contro lo stesso database. Da eseguire dalla cartella web-app:
+
+    python -m scraping1.worker --processes 4 --threads 2
+    python -m scraping1.worker enqueue-search --city Catania
+    python -m scraping1.worker enqueue-users utenti.txt
+    python -m scraping1.worker status
+    python -m scraping1.worker refresh --limit 1000
+    python -m scraping1.worker rescore
+"""
+import os
+import sys
+import argparse
+import threading
+import multiprocessing
+from loguru import logger
+from config import (
+    WORK_HEARTBEAT_EVERY, WORKER_POLL_INTERVAL, MY_CITY, NEARBY_CITIES, KEYWORDS_BIO, ITALIAN_LOCATIONS,
+    ENRICH_BACKEND, GRAPHQL_BATCH_SIZE
+)
+from db import ensure_indexes, explain_report
+from . import work_queue
+from .cursors import default_worker_id
+from .github_api import iter_candidate_users
+from .refresh import refresh_stale_users
+from .rescore import rescore_all
+from .run_memo import scrape_run
+from .scoring import build_user_documents, BoundedScorer, scorers
+from .seen import seen_users
+from .storage import save_user
+
+
+class LeaseLost(Exception):
+    pass
+
+
+class Lease:
+    """Heartbeat del lease di un task mentre il worker ci lavora."""
+
+    def __init__(self, task):
+        self.task = task
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(WORK_HEARTBEAT_EVERY):
+            if not work_queue.renew(self.task):
+                logger.warning(f"[WORKER] Lease perso sul task {self.task['_id']}")
+                self.lost = True
+                return
+
+    def check(self):
+        if self.lost:
+            raise LeaseLost(str(self.task["_id"]))
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+
+
+# ==============================
+# Esecuzione dei task
+# ==============================
+def run_users_task(task, lease):
+    usernames = [u for u in task["payload"]["usernames"] if u not in seen_users]
+    scorer = BoundedScorer(f"worker-{task['_id']}")
+    saved = 0
+    # Lease controllato prima di ogni richiesta: un utente per volta (REST) o una query GraphQL
+    step = GRAPHQL_BATCH_SIZE if ENRICH_BACKEND == "graphql" else 1
+    failed = []
+    try:
+        for i in range(0, len(usernames), step):
+            lease.check()
+            chunk = usernames[i:i + step]
+            docs = build_user_documents(chunk, scorer=scorer)
+            failed += [u for u in chunk if u not in docs]
+            for user_doc in docs.values():
+                if user_doc:
+                    save_user(user_doc)
+                    saved += 1
+    finally:
+        scorers.pop(scorer.name, None)
+    if failed:
+        # Il task torna in coda (work_queue.fail): i salvati sono già in seen_users e non vengono rifatti
+        raise RuntimeError(f"Arricchimento fallito per {len(failed)} utenti: {failed[:10]}")
+    return {"saved": saved, "skipped": len(task["payload"]["usernames"]) - saved, "scoring": scorer.stats()}
+
+
+def run_search_task(task, lease):
+    payload = task["payload"]
+    found, batch, queued = 0, [], 0
+    for username in iter_candidate_users(
+        location=payload.get("location"),
+        keywords_bio=payload.get("keywords_bio"),
+        locations=payload.get("locations"),
+    ):
+        lease.check()
+        batch.append(username)
+        found += 1
+        if len(batch) >= work_queue.WORK_BATCH_SIZE:
+            queued += work_queue.enqueue_users(batch)
+            batch = []
+    if batch:
+        queued += work_queue.enqueue_users(batch)
+    return {"found": found, "tasks": queued}
+
+
+HANDLERS = {"users": run_users_task, "search": run_search_task}
+
+
+def run_once(owner, kinds=None):
+    """Esegue un task se disponibile. False se la coda è vuota."""
+    task = work_queue.claim(owner, kinds)
+    if not task:
+        return False
+    logger.info(f"[WORKER] {owner} prende il task {task['_id']} ({task['kind']}, tentativo {task['attempts']})")
+    try:
+        with Lease(task) as lease, scrape_run(f"worker-{task['kind']}"):
+            result = HANDLERS[task["kind"]](task, lease)
+        work_queue.complete(task, result)
+        logger.info(f"[WORKER] Task {task['_id']} completato: {result}")
+    except LeaseLost:
+        # Il task è già stato ripreso da un altro worker: non va toccato
+        pass
+    except Exception as e:
+        status = work_queue.fail(task, e)
+        logger.error(f"[WORKER] Task {task['_id']} fallito ({status}): {e}", exc_info=True)
+    return True
+
+
+def worker_loop(owner, kinds=None, once=False, stop=None):
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        if not run_once(owner, kinds):
+            if once:
+                return
+            stop.wait(WORKER_POLL_INTERVAL)
+
+
+def run_process(threads, kinds=None, once=False):
+    """Un processo con `threads` loop di lavoro, ciascuno con un proprio id worker."""
+    base = default_worker_id()
+    loops = [threading.Thread(target=worker_loop, args=(f"{base}:{n}", kinds, once), daemon=True)
+             for n in range(threads)]
+    for t in loops:
+        t.start()
+    try:
+        for t in loops:
+            t.join()
+    except KeyboardInterrupt:
+        logger.info("[WORKER] Interrotto: i lease in corso scadranno e i task torneranno in coda")
+
+
+# ==============================
+# CLI
+# ==============================
+def _enqueue_search(args):
+    cities = args.city or [MY_CITY] + [c for c in NEARBY_CITIES if c.strip()]
+    keywords = [k.strip() for k in KEYWORDS_BIO if k.strip()]
+    locations = [l.strip() for l in ITALIAN_LOCATIONS if l.strip()]
+    for city in cities or [None]:
+        work_queue.enqueue_search(location=city, keywords_bio=keywords, locations=locations)
+    print(f"Accodati {len(cities or [None])} task di ricerca")
+
+
+def _enqueue_users(args):
+    with open(args.file, encoding="utf-8") if args.file != "-" else sys.stdin as f:
+        usernames = [line.strip() for line in f if line.strip()]
+    print(f"Accodati {work_queue.enqueue_users(usernames)} task per {len(usernames)} utenti")
+
+
+def _explain():
+    rows = explain_report()
+    for row in rows:
+        flag = ("atteso" if row["expected"] else "COLLSCAN") if row["collscan"] else "ok"
+        print(f"[{flag:8}] {row['query']:36} {row['plan']} "
+              f"(esaminati {row['docs_examined']}, restituiti {row['returned']})")
+    if any(row["collscan"] and not row["expected"] for row in rows):
+        sys.exit(1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Worker di scraping su coda MongoDB")
+    parser.add_argument("--processes", type=int, default=1, help="processi worker (default 1)")
+    parser.add_argument("--threads", type=int, default=1, help="loop di lavoro per processo (default 1)")
+    parser.add_argument("--kind", action="append", choices=sorted(HANDLERS), help="solo task di questo tipo")
+    parser.add_argument("--once", action="store_true", help="termina quando la coda è vuota")
+    sub = parser.add_subparsers(dest="command")
+    search = sub.add_parser("enqueue-search", help="accoda le ricerche per città (default: da config)")
+    search.add_argument("--city", action="append")
+    users = sub.add_parser("enqueue-users", help="accoda gli username di un file (uno per riga, - = stdin)")
+    users.add_argument("file")
+    sub.add_parser("status", help="stato della coda")
+    refresh = sub.add_parser("refresh", help="aggiorna gli utenti salvati scaduti (refresh incrementale)")
+    refresh.add_argument("--limit", type=int, default=None, help="utenti massimi (default REFRESH_LIMIT)")
+    sub.add_parser("rescore", help="ricalcola lo score di tutti gli utenti salvati (senza GitHub)")
+    sub.add_parser("indexes", help="crea gli indici mancanti della collection utenti")
+    sub.add_parser("explain", help="piani di esecuzione delle query frequenti (esce con 1 se ci sono COLLSCAN non attesi)")
+    args = parser.parse_args(argv)
+
+    if args.command == "enqueue-search":
+        return _enqueue_search(args)
+    if args.command == "enqueue-users":
+        return _enqueue_users(args)
+    if args.command == "status":
+        print(work_queue.queue_status())
+        return
+    if args.command == "refresh":
+        print(refresh_stale_users(limit=args.limit))
+        return
+    if args.command == "rescore":
+        print(rescore_all())
+        return
+    if args.command == "indexes":
+        for name, status in ensure_indexes().items():
+            print(f"{name:40} {status}")
+        return
+    if args.command == "explain":
+        return _explain()
+
+    if args.processes <= 1:
+        return run_process(args.threads, args.kind, args.once)
+    # spawn: ogni processo apre la propria connessione MongoDB (i client non sopravvivono al fork)
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=run_process, args=(args.threads, args.kind, args.once))
+             for _ in range(args.processes)]
+    for p in procs:
+        p.start()
+    logger.info(f"[WORKER] Avviati {len(procs)} processi (pid {os.getpid()})")
+    for p in procs:
+        p.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,7 @@ from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import classification_report, confusion_matrix
 from imblearn.over_sampling import SMOTE
 from imblearn.pipeline import Pipeline as ImbPipeline
+from scraping1.locations import location_key
 
 # --- 1. Carica dataset ---
 dataset_path = "Dataset_init.csv"
@@ -31,6 +32,8 @@ textual = "bio"
 
 df[numeric] = df[numeric].fillna(0)
 df[categorical] = df[categorical].fillna("")
+# Stessa località normalizzata usata in predizione (scraping1.locations)
+df["location"] = df["location"].map(location_key)
 df[textual] = df[textual].fillna("")
 
 y = df["annotation"].astype(int)
@@ -1,11 +1,7 @@
 import os
 import re
-import requests
-
-HEADERS = {
-    "Accept": "application/vnd.github+json",
-    "User-Agent": "Scraping-Project"
-}
+from scraping1.github_api import get_user_info, get_user_repos
+from scraping1.locations import location_key
 
 def parse_list(env_var):
     """Converte una stringa separata da virgole in lista."""
@@ -28,18 +24,15 @@ def build_user_document(username):
     """
     Ritorna un dict con info di un utente GitHub.
     Usa sia /users/{username} che /users/{username}/repos
+    (tramite github_api, quindi memoizzati se dentro uno scrape_run)
     """
-    base_url = f"https://api.github.com/users/{username}"
-
     # info profilo
-    r = requests.get(base_url, headers=HEADERS)
-    if r.status_code != 200:
+    profile = get_user_info(username)
+    if not profile:
         return None
-    profile = r.json()
 
     # info repos
-    r = requests.get(base_url + "/repos?per_page=100", headers=HEADERS)
-    repos = r.json() if r.status_code == 200 else []
+    repos = get_user_repos(username, max_repos=100)
 
     languages = []
     for repo in repos:
@@ -80,10 +73,12 @@ def extract_features(user):
         except Exception:
             feat[col] = 0
 
-    # categoriche
+    # categoriche (località normalizzata: "Rome, Italy" e "Roma" sono la stessa categoria)
     for col in CAT_FEATURES:
         val = user.get(col, "unknown")
-        if isinstance(val, (list, tuple, set)):
+        if col == "location":
+            feat[col] = location_key(val)
+        elif isinstance(val, (list, tuple, set)):
             feat[col] = ", ".join(val) if val else "unknown"
         else:
             feat[col] = str(val) if val else "unknown"